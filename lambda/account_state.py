@@ -0,0 +1,74 @@
+"""
+Per-account generation state for incremental runs
+One small JSON object per account in S3 records where its synthetic history
+ends (last balance, last date and last sequence number), so a scheduled run
+only generates the days since then
+"""
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import log
+
+STATE_PREFIX = 'state/accounts'
+
+# Concurrent GET/PUT requests when loading or saving a batch of states; botocore's default
+# max_pool_connections, so threads never queue on a default client's pool (the Lambda passes
+# pipeline.s3_state_workers for its own client)
+DEFAULT_STATE_WORKERS = 10
+
+# _load_one result for a state object that cannot be read without a restore
+ARCHIVED = object()
+
+
+class S3AccountStateStore:
+    """Load and save per-account state objects under `prefix` in one bucket
+
+    Each account has its own key, so shards of one run never write the same object.
+    """
+
+    def __init__(self, s3_client, bucket, prefix=STATE_PREFIX, max_workers=DEFAULT_STATE_WORKERS):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.max_workers = max_workers
+
+    def key(self, account):
+        return f"{self.prefix}/{account['bank_id']}/{account['account_id']}.json"
+
+    def load(self, accounts):
+        """Return the state of each account in order (None for accounts never generated)
+
+        An archived state object (InvalidObjectState, e.g. moved to GLACIER) is
+        treated as missing: the account gets a full backfill, whose saved state
+        replaces the archived object.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            states = list(executor.map(self._load_one, accounts))
+        archived = sum(state is ARCHIVED for state in states)
+        if archived:
+            log(f"[WARNING] {archived} account states are archived and cannot be read; backfilling those accounts")
+        return [None if state is ARCHIVED else state for state in states]
+
+    def save(self, states):
+        """Write the state of each account (dicts with account_id and bank_id)"""
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list(executor.map(self._save_one, states))
+        return len(states)
+
+    def _load_one(self, account):
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=self.key(account))
+            return json.loads(response['Body'].read())
+        except self.s3_client.exceptions.NoSuchKey:
+            return None
+        except self.s3_client.exceptions.InvalidObjectState:
+            return ARCHIVED
+
+    def _save_one(self, state):
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=self.key(state),
+            Body=json.dumps(state).encode('utf-8'),
+            ContentType='application/json'
+        )
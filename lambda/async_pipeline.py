@@ -0,0 +1,347 @@
+"""
+Overlapped pipeline stages on asyncio
+Account discovery, transaction generation (or fetching), encoding and part
+uploads run concurrently, connected by bounded queues, so network I/O overlaps
+CPU work and a run takes about as long as its slowest stage instead of the sum
+of all stages
+
+The stage code itself stays blocking (requests, NumPy, boto3) and runs in
+worker threads; the queues only decide how far one stage may run ahead of the
+next, which also bounds memory. Used by lambda_handler.py
+"""
+
+import asyncio
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import chain
+
+from metrics import log
+from pipeline import RunResult, discover_accounts, transaction_batches
+from synthetic_generator import iter_account_chunks
+
+# Items (account chunks, batches, parts) buffered between two stages
+DEFAULT_QUEUE_SIZE = 4
+# Parts uploaded at once
+DEFAULT_UPLOAD_WORKERS = 4
+# Discovery, generation, encoding and the banks (then accounts) write each advance in their own thread
+STAGE_THREADS = 4
+
+# Last item of every queue
+DONE = object()
+
+
+class StageStats:
+    """Seconds one stage spent working, waiting for input and waiting for room downstream"""
+
+    __slots__ = ('items', 'seconds', 'waiting_input', 'waiting_output')
+
+    def __init__(self):
+        self.items = 0
+        self.seconds = 0.0
+        self.waiting_input = 0.0
+        self.waiting_output = 0.0
+
+    @property
+    def busy(self):
+        return max(self.seconds - self.waiting_input - self.waiting_output, 0.0)
+
+    def to_dict(self):
+        return {
+            'items': self.items,
+            'busy_seconds': round(self.busy, 3),
+            'waiting_input_seconds': round(self.waiting_input, 3),
+            'waiting_output_seconds': round(self.waiting_output, 3)
+        }
+
+
+class StageRunner:
+    """Run blocking stage code in its own threads, connected by bounded asyncio queues
+
+    Use as an async context manager inside a running event loop. Each stage's
+    timings are collected in `stats` under its name.
+    """
+
+    def __init__(self, queue_size=DEFAULT_QUEUE_SIZE, threads=STAGE_THREADS):
+        self.queue_size = queue_size
+        self.stats = {}
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='stage')
+        self._loop = None
+
+    async def __aenter__(self):
+        self._loop = asyncio.get_running_loop()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, tb):
+        # Threads still blocked on a queue are released when the event loop cancels its tasks
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        return False
+
+    def stage(self, name):
+        return self.stats.setdefault(name, StageStats())
+
+    def queue(self):
+        return asyncio.Queue(self.queue_size)
+
+    async def call(self, function, *args):
+        """Run function(*args) in a stage thread"""
+        return await self._loop.run_in_executor(self._executor, function, *args)
+
+    async def timed_call(self, name, function, *args):
+        """Run function(*args) in a stage thread, counting its time as stage `name`"""
+        stats = self.stage(name)
+        start = time.perf_counter()
+        try:
+            return await self.call(function, *args)
+        finally:
+            stats.seconds += time.perf_counter() - start
+
+    async def pump(self, name, iterator, queue):
+        """Advance a blocking iterator in a stage thread, putting each item on `queue` (then DONE)"""
+        stats = self.stage(name)
+        while True:
+            start = time.perf_counter()
+            item = await self.call(next, iterator, DONE)
+            stats.seconds += time.perf_counter() - start
+            if item is DONE:
+                break
+            stats.items += 1
+
+            start = time.perf_counter()
+            await queue.put(item)
+            stats.waiting_output += time.perf_counter() - start
+            stats.seconds += time.perf_counter() - start
+        await queue.put(DONE)
+
+    def drain(self, name, queue, count=False):
+        """Blocking iterator over `queue` for stage code running in a thread; waits count against stage `name`
+
+        With `count`, items taken are counted as the stage's items (for stages that do not pump).
+        """
+        stats = self.stage(name)
+        while True:
+            start = time.perf_counter()
+            item = asyncio.run_coroutine_threadsafe(queue.get(), self._loop).result()
+            stats.waiting_input += time.perf_counter() - start
+            if item is DONE:
+                return
+            stats.items += count
+            yield item
+
+    def summary(self):
+        return {name: stats.to_dict() for name, stats in self.stats.items()}
+
+
+class PartUploader:
+    """Upload stage: runs uploads submitted from stage threads on `workers` concurrent tasks
+
+    submit() returns a concurrent.futures.Future and blocks the calling thread
+    while `queue_size` uploads are already waiting, so encoding cannot run more
+    than that far ahead of the network. After an upload fails, submit() re-raises
+    that failure, so the run stops instead of encoding data that cannot be
+    written. Use as an async context manager; on error, waiting and running
+    uploads are cancelled so no writer waits forever.
+    """
+
+    def __init__(self, workers=DEFAULT_UPLOAD_WORKERS, queue_size=DEFAULT_QUEUE_SIZE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.stats = StageStats()
+        # Seconds submitting threads were held back by a full queue
+        self.held_back = 0.0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='upload')
+        self._loop = None
+        self._queue = None
+        self._tasks = []
+        self._closed = False
+        self._error = None
+
+    async def __aenter__(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(self.queue_size)
+        self._tasks = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, tb):
+        try:
+            if exc_type is None:
+                for _ in self._tasks:
+                    await self._queue.put(DONE)
+                await asyncio.gather(*self._tasks)
+            else:
+                self._closed = True
+                for task in self._tasks:
+                    task.cancel()
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+                while not self._queue.empty():
+                    item = self._queue.get_nowait()
+                    if item is not DONE:
+                        item[0].cancel()
+        finally:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        return False
+
+    def submit(self, function, *args):
+        """Queue function(*args) from a stage thread; returns a Future of its result"""
+        if self._error is not None:
+            raise self._error
+        future = Future()
+        start = time.perf_counter()
+        asyncio.run_coroutine_threadsafe(self._queue.put((future, function, args)), self._loop).result()
+        self.held_back += time.perf_counter() - start
+        if self._closed:
+            future.cancel()
+        return future
+
+    async def _work(self):
+        while True:
+            item = await self._queue.get()
+            if item is DONE:
+                return
+            future, function, args = item
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            start = time.perf_counter()
+            try:
+                result = await self._loop.run_in_executor(self._executor, function, *args)
+            except BaseException as e:
+                # Includes cancellation, so a writer waiting on this part is released
+                future.set_exception(e)
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                self._error = self._error or e
+            else:
+                future.set_result(result)
+            finally:
+                self.stats.items += 1
+                self.stats.seconds += time.perf_counter() - start
+
+
+async def gather_or_cancel(*awaitables):
+    """asyncio.gather, cancelling the other awaitables as soon as one fails"""
+    tasks = [asyncio.ensure_future(awaitable) for awaitable in awaitables]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
+async def stream_transactions(stages, source, sink, settings, account_queue, seed, transaction_source='synthetic',
+                              state_store=None, from_date=None, to_date=None):
+    """Generate (or fetch) and encode the transactions of the account chunks arriving on `account_queue`
+
+    Returns (sink entries, rows written, account states).
+    """
+    name = 'fetch_transactions' if transaction_source == 'real' else 'generate'
+    batch_queue = stages.queue()
+    accounts = chain.from_iterable(stages.drain(name, account_queue))
+
+    account_states = []
+    batches = transaction_batches(
+        source, accounts, settings, transaction_source, seed, account_states, state_store, from_date, to_date
+    )
+    _, (objects, count) = await gather_or_cancel(
+        stages.pump(name, batches, batch_queue),
+        stages.timed_call('encode', sink.write_batches, 'transactions', stages.drain('encode', batch_queue, count=True))
+    )
+    return objects, count, account_states
+
+
+def stage_summary(stages, uploader):
+    """Timings of every stage; encoding time spent waiting for the uploader counts as waiting for output"""
+    stages.stage('encode').waiting_output += uploader.held_back
+    return {**stages.summary(), 'upload': uploader.stats.to_dict()}
+
+
+def print_stage_summary(stages):
+    log("Stage timings (busy / waiting for input / waiting for output, seconds):")
+    for name, stats in stages.items():
+        log(f"  {name}: {stats['busy_seconds']} / {stats['waiting_input_seconds']} / "
+            f"{stats['waiting_output_seconds']} ({stats['items']} items)")
+
+
+async def _run_stages(source, make_sink, settings, seed, transaction_source, state_store, from_date, to_date):
+    async with PartUploader(settings.upload_workers, settings.stage_queue_size) as uploader, \
+            StageRunner(settings.stage_queue_size) as stages:
+        sink = make_sink(uploader)
+
+        await stages.timed_call('discover', source.authenticate)
+        banks_data = await stages.timed_call('discover', source.fetch_banks)
+
+        accounts_data = []
+        account_queue = stages.queue()
+
+        async def discover():
+            first_account, account_stream = await stages.timed_call('discover', discover_accounts, source, banks_data)
+
+            def discovered_accounts():
+                for account in chain([first_account], account_stream):
+                    accounts_data.append(account)
+                    yield account
+
+            await stages.pump('discover', iter_account_chunks(discovered_accounts()), account_queue)
+            log(f"Fetched {len(accounts_data)} accounts")
+            return await stages.call(sink.write_records, 'accounts', accounts_data)
+
+        # Each dataset uploads as soon as it is known: banks now, accounts once discovery ends,
+        # transactions while they stream
+        banks_object, accounts_object, (transaction_objects, transaction_count, account_states) = \
+            await gather_or_cancel(
+                stages.call(sink.write_records, 'banks', banks_data),
+                discover(),
+                stream_transactions(
+                    stages, source, sink, settings, account_queue, seed, transaction_source, state_store,
+                    from_date, to_date
+                )
+            )
+
+    stats = stage_summary(stages, uploader)
+    print_stage_summary(stats)
+    return RunResult(
+        banks_data, accounts_data, banks_object, accounts_object, transaction_objects, transaction_count,
+        account_states, stats
+    )
+
+
+def run_stages_overlapped(source, make_sink, settings, seed, transaction_source='synthetic', state_store=None,
+                          from_date=None, to_date=None):
+    """pipeline.run_stages with discovery, generation, encoding and uploads overlapped
+
+    make_sink(uploader) builds the sink, passing `uploader` on to S3Sink so
+    parts upload in the background. Returns a RunResult whose `stages` holds
+    each stage's timings.
+    """
+    return asyncio.run(_run_stages(
+        source, make_sink, settings, seed, transaction_source, state_store, from_date, to_date
+    ))
+
+
+async def _stream_accounts(source, make_sink, settings, accounts, seed, transaction_source, state_store, from_date,
+                           to_date):
+    async with PartUploader(settings.upload_workers, settings.stage_queue_size) as uploader, \
+            StageRunner(settings.stage_queue_size) as stages:
+        account_queue = stages.queue()
+        _, (objects, count, account_states) = await gather_or_cancel(
+            stages.pump('accounts', iter_account_chunks(accounts), account_queue),
+            stream_transactions(
+                stages, source, make_sink(uploader), settings, account_queue, seed, transaction_source, state_store,
+                from_date, to_date
+            )
+        )
+
+    stats = stage_summary(stages, uploader)
+    print_stage_summary(stats)
+    return objects, count, account_states, stats
+
+
+def stream_transactions_overlapped(source, make_sink, settings, accounts, seed, transaction_source='synthetic',
+                                   state_store=None, from_date=None, to_date=None):
+    """Generate (or fetch), encode and upload the transactions of known `accounts` with the stages overlapped
+
+    Used by sharded workers. Returns (sink entries, rows written, account states, stage timings).
+    """
+    return asyncio.run(_stream_accounts(
+        source, make_sink, settings, accounts, seed, transaction_source, state_store, from_date, to_date
+    ))
@@ -0,0 +1,349 @@
+"""
+Benchmark the ingestion pipeline against local OBP and S3 stand-ins
+Runs lambda_handler (or hybrid_data_pipeline.main) end to end at several
+transaction counts and reports rows/sec, peak RSS and wall time per stage
+
+Each size runs in its own process, so peak RSS is measured per size.
+
+Usage:
+    python benchmark_pipeline.py                                # 1k, 100k and 10M transactions
+    python benchmark_pipeline.py --sizes 1k,100k --output-format parquet
+    python benchmark_pipeline.py --sizes 1M --compression zstd
+    python benchmark_pipeline.py --sizes 1k,100k --source real     # fetch transactions from the stand-in
+    python benchmark_pipeline.py --latency-ms 50 --s3-latency-ms 20 --s3-mbps 80
+    python benchmark_pipeline.py --sizes 1M --s3-mbps 200 --sequential  # stages one after another, to compare
+    python benchmark_pipeline.py --sizes 100k --error-rate 0.05 --throttle-rate 0.05 --drop-rate 0.02
+    python benchmark_pipeline.py --target hybrid --sizes 1k,100k
+    python benchmark_pipeline.py --json benchmark_results.json  # keep results to compare runs
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from functools import wraps
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_SIZES = '1k,100k,10M'
+STAGES = ['authenticate', 'fetch_banks', 'fetch_accounts', 'generate', 'encode', 'upload']
+RESULT_PREFIX = 'BENCHMARK_RESULT '
+
+# S3 calls that write data, timed as the upload stage
+S3_UPLOAD_CALLS = ['put_object', 'create_multipart_upload', 'upload_part', 'complete_multipart_upload']
+
+# Allocator settings of the deployed function (terraform/main.tf), applied to each size's process
+# unless already set
+LAMBDA_RUNTIME_ENVIRONMENT = {'MALLOC_MMAP_THRESHOLD_': '131072'}
+
+# Transactions per account used by hybrid_data_pipeline.main
+HYBRID_TRANSACTIONS_PER_ACCOUNT = 100
+
+
+def parse_size(text):
+    """Parse a row count such as 1000, 100k or 10M"""
+    multipliers = {'k': 1_000, 'm': 1_000_000}
+    text = text.strip().lower()
+    if text[-1] in multipliers:
+        return int(float(text[:-1]) * multipliers[text[-1]])
+    return int(text)
+
+
+def format_size(rows):
+    for suffix, divisor in [('M', 1_000_000), ('k', 1_000)]:
+        if rows >= divisor and rows % divisor == 0:
+            return f"{rows // divisor}{suffix}"
+    return str(rows)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB (None where unsupported)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class StageTimer:
+    """Accumulate wall time per stage by wrapping functions and iterators"""
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+
+    def timed(self, name, function):
+        """Wrap `function` so each call's duration is added to `name`"""
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.seconds[name] += time.perf_counter() - start
+        return wrapper
+
+    def timed_iter(self, name, iterable):
+        """Yield from `iterable`, adding the time spent producing each item to `name`"""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.seconds[name] += time.perf_counter() - start
+            yield item
+
+    def timed_generator(self, name, function):
+        """Wrap a function returning an iterator so iterating it is timed under `name`"""
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            return self.timed_iter(name, function(*args, **kwargs))
+        return wrapper
+
+
+def instrument_stages(timer):
+    """Time the shared pipeline stages (pipeline.py) that both targets run"""
+    import pipeline
+
+    source = pipeline.OBPSource
+    source.authenticate = timer.timed('authenticate', source.authenticate)
+    source.fetch_banks = timer.timed('fetch_banks', source.fetch_banks)
+    source.iter_accounts = timer.timed_generator('fetch_accounts', source.iter_accounts)
+    # Account discovery runs lazily inside generation, so callers subtract it from 'generate'
+    pipeline.generate_transactions = timer.timed_generator('generate', pipeline.generate_transactions)
+    # With --source real, fetching transactions is reported as the generate stage
+    source.iter_transactions = timer.timed_generator('generate', source.iter_transactions)
+
+
+def configure_environment(server, accounts, sequential=False):
+    """Point the pipeline's environment at the local stand-ins"""
+    os.environ.update({
+        'OVERLAP_STAGES': 'false' if sequential else 'true',
+        'OBP_BASE_URL': server.base_url,
+        'OBP_API_VERSION': 'v5.1.0',
+        'OBP_DIRECTLOGIN_ENDPOINT': server.directlogin_endpoint,
+        'OBP_USERNAME': 'benchmark',
+        'OBP_PASSWORD': 'benchmark',
+        'OBP_CONSUMER_KEY': 'benchmark',
+        'OBP_MAX_ACCOUNTS': str(accounts),
+        'OBP_MAX_BANKS': '0',
+        # Keep the token in memory only, so no token cached by an earlier run is reused
+        'OBP_TOKEN_CACHE': '',
+        'S3_BUCKET_NAME': 'benchmark-bucket',
+        'AWS_DEFAULT_REGION': os.environ.get('AWS_DEFAULT_REGION', 'us-east-1')
+    })
+
+
+def run_lambda(rows, args, timer):
+    """Run lambda_handler in single mode against the stand-ins; returns (transactions, bytes written)"""
+    import boto3
+    from local_s3 import LocalS3Client
+
+    s3 = LocalS3Client(
+        discard=True,
+        latency=args.s3_latency_ms / 1000,
+        bandwidth=args.s3_mbps * 1_000_000 / 8 if args.s3_mbps else None,
+        verbose=False
+    )
+    # Wall time of every call, not only the stand-in's simulated latency and bandwidth
+    for name in S3_UPLOAD_CALLS:
+        setattr(s3, name, timer.timed('s3_calls', getattr(s3, name)))
+    original_boto3_client = boto3.client
+    boto3.client = lambda service_name, **kwargs: s3 if service_name == 's3' else original_boto3_client(service_name, **kwargs)
+
+    import lambda_handler as handler_module
+    import pipeline
+
+    instrument_stages(timer)
+    write_batches = pipeline.S3Sink.write_batches
+
+    def timed_stream(*stream_args, **stream_kwargs):
+        start, s3_before = time.perf_counter(), timer.seconds['s3_calls']
+        try:
+            return write_batches(*stream_args, **stream_kwargs)
+        finally:
+            timer.seconds['stream'] += time.perf_counter() - start
+            timer.seconds['stream_upload'] += timer.seconds['s3_calls'] - s3_before
+
+    pipeline.S3Sink.write_batches = timed_stream
+
+    event = {
+        'output_format': args.output_format,
+        'compression': args.compression,
+        'source': args.source,
+        'transactions_per_account': args.transactions_per_account,
+        'seed': args.seed
+    }
+    result = handler_module.lambda_handler(event, None)
+    body = json.loads(result['body'])
+    if result['statusCode'] != 200:
+        raise Exception(f"lambda_handler failed: {body.get('error')}")
+
+    seconds = timer.seconds
+    stages = body['metrics'].get('pipeline_stages')
+    if stages:
+        # Overlapped stages wait on each other, so take the busy time each reports (these add up to more than wall)
+        seconds['generate'] = stages['fetch_transactions' if args.source == 'real' else 'generate']['busy_seconds']
+        seconds['encode'] = stages['encode']['busy_seconds']
+        # Summed over the upload workers, like the timed calls, but without time queued behind the uploader
+        seconds['upload'] = stages['upload']['busy_seconds']
+    else:
+        seconds['generate'] -= seconds['fetch_accounts']
+        seconds['encode'] = (seconds['stream'] - seconds['generate'] - seconds['fetch_accounts']
+                             - seconds['stream_upload'])
+        seconds['upload'] = seconds['s3_calls']
+    return body['records']['transactions'], s3.bytes_written
+
+
+def run_hybrid(rows, args, timer):
+    """Run hybrid_data_pipeline.main against the OBP stand-in (CSV files go to the working directory)"""
+    import hybrid_data_pipeline as hybrid
+
+    instrument_stages(timer)
+    hybrid.save_hybrid_datasets = timer.timed('encode', hybrid.save_hybrid_datasets)
+
+    hybrid.main(workers=args.workers, seed=args.seed)
+    if 'encode' not in timer.seconds:
+        raise Exception("hybrid_data_pipeline.main failed (see output above)")
+    timer.seconds['generate'] -= timer.seconds['fetch_accounts']
+
+    files = [name for name in os.listdir('.') if name.startswith('hybrid_transactions_')]
+    with open(files[0]) as f:
+        transactions = sum(1 for _ in f) - 1
+    return transactions, sum(os.path.getsize(name) for name in os.listdir('.') if name.startswith('hybrid_'))
+
+
+def run_one(rows, args):
+    """Benchmark one size in this process and return the result record"""
+    from local_obp_server import LocalOBPServer
+
+    transactions_per_account = (HYBRID_TRANSACTIONS_PER_ACCOUNT if args.target == 'hybrid'
+                                else args.transactions_per_account)
+    accounts = max(rows // transactions_per_account, 1)
+    banks = (accounts + args.accounts_per_bank - 1) // args.accounts_per_bank
+
+    timer = StageTimer()
+    with LocalOBPServer(banks, args.accounts_per_bank, args.latency_ms / 1000,
+                        transactions_per_account=transactions_per_account, error_rate=args.error_rate,
+                        throttle_rate=args.throttle_rate, drop_rate=args.drop_rate, seed=args.seed) as server:
+        configure_environment(server, accounts, args.sequential)
+        start = time.perf_counter()
+        if args.target == 'hybrid':
+            transactions, bytes_written = run_hybrid(rows, args, timer)
+        else:
+            transactions, bytes_written = run_lambda(rows, args, timer)
+        wall = time.perf_counter() - start
+        http_requests = sum(server.requests.values())
+        http_faults = dict(server.faults)
+
+    return {
+        'target': args.target,
+        'rows': rows,
+        'transactions': transactions,
+        'banks': banks,
+        'accounts': accounts,
+        'wall_seconds': round(wall, 3),
+        'rows_per_second': round(transactions / wall) if wall else None,
+        'peak_rss_mb': round(peak_rss_mb(), 1) if resource else None,
+        'bytes_written': bytes_written,
+        'http_requests': http_requests,
+        'http_faults': http_faults,
+        'stages': {stage: round(timer.seconds.get(stage, 0.0), 3) for stage in STAGES}
+    }
+
+
+def run_size(rows, argv, verbose):
+    """Run one size in a fresh Python process (in a scratch directory) and parse its result"""
+    workdir = tempfile.mkdtemp(prefix='obp_benchmark_')
+    try:
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--run-one', str(rows)] + argv,
+            cwd=workdir, capture_output=True, text=True, env={**LAMBDA_RUNTIME_ENVIRONMENT, **os.environ}
+        )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = completed.stdout
+    if verbose:
+        print(output + completed.stderr)
+    for line in output.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    raise Exception(f"Benchmark at {format_size(rows)} rows failed:\n{output[-2000:]}{completed.stderr}")
+
+
+def print_report(results):
+    header = f"{'rows':>6} {'wall s':>8} {'rows/s':>10} {'peak MiB':>9} " + ' '.join(f"{stage:>14}" for stage in STAGES)
+    print("\n" + header)
+    print("-" * len(header))
+    for result in results:
+        peak = f"{result['peak_rss_mb']:.1f}" if result['peak_rss_mb'] is not None else 'n/a'
+        print(f"{format_size(result['rows']):>6} {result['wall_seconds']:>8.2f} {result['rows_per_second']:>10,} {peak:>9} "
+              + ' '.join(f"{result['stages'][stage]:>14.3f}" for stage in STAGES))
+    for result in results:
+        if result.get('http_faults'):
+            faults = ', '.join(f"{count} {fault}" for fault, count in sorted(result['http_faults'].items()))
+            print(f"{format_size(result['rows'])}: {result['http_requests']} OBP requests, injected faults: {faults}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ingestion pipeline against local OBP and S3 stand-ins")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help=f"Transaction counts to run (default: {DEFAULT_SIZES})")
+    parser.add_argument('--target', choices=['lambda', 'hybrid'], default='lambda',
+                        help="lambda_handler (streams to the S3 stand-in) or hybrid_data_pipeline.main (local CSV)")
+    parser.add_argument('--output-format', default='csv', help="Output format for the lambda target (csv or parquet)")
+    parser.add_argument('--compression', choices=['gzip', 'zstd'], default=None,
+                        help="CSV compression for the lambda target (default: none)")
+    parser.add_argument('--source', choices=['synthetic', 'real'], default='synthetic',
+                        help="Generate transactions, or fetch them from the OBP stand-in (lambda target)")
+    parser.add_argument('--transactions-per-account', type=int, default=100,
+                        help="Lambda target only; the hybrid pipeline always generates 100")
+    parser.add_argument('--accounts-per-bank', type=int, default=50)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="Latency added to every OBP request")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of OBP requests answered with 503")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="Fraction of OBP requests answered with 429")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="Fraction of OBP connections dropped")
+    parser.add_argument('--s3-latency-ms', type=float, default=0.0, help="Latency added to every S3 request")
+    parser.add_argument('--s3-mbps', type=float, default=0.0, help="Simulated S3 upload bandwidth in Mbit/s (0 = unlimited)")
+    parser.add_argument('--sequential', action='store_true',
+                        help="Lambda target: run the stages one after another instead of overlapped")
+    parser.add_argument('--workers', type=int, default=1, help="Generation processes for the hybrid target")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', dest='json_path', help="Also write the results to this JSON file")
+    parser.add_argument('--verbose', action='store_true', help="Show the pipeline's own output")
+    parser.add_argument('--run-one', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one is not None:
+        result = run_one(args.run_one, args)
+        print(RESULT_PREFIX + json.dumps(result), flush=True)
+        return
+
+    # Options are passed through to each per-size process
+    argv = sys.argv[1:]
+    results = []
+    for rows in [parse_size(size) for size in args.sizes.split(',')]:
+        print(f"Benchmarking {args.target} at {format_size(rows)} transactions...", flush=True)
+        results.append(run_size(rows, argv, args.verbose))
+
+    print_report(results)
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
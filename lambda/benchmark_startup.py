@@ -0,0 +1,205 @@
+"""
+Cold-start benchmark for lambda_handler
+Starts fresh Python processes and measures interpreter + import time of
+lambda_handler (boto3 and the real S3 client included), the first (cold)
+invocation and a second (warm) invocation against the local OBP stand-in and
+an in-process S3 transport
+
+Usage:
+    python benchmark_startup.py                 # 5 cold starts, 1k transactions each
+    python benchmark_startup.py --repeat 10 --importtime 15
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark_pipeline import RESULT_PREFIX, configure_environment, peak_rss_mb
+
+LAMBDA_DIR = os.path.dirname(os.path.abspath(__file__))
+# import_seconds = boto3_import_seconds + handler_import_seconds; s3_client_seconds is part of the latter
+MEASURES = ['process_seconds', 'import_seconds', 'boto3_import_seconds', 'handler_import_seconds', 's3_client_seconds',
+            'first_invocation_seconds', 'warm_invocation_seconds']
+
+
+class StubBody:
+    """Raw body of a stubbed botocore response"""
+
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+
+def stub_s3_transport(client):
+    """Answer an S3 client's requests in-process, at botocore's HTTP layer
+
+    Everything up to sending (client setup, credentials, serialization, signing)
+    and the parsing of each response still runs for real; only the network is
+    replaced. Objects are discarded.
+    """
+    from urllib.parse import parse_qs, urlsplit
+
+    from botocore.awsrequest import AWSResponse
+
+    def send(request, **kwargs):
+        query = parse_qs(urlsplit(request.url).query, keep_blank_values=True)
+        headers, body, status = {'ETag': '"benchmark"'}, b'', 200
+        if request.method == 'POST' and 'uploads' in query:
+            body = (b'<InitiateMultipartUploadResult><Bucket>benchmark</Bucket><Key>key</Key>'
+                    b'<UploadId>benchmark-upload</UploadId></InitiateMultipartUploadResult>')
+        elif request.method == 'POST':
+            body = (b'<CompleteMultipartUploadResult><Bucket>benchmark</Bucket><Key>key</Key>'
+                    b'<ETag>"benchmark"</ETag></CompleteMultipartUploadResult>')
+        elif request.method == 'DELETE':
+            status = 204
+        elif request.method in ('GET', 'HEAD'):
+            status, body = 404, b'<Error><Code>NoSuchKey</Code><Message>Not found</Message></Error>'
+        return AWSResponse(request.url, status, headers, StubBody(body))
+
+    client.meta.events.register('before-send.s3', send)
+
+
+def run_cold_start(args):
+    """In a fresh process: import lambda_handler and invoke it twice; returns the timings
+
+    Nothing is imported or patched ahead of lambda_handler: the import time covers
+    boto3 and the construction of the handler's real S3 client. boto3.client is
+    only wrapped to time that construction; requests are answered by
+    stub_s3_transport once the handler is loaded.
+    """
+    from local_obp_server import LocalOBPServer
+
+    accounts = max(args.transactions // args.transactions_per_account, 1)
+    with LocalOBPServer(banks=accounts, accounts_per_bank=1) as server:
+        configure_environment(server, accounts)
+        # Signing needs credentials; as on Lambda, they come from the environment
+        os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+        os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+
+        start = time.perf_counter()
+        import boto3
+        boto3_import_seconds = time.perf_counter() - start
+
+        client_seconds = []
+        original_boto3_client = boto3.client
+
+        def timed_client(*client_args, **client_kwargs):
+            client_start = time.perf_counter()
+            try:
+                return original_boto3_client(*client_args, **client_kwargs)
+            finally:
+                client_seconds.append(time.perf_counter() - client_start)
+
+        boto3.client = timed_client
+        handler_start = time.perf_counter()
+        import lambda_handler as handler_module
+        import_seconds = time.perf_counter() - start
+        handler_import_seconds = time.perf_counter() - handler_start
+        boto3.client = original_boto3_client
+
+        stub_s3_transport(handler_module.s3_client)
+
+        event = {'transactions_per_account': args.transactions_per_account, 'seed': 1}
+        timings = []
+        for _ in range(2):
+            start = time.perf_counter()
+            result = handler_module.lambda_handler(event, None)
+            timings.append(time.perf_counter() - start)
+            if result['statusCode'] != 200:
+                raise Exception(f"lambda_handler failed: {result['body']}")
+
+    return {
+        'import_seconds': round(import_seconds, 4),
+        'boto3_import_seconds': round(boto3_import_seconds, 4),
+        'handler_import_seconds': round(handler_import_seconds, 4),
+        's3_client_seconds': round(sum(client_seconds), 4),
+        'first_invocation_seconds': round(timings[0], 4),
+        'warm_invocation_seconds': round(timings[1], 4),
+        'peak_rss_mb': round(peak_rss_mb(), 1) if peak_rss_mb() is not None else None,
+        'faker_imported': 'faker' in sys.modules,
+        'pyarrow_imported': 'pyarrow' in sys.modules
+    }
+
+
+def measure_cold_start(argv):
+    """Run one cold start in a new interpreter; process_seconds includes interpreter startup"""
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--run-one'] + argv,
+        cwd=LAMBDA_DIR, capture_output=True, text=True
+    )
+    process_seconds = time.perf_counter() - start
+
+    for line in completed.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            return {'process_seconds': round(process_seconds, 4), **json.loads(line[len(RESULT_PREFIX):])}
+    raise Exception(f"Cold start failed:\n{completed.stdout[-2000:]}{completed.stderr}")
+
+
+def top_imports(limit):
+    """Modules imported directly by lambda_handler, by cumulative import time (python -X importtime)"""
+    env = dict(os.environ, AWS_DEFAULT_REGION=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'))
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import lambda_handler'],
+        cwd=LAMBDA_DIR, capture_output=True, text=True, env=env
+    )
+    modules = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # One level of indentation below lambda_handler = imported by it directly
+        if name.startswith('   ') and not name.startswith('    '):
+            modules.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(modules, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start benchmark for lambda_handler")
+    parser.add_argument('--repeat', type=int, default=5, help="Cold starts to measure (default: 5)")
+    parser.add_argument('--transactions', type=int, default=1000, help="Transactions per invocation (default: 1000)")
+    parser.add_argument('--transactions-per-account', type=int, default=100)
+    parser.add_argument('--importtime', type=int, default=10, metavar='N',
+                        help="Also list the N slowest direct imports of lambda_handler (0 = skip)")
+    parser.add_argument('--json', dest='json_path', help="Also write the results to this JSON file")
+    parser.add_argument('--run-one', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        print(RESULT_PREFIX + json.dumps(run_cold_start(args)), flush=True)
+        return
+
+    argv = [arg for arg in sys.argv[1:] if arg != '--run-one']
+    runs = []
+    for i in range(args.repeat):
+        print(f"Cold start {i + 1}/{args.repeat}...", flush=True)
+        runs.append(measure_cold_start(argv))
+
+    print(f"\n{'':28} {'median':>8} {'min':>8} {'max':>8}")
+    for measure in MEASURES:
+        values = [run[measure] for run in runs]
+        print(f"{measure:28} {statistics.median(values):>8.3f} {min(values):>8.3f} {max(values):>8.3f}")
+    print(f"\nPeak RSS: {runs[-1]['peak_rss_mb']} MiB; "
+          f"Faker imported: {runs[-1]['faker_imported']}; pyarrow imported: {runs[-1]['pyarrow_imported']}")
+
+    if args.importtime:
+        print(f"\nSlowest direct imports of lambda_handler (cumulative seconds):")
+        for seconds, name in top_imports(args.importtime):
+            print(f"  {seconds:8.3f}  {name}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(runs, f, indent=2)
+        print(f"\nResults written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -21,6 +21,9 @@ class Config:
     OBP_CONSUMER_SECRET = os.getenv('OBP_CONSUMER_SECRET')
     OBP_DIRECTLOGIN_ENDPOINT = os.getenv('OBP_DIRECTLOGIN_ENDPOINT')
     
+    # DirectLogin token cache shared by local scripts (empty file name disables persistence)
+    OBP_TOKEN_CACHE_FILE = os.getenv('OBP_TOKEN_CACHE_FILE', '.obp_token.json')
+    
     # OAuth2 credentials (if needed)
     OAUTH2_CLIENT_ID = os.getenv('OAUTH2_CLIENT_ID')
     OAUTH2_REDIRECT_URI = os.getenv('OAUTH2_REDIRECT_URI')
@@ -28,6 +31,18 @@ class Config:
     OAUTH2_JWS_ALG = os.getenv('OAUTH2_JWS_ALG')
     OAUTH2_JWK_PRIVATE_KEY = os.getenv('OAUTH2_JWK_PRIVATE_KEY')
     
+    @classmethod
+    def pipeline_settings(cls, **overrides):
+        """Pipeline settings (paging, caps, timeouts, retries, ...) from the environment with .env loaded
+
+        The DirectLogin token is cached in OBP_TOKEN_CACHE_FILE unless OBP_TOKEN_CACHE is set.
+        """
+        from pipeline import PipelineSettings
+        
+        if 'OBP_TOKEN_CACHE' not in os.environ and cls.OBP_TOKEN_CACHE_FILE:
+            overrides.setdefault('obp_token_cache', f"file:{cls.OBP_TOKEN_CACHE_FILE}")
+        return PipelineSettings.from_env(**overrides)
+    
     @classmethod
     def validate_directlogin(cls):
         """Validate that required DirectLogin credentials are present"""
@@ -0,0 +1,417 @@
+"""
+Chunked reader and aggregations over stored pipeline runs
+Finds the objects of many runs through their manifests (or, for files without
+one such as hybrid_data_pipeline.py output, by file name), prunes them by bank
+and date using the manifest statistics, and reads only the requested columns
+in DataFrame chunks. RunSummary computes the aggregates of
+hybrid_data_pipeline.display_data_summary over those chunks, so summarizing
+months of output never loads a whole dataset into memory.
+
+Usage:
+    python dataset_reader.py --dir .                       # hybrid_*.csv or a synced copy of the bucket
+    python dataset_reader.py --local-s3 .                  # local_test_* files of the S3 stand-in
+    python dataset_reader.py --s3-bucket my-bucket --from 2026-09-01 --bank gh.29.uk
+    python dataset_reader.py --dir . --start 2026-08-01 --end 2026-09-01 --json summary.json
+"""
+
+import argparse
+import json
+import os
+import re
+from collections import Counter, defaultdict
+from contextlib import closing
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+MANIFEST_PREFIX = 'raw/_manifests/'
+DEFAULT_CHUNK_ROWS = 250_000
+
+# Run manifests are run_<ts>.json; shard result records live beside them
+MANIFEST_FILE = re.compile(r'run_\d{8}_\d{6}\.json$')
+# Data files of a run without a manifest, e.g. hybrid_transactions_20261017_021955.csv
+DATA_FILE = r'(^|[_/]){dataset}_\d{{8}}_\d{{6}}[^/]*\.(csv|csv\.gz|csv\.zst|parquet)$'
+
+CSV_COMPRESSIONS = {'.gz': 'gzip', '.zst': 'zstd'}
+
+# Precision of the ISO text CSV objects store for Parquet timestamp columns (others: microseconds)
+TIMESTAMP_UNITS = {'transaction_date': 's'}
+
+
+class LocalFileStore:
+    """Files under a local directory, keyed by their relative path with / separators"""
+
+    def __init__(self, directory='.'):
+        self.directory = directory
+
+    def list(self, prefix=''):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                key = os.path.relpath(os.path.join(root, name), self.directory).replace(os.sep, '/')
+                if key.startswith(prefix):
+                    yield key
+
+    def open(self, key):
+        return open(os.path.join(self.directory, key), 'rb')
+
+
+class S3ObjectStore:
+    """Objects of one bucket, through a boto3 S3 client or the local_s3.LocalS3Client stand-in"""
+
+    def __init__(self, s3_client, bucket):
+        self.s3_client = s3_client
+        self.bucket = bucket
+
+    def list(self, prefix=''):
+        kwargs = {'Bucket': self.bucket, 'Prefix': prefix}
+        while True:
+            response = self.s3_client.list_objects_v2(**kwargs)
+            for item in response.get('Contents', []):
+                yield item['Key']
+            if not response.get('IsTruncated'):
+                return
+            kwargs['ContinuationToken'] = response['NextContinuationToken']
+
+    def open(self, key):
+        """Streaming body of the object (read lazily)"""
+        return self.s3_client.get_object(Bucket=self.bucket, Key=key)['Body']
+
+
+def object_format(key):
+    """(format, compression) of a data file from its extension"""
+    if key.endswith('.parquet'):
+        return 'parquet', None
+    for extension, compression in CSV_COMPRESSIONS.items():
+        if key.endswith('.csv' + extension):
+            return 'csv', compression
+    return 'csv', None
+
+
+def iso_timestamps(chunk):
+    """Replace the chunk's datetime columns with the ISO text CSV objects hold
+
+    Runs are written as CSV or Parquet per event, so one store mixes both; with
+    one type per column, chunks of either format compare and aggregate together.
+    """
+    for name in chunk.columns:
+        if pd.api.types.is_datetime64_any_dtype(chunk[name]):
+            values = chunk[name].to_numpy()
+            text = np.datetime_as_string(values, unit=TIMESTAMP_UNITS.get(name, 'us')).astype(object)
+            text[np.isnat(values)] = None
+            chunk[name] = text
+    return chunk
+
+
+def read_object(store, key, columns=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Yield DataFrame chunks of one object, reading only `columns` (None = all)
+
+    Timestamps read back as ISO strings whatever the object's format.
+    """
+    output_format, compression = object_format(key)
+    with closing(store.open(key)) as f:
+        if output_format == 'parquet':
+            import pyarrow.parquet as pq
+            # Parquet needs random access to its footer, so the object is buffered
+            parquet_file = pq.ParquetFile(BytesIO(f.read()))
+            for record_batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=columns):
+                yield iso_timestamps(record_batch.to_pandas())
+        else:
+            yield from pd.read_csv(
+                f, usecols=columns, chunksize=chunk_rows, compression=compression,
+                dtype={'bank_id': str, 'account_id': str, 'transaction_id': str}
+            )
+
+
+def object_matches(entry, bank_ids=None, start=None, end=None):
+    """Whether an object can hold rows for the bank and transaction_date filters
+
+    Uses the partition values and min/max statistics of its manifest entry; an
+    object without them always matches (rows are then filtered as they are read).
+    """
+    bank_id = entry.get('partition', {}).get('bank_id')
+    if bank_ids and bank_id is not None and bank_id not in bank_ids:
+        return False
+    first = entry.get('min', {}).get('transaction_date')
+    last = entry.get('max', {}).get('transaction_date')
+    if start and last is not None and last < start:
+        return False
+    if end and first is not None and first >= end:
+        return False
+    return True
+
+
+class RunReader:
+    """Lazily read the datasets of every run in a store
+
+    `runs_from`/`runs_to` (YYYY-MM-DD, inclusive) select runs by their date and
+    `run_ids` (e.g. 20261017_021955) individual runs;
+    `start`/`end` passed to read() select transactions by transaction_date
+    (end exclusive), and `bank_ids` by bank.
+    """
+
+    def __init__(self, store, runs_from=None, runs_to=None, run_ids=None):
+        self.store = store
+        self.runs_from = runs_from
+        self.runs_to = runs_to
+        self.run_ids = set(run_ids) if run_ids else None
+        self._manifests = None
+
+    def manifests(self):
+        """Run manifests in the date range, with the objects of finished shards merged in"""
+        if self._manifests is None:
+            self._manifests = []
+            for key in sorted(self.store.list(MANIFEST_PREFIX)):
+                if not MANIFEST_FILE.search(key):
+                    continue
+                manifest = self._load_json(key)
+                run_date = manifest['timestamp'][:10]
+                if (self.runs_from and run_date < self.runs_from) or (self.runs_to and run_date > self.runs_to):
+                    continue
+                if self.run_ids and manifest['run_id'] not in self.run_ids:
+                    continue
+                for shard in manifest.get('shards', []):
+                    try:
+                        manifest['objects'] += self._load_json(shard['result_key']).get('objects', [])
+                    except Exception:
+                        print(f"Skipping unfinished shard {shard['shard_index']} of run {manifest['run_id']}")
+                self._manifests.append(manifest)
+        return self._manifests
+
+    def objects(self, dataset, bank_ids=None, start=None, end=None):
+        """Manifest entries of the dataset's objects that can match the filters
+
+        Without any manifest, data files are found by name (dataset_YYYYMMDD_HHMMSS...).
+        """
+        manifests = self.manifests()
+        if manifests:
+            entries = [entry for manifest in manifests for entry in manifest['objects'] if entry['dataset'] == dataset]
+        else:
+            pattern = re.compile(DATA_FILE.format(dataset=dataset))
+            entries = [{'dataset': dataset, 'key': key} for key in sorted(self.store.list()) if pattern.search(key)]
+        return [entry for entry in entries if object_matches(entry, bank_ids, start, end)]
+
+    def read(self, dataset, columns=None, bank_ids=None, start=None, end=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """Yield DataFrame chunks of `columns` from every matching object of `dataset`"""
+        bank_ids = set(bank_ids) if bank_ids else None
+        for entry in self.objects(dataset, bank_ids, start, end):
+            filter_banks = bank_ids and 'bank_id' not in entry.get('partition', {})
+            filter_dates = (start or end) and not self._within(entry, start, end)
+            extra = (['bank_id'] if filter_banks else []) + (['transaction_date'] if filter_dates else [])
+            read_columns = None if columns is None else list(dict.fromkeys(columns + extra))
+
+            for chunk in read_object(self.store, entry['key'], read_columns, chunk_rows):
+                if filter_banks:
+                    chunk = chunk[chunk['bank_id'].isin(bank_ids)]
+                if filter_dates:
+                    dates = chunk['transaction_date']
+                    chunk = chunk[((dates >= start) if start else True) & ((dates < end) if end else True)]
+                if columns is not None:
+                    chunk = chunk[columns]
+                if len(chunk):
+                    yield chunk
+
+    def summarize(self, bank_ids=None, start=None, end=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """RunSummary of the banks, accounts and transactions matching the filters"""
+        summary = RunSummary()
+        for chunk in self.read('banks', RunSummary.BANK_COLUMNS, bank_ids, chunk_rows=chunk_rows):
+            summary.add_banks(chunk)
+        for chunk in self.read('accounts', RunSummary.ACCOUNT_COLUMNS, bank_ids, chunk_rows=chunk_rows):
+            summary.add_accounts(chunk)
+        for chunk in self.read('transactions', RunSummary.TRANSACTION_COLUMNS, bank_ids, start, end, chunk_rows):
+            summary.add_transactions(chunk)
+        return summary
+
+    def _load_json(self, key):
+        with closing(self.store.open(key)) as f:
+            return json.loads(f.read())
+
+    @staticmethod
+    def _within(entry, start, end):
+        """Whether the object's statistics place all its rows inside [start, end)"""
+        first = entry.get('min', {}).get('transaction_date')
+        last = entry.get('max', {}).get('transaction_date')
+        if first is None or last is None:
+            return False
+        return (not start or first >= start) and (not end or last < end)
+
+
+class AmountStats:
+    """Streaming equivalent of pandas Series.describe() for amounts
+
+    Mean and variance are merged chunk by chunk; quartiles come from a histogram
+    of whole cents, so they are exact while memory grows with the number of
+    distinct amounts rather than with rows.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self._cents = np.array([], dtype=np.int64)
+        self._counts = np.array([], dtype=np.int64)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        n = len(values)
+        if not n:
+            return
+
+        # Chan et al. parallel variance: combine the chunk's mean/M2 with the running ones
+        mean = values.mean()
+        delta = mean - self.mean
+        total = self.count + n
+        self.m2 += ((values - mean) ** 2).sum() + delta ** 2 * self.count * n / total
+        self.mean += delta * n / total
+        self.count = total
+        self.min = values.min() if self.min is None else min(self.min, values.min())
+        self.max = values.max() if self.max is None else max(self.max, values.max())
+
+        cents, counts = np.unique(np.round(values * 100).astype(np.int64), return_counts=True)
+        merged, inverse = np.unique(np.concatenate([self._cents, cents]), return_inverse=True)
+        self._counts = np.bincount(inverse, weights=np.concatenate([self._counts, counts]),
+                                   minlength=len(merged)).astype(np.int64)
+        self._cents = merged
+
+    def quantile(self, q):
+        """Quantile with linear interpolation, as pandas computes it"""
+        position = (self.count - 1) * q
+        cumulative = np.cumsum(self._counts)
+        low, high = (self._cents[np.searchsorted(cumulative, rank, side='right')] / 100
+                     for rank in (int(np.floor(position)), int(np.ceil(position))))
+        return low + (high - low) * (position - np.floor(position))
+
+    def describe(self):
+        if not self.count:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'mean': float(self.mean),
+            'std': float(np.sqrt(self.m2 / (self.count - 1))) if self.count > 1 else float('nan'),
+            'min': float(self.min),
+            '25%': float(self.quantile(0.25)),
+            '50%': float(self.quantile(0.5)),
+            '75%': float(self.quantile(0.75)),
+            'max': float(self.max)
+        }
+
+
+class RunSummary:
+    """Aggregates of display_data_summary, accumulated over DataFrame chunks
+
+    Banks and accounts are counted once however many runs list them.
+    """
+
+    BANK_COLUMNS = ['bank_id']
+    ACCOUNT_COLUMNS = ['bank_id', 'account_id']
+    TRANSACTION_COLUMNS = ['account_id', 'transaction_type', 'currency', 'amount', 'transaction_date']
+
+    def __init__(self):
+        self.bank_ids = set()
+        self.accounts_by_bank = defaultdict(set)
+        self.transactions = 0
+        self.transaction_accounts = set()
+        self.first_date = None
+        self.last_date = None
+        self.transaction_types = Counter()
+        self.currencies = Counter()
+        self.amounts = AmountStats()
+
+    def add_banks(self, chunk):
+        self.bank_ids.update(chunk['bank_id'])
+
+    def add_accounts(self, chunk):
+        for bank_id, account_id in chunk[['bank_id', 'account_id']].drop_duplicates().itertuples(index=False):
+            self.accounts_by_bank[bank_id].add(account_id)
+
+    def add_transactions(self, chunk):
+        self.transactions += len(chunk)
+        self.transaction_accounts.update(chunk['account_id'].unique())
+        first, last = chunk['transaction_date'].min(), chunk['transaction_date'].max()
+        self.first_date = first if self.first_date is None else min(self.first_date, first)
+        self.last_date = last if self.last_date is None else max(self.last_date, last)
+        self.transaction_types.update(chunk['transaction_type'].value_counts().to_dict())
+        self.currencies.update(chunk['currency'].value_counts().to_dict())
+        self.amounts.update(chunk['amount'].to_numpy())
+
+    def to_dict(self):
+        accounts = sum(len(account_ids) for account_ids in self.accounts_by_bank.values())
+        return {
+            'banks': len(self.bank_ids),
+            'accounts': accounts,
+            'accounts_per_bank': {bank_id: len(ids) for bank_id, ids in sorted(self.accounts_by_bank.items())},
+            'transactions': self.transactions,
+            'accounts_with_transactions': len(self.transaction_accounts),
+            'transactions_per_account': self.transactions // len(self.transaction_accounts) if self.transaction_accounts else 0,
+            'date_range': [self.first_date, self.last_date],
+            'transaction_types': dict(self.transaction_types.most_common()),
+            'currencies': dict(self.currencies.most_common()),
+            'amount': self.amounts.describe()
+        }
+
+    def print(self):
+        """Print the summary in the layout of display_data_summary"""
+        summary = self.to_dict()
+        print("\n" + "=" * 60)
+        print("DATA SUMMARY")
+        print("=" * 60)
+
+        print(f"\nBANKS: {summary['banks']}")
+        print(f"\nACCOUNTS: {summary['accounts']}")
+        print(f"Accounts per bank:")
+        for bank_id, count in list(summary['accounts_per_bank'].items())[:5]:
+            print(f"  {bank_id:30} {count}")
+
+        print(f"\nTRANSACTIONS: {summary['transactions']}")
+        print(f"Transactions per account: {summary['transactions_per_account']}")
+        print(f"Date range: {summary['date_range'][0]} to {summary['date_range'][1]}")
+        print(f"\nTransaction types:")
+        for name, count in summary['transaction_types'].items():
+            print(f"  {name:30} {count}")
+        print(f"\nCurrency distribution:")
+        for name, count in summary['currencies'].items():
+            print(f"  {name:30} {count}")
+        print(f"\nAmount statistics:")
+        for name, value in summary['amount'].items():
+            print(f"  {name:8} {value:.6f}" if isinstance(value, float) else f"  {name:8} {value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize stored pipeline runs without loading them whole")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--dir', help="Local directory (hybrid_*.csv output or a synced copy of the bucket)")
+    source.add_argument('--local-s3', metavar='DIR', help="Directory of the local S3 stand-in (local_test_* files)")
+    source.add_argument('--s3-bucket', help="S3 bucket written by the Lambda")
+    parser.add_argument('--from', dest='runs_from', help="First run date to include (YYYY-MM-DD)")
+    parser.add_argument('--to', dest='runs_to', help="Last run date to include (YYYY-MM-DD)")
+    parser.add_argument('--start', help="Only transactions on or after this transaction_date")
+    parser.add_argument('--end', help="Only transactions before this transaction_date")
+    parser.add_argument('--bank', action='append', dest='bank_ids', help="Only this bank (repeatable)")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument('--json', dest='json_path', help="Also write the summary to this JSON file")
+    args = parser.parse_args()
+
+    if args.dir:
+        store = LocalFileStore(args.dir)
+    elif args.local_s3:
+        from local_s3 import LocalS3Client
+        store = S3ObjectStore(LocalS3Client(args.local_s3, verbose=False), 'local-test-bucket')
+    else:
+        import boto3
+        store = S3ObjectStore(boto3.client('s3'), args.s3_bucket)
+
+    reader = RunReader(store, args.runs_from, args.runs_to)
+    summary = reader.summarize(args.bank_ids, args.start, args.end, args.chunk_rows)
+    summary.print()
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(summary.to_dict(), f, indent=2, default=str)
+        print(f"\nSummary written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
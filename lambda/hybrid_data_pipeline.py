@@ -8,199 +8,41 @@ This demonstrates a production pattern:
 - Clear data lineage tracking
 """
 
-import requests
-import pandas as pd
-from datetime import datetime, timedelta
-from faker import Faker
-import random
+import argparse
+from datetime import datetime
 from config import Config
+from lineage_validator import frame_chunks, print_lineage_report, validate_lineage
+from pipeline import DataFrameSink, OBPSource, create_auth, create_http_session, run_stages
+from synthetic_generator import new_run_seed
 
-fake = Faker()
+# Synthetic transactions generated for each real account
+TRANSACTIONS_PER_ACCOUNT = 100
 
+# Same settings, keep-alive session and token cache handling as the Lambda (token cached in Config.OBP_TOKEN_CACHE_FILE)
+settings = Config.pipeline_settings(transactions_per_account=TRANSACTIONS_PER_ACCOUNT)
+obp_source = OBPSource(settings, create_auth(settings, create_http_session(settings)))
 
-def authenticate():
-    """Authenticate with OBP API and return token"""
-    print("\n" + "=" * 60)
-    print("STEP 1: Authentication (REAL API)")
-    print("=" * 60)
-    
-    url = Config.OBP_DIRECTLOGIN_ENDPOINT
-    headers = {
-        "Authorization": f'DirectLogin username="{Config.OBP_USERNAME}", password="{Config.OBP_PASSWORD}", consumer_key="{Config.OBP_CONSUMER_KEY}"',
-        "Accept": "application/json"
-    }
-    
-    response = requests.post(url, headers=headers)
-    
-    if response.status_code == 201:
-        token = response.json()["token"]
-        print(f"[SUCCESS] Authentication successful! Token: {token[:20]}...")
-        return token
-    else:
-        raise Exception(f"Authentication failed: {response.status_code}")
 
+def run_hybrid_stages(seed=None, workers=1):
+    """Run the shared source -> generate stages into DataFrames: real banks and accounts, synthetic transactions
 
-def fetch_real_banks(token):
-    """Fetch real banks from OBP API"""
+    With workers > 1, account chunks are generated in a process pool; output
+    does not depend on `workers` (see pipeline.generate_transactions).
+    """
     print("\n" + "=" * 60)
-    print("STEP 2: Fetching Banks (REAL API)")
+    print("STEPS 1-4: Authenticate, fetch banks and accounts (REAL API), generate transactions (SYNTHETIC)")
     print("=" * 60)
     
-    url = f"{Config.OBP_BASE_URL}/obp/{Config.OBP_API_VERSION}/banks"
-    headers = {
-        "Authorization": f'DirectLogin token="{token}"',
-        "Accept": "application/json"
-    }
+    if seed is None:
+        seed = new_run_seed()
+    print(f"  Seed: {seed} (pass --seed {seed} to reproduce)")
     
-    response = requests.get(url, headers=headers)
+    sink = DataFrameSink()
+    run = run_stages(obp_source, sink, settings, seed, workers=workers)
     
-    if response.status_code == 200:
-        banks = response.json()["banks"]
-        print(f"[SUCCESS] Found {len(banks)} real banks")
-        
-        banks_data = []
-        for bank in banks[:10]:  # Limit to first 10 banks
-            banks_data.append({
-                'bank_id': bank['id'],
-                'bank_name': bank.get('full_name', bank.get('short_name', 'N/A')),
-                'data_source': 'REAL_API',
-                'extracted_at': datetime.now().isoformat()
-            })
-        
-        print(f"[SUCCESS] Processed {len(banks_data)} banks")
-        return banks_data
-    else:
-        raise Exception(f"Failed to fetch banks: {response.status_code}")
-
-
-def fetch_real_accounts(token, bank_ids):
-    """Fetch real public accounts from OBP API"""
-    print("\n" + "=" * 60)
-    print("STEP 3: Fetching Accounts (REAL API)")
-    print("=" * 60)
-    
-    all_accounts = []
-    
-    for bank_id in bank_ids:
-        url = f"{Config.OBP_BASE_URL}/obp/{Config.OBP_API_VERSION}/banks/{bank_id}/accounts/public"
-        headers = {
-            "Authorization": f'DirectLogin token="{token}"',
-            "Accept": "application/json"
-        }
-        
-        response = requests.get(url, headers=headers)
-        
-        if response.status_code == 200:
-            data = response.json()
-            
-            if isinstance(data, list):
-                accounts = data
-            elif isinstance(data, dict):
-                accounts = data.get("accounts", [])
-            else:
-                accounts = []
-            
-            if accounts:
-                print(f"  [SUCCESS] {bank_id}: Found {len(accounts)} accounts")
-                
-                for account in accounts:
-                    all_accounts.append({
-                        'account_id': account.get('id', 'N/A'),
-                        'bank_id': bank_id,
-                        'account_label': account.get('label', account.get('account_label', 'N/A')),
-                        'account_type': account.get('account_type', 'N/A'),
-                        'data_source': 'REAL_API',
-                        'extracted_at': datetime.now().isoformat()
-                    })
-    
-    print(f"\n[SUCCESS] Total accounts fetched: {len(all_accounts)}")
-    return all_accounts
-
-
-def generate_synthetic_transactions(accounts_df, transactions_per_account=100):
-    """Generate synthetic transactions linked to real account IDs"""
-    print("\n" + "=" * 60)
-    print(f"STEP 4: Generating Synthetic Transactions ({transactions_per_account} per account)")
-    print("=" * 60)
-    
-    all_transactions = []
-    transaction_types = ['ATM Withdrawal', 'POS Purchase', 'Online Transfer', 'Direct Debit', 
-                        'Salary Deposit', 'Refund', 'Bill Payment', 'Cash Deposit']
-    
-    merchants = ['Amazon', 'Walmart', 'Starbucks', 'Shell Gas', 'Netflix', 'Spotify', 
-                'Uber', 'Restaurant', 'Supermarket', 'Pharmacy']
-    
-    for idx, account_row in accounts_df.iterrows():
-        account_id = account_row['account_id']
-        bank_id = account_row['bank_id']
-        
-        # Generate random starting balance
-        starting_balance = random.uniform(1000, 50000)
-        current_balance = starting_balance
-        
-        # Generate transactions for the past 90 days
-        start_date = datetime.now() - timedelta(days=90)
-        
-        for i in range(transactions_per_account):
-            # Random transaction date within last 90 days
-            days_ago = random.randint(0, 90)
-            tx_date = datetime.now() - timedelta(days=days_ago)
-            
-            # Random transaction type
-            tx_type = random.choice(transaction_types)
-            
-            # Generate amount based on transaction type
-            if tx_type in ['Salary Deposit', 'Refund', 'Cash Deposit']:
-                # Credit transactions
-                amount = round(random.uniform(500, 5000), 2)
-                is_debit = False
-            else:
-                # Debit transactions
-                amount = round(random.uniform(5, 500), 2)
-                is_debit = True
-            
-            # Update balance
-            if is_debit:
-                current_balance -= amount
-                amount_signed = -amount
-            else:
-                current_balance += amount
-                amount_signed = amount
-            
-            # Generate description
-            if tx_type == 'POS Purchase':
-                description = f"{tx_type} at {random.choice(merchants)}"
-            elif tx_type == 'Online Transfer':
-                description = f"{tx_type} to {fake.name()}"
-            elif tx_type == 'Salary Deposit':
-                description = f"{tx_type} from {fake.company()}"
-            else:
-                description = tx_type
-            
-            # Create transaction record
-            all_transactions.append({
-                'transaction_id': f"synth_{account_id}_{i:04d}",
-                'bank_id': bank_id,
-                'account_id': account_id,
-                'amount': amount_signed,
-                'currency': random.choice(['GBP', 'EUR', 'USD']),
-                'transaction_type': tx_type,
-                'description': description,
-                'merchant': random.choice(merchants) if tx_type == 'POS Purchase' else None,
-                'transaction_date': tx_date.isoformat(),
-                'transaction_hour': tx_date.hour,
-                'day_of_week': tx_date.strftime('%A'),
-                'is_weekend': tx_date.weekday() >= 5,
-                'balance_after': round(current_balance, 2),
-                'counterparty_name': fake.name() if tx_type == 'Online Transfer' else None,
-                'data_source': 'SYNTHETIC',
-                'generated_at': datetime.now().isoformat()
-            })
-        
-        print(f"  [SUCCESS] Generated {transactions_per_account} transactions for account: {account_id}")
-    
-    print(f"\n[SUCCESS] Total synthetic transactions: {len(all_transactions)}")
-    return all_transactions
+    print(f"\n[SUCCESS] {len(run.banks)} banks, {len(run.accounts)} accounts, "
+          f"{run.transaction_count} synthetic transactions")
+    return sink.frames['banks'], sink.frames['accounts'], sink.frames['transactions']
 
 
 def save_hybrid_datasets(banks_df, accounts_df, transactions_df):
@@ -266,46 +108,25 @@ def display_data_summary(banks_df, accounts_df, transactions_df):
 
 
 def validate_data_lineage(banks_df, accounts_df, transactions_df):
-    """Validate that synthetic transactions are properly linked to real accounts"""
+    """Validate that synthetic transactions are properly linked to real accounts
+
+    Streams the DataFrames through lineage_validator in chunks and reports any
+    orphaned or duplicate ids.
+    """
     print("\n" + "=" * 60)
     print("DATA LINEAGE VALIDATION")
     print("=" * 60)
     
-    # Check banks data source
-    banks_real = (banks_df['data_source'] == 'REAL_API').sum()
-    print(f"[SUCCESS] Banks: {banks_real}/{len(banks_df)} from REAL_API")
-    
-    # Check accounts data source
-    accounts_real = (accounts_df['data_source'] == 'REAL_API').sum()
-    print(f"[SUCCESS] Accounts: {accounts_real}/{len(accounts_df)} from REAL_API")
-    
-    # Check transactions data source
-    transactions_synthetic = (transactions_df['data_source'] == 'SYNTHETIC').sum()
-    print(f"[SUCCESS] Transactions: {transactions_synthetic}/{len(transactions_df)} SYNTHETIC")
-    
-    # Validate linkage
-    real_account_ids = set(accounts_df['account_id'])
-    transaction_account_ids = set(transactions_df['account_id'])
-    
-    if transaction_account_ids.issubset(real_account_ids):
-        print(f"[SUCCESS] All synthetic transactions linked to REAL accounts")
-        print(f"   {len(transaction_account_ids)} unique accounts with transactions")
-    else:
-        orphaned = transaction_account_ids - real_account_ids
-        print(f"[WARNING] {len(orphaned)} orphaned transaction accounts")
-    
-    # Validate bank linkage
-    real_bank_ids = set(banks_df['bank_id'])
-    transaction_bank_ids = set(transactions_df['bank_id'])
-    
-    if transaction_bank_ids.issubset(real_bank_ids):
-        print(f"[SUCCESS] All transactions linked to REAL banks")
-    else:
-        orphaned = transaction_bank_ids - real_bank_ids
-        print(f"[WARNING] {len(orphaned)} orphaned transaction banks")
+    report = validate_lineage(
+        [banks_df], [accounts_df], frame_chunks(transactions_df),
+        lambda: (chunk['transaction_id'] for chunk in frame_chunks(transactions_df)),
+        expected_transactions=len(transactions_df)
+    )
+    print_lineage_report(report)
+    return report
 
 
-def main():
+def main(workers=1, seed=None):
     """Main hybrid pipeline execution"""
     print("\n" + "=" * 70)
     print("HYBRID DATA PIPELINE: Real API + Synthetic Transactions")
@@ -322,30 +143,8 @@ def main():
         Config.validate_directlogin()
         print("\n[SUCCESS] Configuration validated")
         
-        # Step 1: Authenticate
-        token = authenticate()
-        
-        # Step 2: Fetch real banks
-        banks_data = fetch_real_banks(token)
-        banks_df = pd.DataFrame(banks_data)
-        
-        # Step 3: Fetch real accounts (try first 3 banks)
-        bank_ids_to_try = banks_df['bank_id'].head(3).tolist()
-        accounts_data = fetch_real_accounts(token, bank_ids_to_try)
-        
-        if not accounts_data:
-            print("\n[WARNING] No accounts found, trying more banks...")
-            bank_ids_to_try = banks_df['bank_id'].head(10).tolist()
-            accounts_data = fetch_real_accounts(token, bank_ids_to_try)
-        
-        if not accounts_data:
-            raise Exception("No accounts found in any banks")
-        
-        accounts_df = pd.DataFrame(accounts_data)
-        
-        # Step 4: Generate synthetic transactions
-        transactions_data = generate_synthetic_transactions(accounts_df, transactions_per_account=100)
-        transactions_df = pd.DataFrame(transactions_data)
+        # Steps 1-4: Authenticate, fetch real banks and accounts, generate synthetic transactions
+        banks_df, accounts_df, transactions_df = run_hybrid_stages(seed, workers)
         
         # Step 5: Save datasets
         banks_file, accounts_file, transactions_file = save_hybrid_datasets(
@@ -382,5 +181,12 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Hybrid data pipeline: real OBP accounts + synthetic transactions")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Processes used to generate transactions (default: 1)")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="Seed for reproducible synthetic transactions (default: random)")
+    args = parser.parse_args()
+    
+    main(workers=args.workers, seed=args.seed)
 
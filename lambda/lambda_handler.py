@@ -4,283 +4,398 @@ Fetches data from Open Bank Project API and uploads to S3
 """
 
 import json
-import boto3
-import requests
-from datetime import datetime, timedelta
-from faker import Faker
-import random
-import os
-import csv
-from io import StringIO
-
-fake = Faker()
-
-# Environment variables
-OBP_BASE_URL = os.environ.get('OBP_BASE_URL')
-OBP_API_VERSION = os.environ.get('OBP_API_VERSION')
-OBP_USERNAME = os.environ.get('OBP_USERNAME')
-OBP_PASSWORD = os.environ.get('OBP_PASSWORD')
-OBP_CONSUMER_KEY = os.environ.get('OBP_CONSUMER_KEY')
-OBP_DIRECTLOGIN_ENDPOINT = os.environ.get('OBP_DIRECTLOGIN_ENDPOINT')
-S3_BUCKET_NAME = os.environ.get('S3_BUCKET_NAME')
-
-s3_client = boto3.client('s3')
-
-
-def authenticate():
-    """Authenticate with OBP API and return token"""
-    print("Authenticating with OBP API...")
-    
-    headers = {
-        "Authorization": f'DirectLogin username="{OBP_USERNAME}", password="{OBP_PASSWORD}", consumer_key="{OBP_CONSUMER_KEY}"',
-        "Accept": "application/json"
+from datetime import datetime
+from account_state import S3AccountStateStore
+from async_pipeline import run_stages_overlapped, stream_transactions_overlapped
+from metrics import PipelineMetrics, log
+from pipeline import (
+    MANIFEST_STATS_COLUMNS, TRANSACTION_PARTITION_COLUMN, TRANSACTION_SOURCES, OBPSource, PipelineSettings, S3Sink,
+    create_auth, create_http_session, create_s3_client, date_partition, discover_accounts, run_stages, s3_state_workers,
+    transaction_batches
+)
+from s3_writer import COMPRESSIONS, OUTPUT_FORMATS, hive_partition
+from synthetic_generator import new_run_seed
+
+# Every setting comes from the environment (see pipeline.SETTINGS); events can override some per run
+settings = PipelineSettings.from_env()
+
+# Per-invocation stage timings and request counts (reset by lambda_handler)
+metrics = PipelineMetrics(settings.metrics_namespace)
+
+# One S3 client (and connection pool) shared by every upload of an invocation
+s3_client = metrics.instrument_s3_client(create_s3_client(settings))
+account_state_store = S3AccountStateStore(
+    s3_client, settings.s3_bucket_name, settings.account_state_prefix, s3_state_workers(settings)
+)
+http_session = metrics.instrument_session(create_http_session(settings))
+
+# Created on first use: only coordinator invocations need it
+lambda_client = None
+
+# Module scope, so warm containers skip the DirectLogin round trip
+obp_auth = create_auth(settings, http_session, s3_client)
+obp_source = OBPSource(settings, obp_auth, metrics)
+
+
+def s3_sink(timestamp, output_format, compression=None, suffix='', uploader=None):
+    """S3 sink for one run (or shard) of this invocation; parts go through `uploader` when stages overlap"""
+    return S3Sink(s3_client, settings, timestamp, output_format, compression, suffix, metrics, uploader)
+
+
+def save_account_states(states):
+    """Persist account states once their transactions are safely in S3"""
+    count = account_state_store.save(states)
+    log(f"Saved state for {count} accounts to s3://{settings.s3_bucket_name}/{settings.account_state_prefix}/")
+    return count
+
+
+def build_manifest_key(timestamp, shard_index=None):
+    """Build the key of a run manifest, or of one shard's result record
+
+    The leading underscore keeps manifests out of Hive/Athena tables over raw/.
+    """
+    run_prefix = f"raw/_manifests/{hive_partition('dt', date_partition(timestamp))}/run_{timestamp.strftime('%Y%m%d_%H%M%S')}"
+    if shard_index is None:
+        return f"{run_prefix}.json"
+    return f"{run_prefix}/shard_{shard_index:04d}.json"
+
+
+def build_run_manifest(timestamp, output_format, compression, transactions_per_account, seed, incremental,
+                       objects, source='synthetic', from_date=None, to_date=None):
+    """Run manifest: run parameters plus every object written, so readers can prune without listing"""
+    return {
+        'run_id': timestamp.strftime('%Y%m%d_%H%M%S'),
+        'timestamp': timestamp.isoformat(),
+        'source': source,
+        'from_date': from_date,
+        'to_date': to_date,
+        'output_format': output_format,
+        'compression': compression,
+        'transactions_per_account': transactions_per_account,
+        'seed': seed,
+        'incremental': incremental,
+        'partitioning': {'transactions': ['dt', TRANSACTION_PARTITION_COLUMN], 'banks': ['dt'], 'accounts': ['dt']},
+        'stats_columns': MANIFEST_STATS_COLUMNS,
+        'objects': objects
     }
-    
-    response = requests.post(OBP_DIRECTLOGIN_ENDPOINT, headers=headers)
-    
-    if response.status_code == 201:
-        token = response.json()["token"]
-        print(f"Authentication successful")
-        return token
-    else:
-        raise Exception(f"Authentication failed: {response.status_code}")
 
 
-def fetch_real_banks(token):
-    """Fetch real banks from OBP API"""
-    print("Fetching banks...")
+def put_json_to_s3(data, file_key):
+    """Write a small JSON document to S3 (strict JSON: a NaN or infinity raises instead of writing `NaN`)"""
+    s3_client.put_object(
+        Bucket=settings.s3_bucket_name,
+        Key=file_key,
+        Body=json.dumps(data, indent=2, allow_nan=False).encode('utf-8'),
+        ContentType='application/json'
+    )
+    return file_key
+
+
+def run_pipeline(timestamp, output_format, transactions_per_account, seed, incremental=False, compression=None,
+                 source='synthetic', from_date=None, to_date=None):
+    """Single-invocation mode: discover, generate (or fetch) and upload everything in this Lambda"""
+    # Steps 1-5: authenticate, discover banks and accounts, stream transactions and upload everything
+    run_settings = settings.replace(transactions_per_account=transactions_per_account)
+    state_store = account_state_store if incremental else None
+    if settings.overlap_stages:
+        run = run_stages_overlapped(
+            obp_source, lambda uploader: s3_sink(timestamp, output_format, compression, uploader=uploader),
+            run_settings, seed, source, state_store, from_date, to_date
+        )
+        metrics.set('pipeline_stages', run.stages)
+    else:
+        run = run_stages(
+            obp_source, s3_sink(timestamp, output_format, compression), run_settings, seed, source, state_store,
+            from_date, to_date
+        )
+    
+    # The watermark only moves once the transactions object is complete
+    if incremental:
+        save_account_states(run.account_states)
+    
+    # Step 6: The manifest goes last, so it only ever lists complete objects
+    manifest = build_run_manifest(
+        timestamp, output_format, compression, transactions_per_account, seed, incremental,
+        run.objects, source, from_date, to_date
+    )
+    manifest_key = put_json_to_s3(manifest, build_manifest_key(timestamp))
+    log(f"Wrote manifest of {len(manifest['objects'])} objects to s3://{settings.s3_bucket_name}/{manifest_key}")
     
-    url = f"{OBP_BASE_URL}/obp/{OBP_API_VERSION}/banks"
-    headers = {
-        "Authorization": f'DirectLogin token="{token}"',
-        "Accept": "application/json"
+    log(f"Pipeline completed: {len(run.banks)} banks, {len(run.accounts)} accounts, "
+        f"{run.transaction_count} transactions")
+    return {
+        'message': 'Pipeline completed successfully',
+        'timestamp': timestamp.isoformat(),
+        'source': source,
+        'seed': seed,
+        'incremental': incremental,
+        'records': {
+            'banks': len(run.banks),
+            'accounts': len(run.accounts),
+            'transactions': run.transaction_count,
+            # Real transactions dropped for a missing id, date or amount (see real_transactions.py)
+            'rejected_transactions': metrics.values.get('rejected_transactions', 0)
+        },
+        's3_files': {
+            'banks': run.banks_object['key'],
+            'accounts': run.accounts_object['key'],
+            'transactions': [entry['key'] for entry in run.transaction_objects],
+            'manifest': manifest_key
+        }
     }
+
+
+def plan_shards(accounts_data, timestamp, output_format, transactions_per_account, seed, shard_accounts,
+                incremental=False, compression=None, source='synthetic', from_date=None, to_date=None):
+    """Split accounts into worker events of at most `shard_accounts` accounts each"""
+    shard_count = (len(accounts_data) + shard_accounts - 1) // shard_accounts
+    shard_events = []
     
-    response = requests.get(url, headers=headers)
+    for shard_index in range(shard_count):
+        shard = accounts_data[shard_index * shard_accounts:(shard_index + 1) * shard_accounts]
+        shard_events.append({
+            'mode': 'worker',
+            'timestamp': timestamp.isoformat(),
+            'output_format': output_format,
+            'transactions_per_account': transactions_per_account,
+            'seed': seed,
+            'incremental': incremental,
+            'compression': compression,
+            'source': source,
+            'from_date': from_date,
+            'to_date': to_date,
+            'shard_index': shard_index,
+            'shard_count': shard_count,
+            'accounts': [{'account_id': a['account_id'], 'bank_id': a['bank_id']} for a in shard]
+        })
+    return shard_events
+
+
+def dispatch_shards(shard_events, context):
+    """Invoke one asynchronous worker Lambda per shard
+
+    Workers report through their shard result records in S3, so nothing is returned.
+    test_lambda_locally.py replaces this with a local process pool.
+    """
+    global lambda_client
+    if lambda_client is None:
+        import boto3
+        lambda_client = boto3.client('lambda')
     
-    if response.status_code == 200:
-        banks = response.json()["banks"]
-        
-        banks_data = []
-        for bank in banks[:10]:
-            banks_data.append({
-                'bank_id': bank['id'],
-                'bank_name': bank.get('full_name', bank.get('short_name', 'N/A')),
-                'data_source': 'REAL_API',
-                'extracted_at': datetime.now().isoformat()
-            })
-        
-        print(f"Fetched {len(banks_data)} banks")
-        return banks_data
-    else:
-        raise Exception(f"Failed to fetch banks: {response.status_code}")
+    for shard_event in shard_events:
+        lambda_client.invoke(
+            FunctionName=context.function_name,
+            InvocationType='Event',
+            Payload=json.dumps(shard_event).encode('utf-8')
+        )
+    log(f"Dispatched {len(shard_events)} worker invocations")
+    return None
 
 
-def fetch_real_accounts(token, bank_ids):
-    """Fetch real public accounts from OBP API"""
-    print("Fetching accounts...")
+def run_coordinator(event, context, timestamp, output_format, transactions_per_account, seed, incremental=False,
+                    compression=None, source='synthetic', from_date=None, to_date=None):
+    """Coordinator mode: discover accounts, upload real data, fan shards out to workers"""
+    obp_source.authenticate()
+    banks_data = obp_source.fetch_banks()
+    first_account, account_stream = discover_accounts(obp_source, banks_data)
+    accounts_data = [first_account] + list(account_stream)
+    log(f"Fetched {len(accounts_data)} accounts")
     
-    all_accounts = []
+    sink = s3_sink(timestamp, output_format, compression)
+    banks_object = sink.write_records('banks', banks_data)
+    accounts_object = sink.write_records('accounts', accounts_data)
     
-    for bank_id in bank_ids:
-        url = f"{OBP_BASE_URL}/obp/{OBP_API_VERSION}/banks/{bank_id}/accounts/public"
-        headers = {
-            "Authorization": f'DirectLogin token="{token}"',
-            "Accept": "application/json"
+    shard_events = plan_shards(
+        accounts_data, timestamp, output_format, transactions_per_account, seed,
+        int(event.get('shard_accounts', settings.shard_accounts)), incremental, compression, source, from_date, to_date
+    )
+    
+    # Written before any worker starts: transaction objects are listed, with the same
+    # entries as a single-mode manifest, in each shard's result record once it completes
+    manifest = build_run_manifest(
+        timestamp, output_format, compression, transactions_per_account, seed, incremental,
+        [banks_object, accounts_object], source, from_date, to_date
+    )
+    manifest['shard_count'] = len(shard_events)
+    manifest['shards'] = [
+        {
+            'shard_index': shard_event['shard_index'],
+            'accounts': len(shard_event['accounts']),
+            'result_key': build_manifest_key(timestamp, shard_event['shard_index'])
         }
-        
-        response = requests.get(url, headers=headers)
-        
-        if response.status_code == 200:
-            data = response.json()
-            
-            if isinstance(data, list):
-                accounts = data
-            elif isinstance(data, dict):
-                accounts = data.get("accounts", [])
-            else:
-                accounts = []
-            
-            if accounts:
-                for account in accounts:
-                    all_accounts.append({
-                        'account_id': account.get('id', 'N/A'),
-                        'bank_id': bank_id,
-                        'account_label': account.get('label', account.get('account_label', 'N/A')),
-                        'account_type': account.get('account_type', 'N/A'),
-                        'data_source': 'REAL_API',
-                        'extracted_at': datetime.now().isoformat()
-                    })
+        for shard_event in shard_events
+    ]
+    manifest_key = put_json_to_s3(manifest, build_manifest_key(timestamp))
+    log(f"Wrote manifest for {len(shard_events)} shards to s3://{settings.s3_bucket_name}/{manifest_key}")
+    
+    shard_results = dispatch_shards(shard_events, context)
     
-    print(f"Fetched {len(all_accounts)} accounts")
-    return all_accounts
+    body = {
+        'message': 'Shards dispatched',
+        'timestamp': timestamp.isoformat(),
+        'source': source,
+        'seed': seed,
+        'incremental': incremental,
+        'records': {
+            'banks': len(banks_data),
+            'accounts': len(accounts_data),
+            'shards': len(shard_events)
+        },
+        's3_files': {
+            'banks': banks_object['key'],
+            'accounts': accounts_object['key'],
+            'manifest': manifest_key
+        }
+    }
+    if shard_results is not None:
+        body['shard_results'] = shard_results
+    return body
 
 
-def generate_synthetic_transactions(accounts, transactions_per_account=100):
-    """Generate synthetic transactions linked to real account IDs"""
-    print(f"Generating {transactions_per_account} synthetic transactions per account...")
+def run_worker(event):
+    """Worker mode: generate (or fetch) and upload the transactions of one shard"""
+    timestamp = datetime.fromisoformat(event['timestamp'])
+    output_format = event.get('output_format', settings.output_format)
+    transactions_per_account = int(event.get('transactions_per_account', settings.transactions_per_account))
+    shard_index = int(event['shard_index'])
+    seed = int(event['seed'])
+    incremental = bool(event.get('incremental', False))
+    compression = event.get('compression')
+    source = event.get('source', 'synthetic')
     
-    all_transactions = []
-    transaction_types = ['ATM Withdrawal', 'POS Purchase', 'Online Transfer', 'Direct Debit', 
-                        'Salary Deposit', 'Refund', 'Bill Payment', 'Cash Deposit']
+    log(f"Worker shard {shard_index + 1}/{event.get('shard_count', '?')}: {len(event['accounts'])} accounts")
     
-    merchants = ['Amazon', 'Walmart', 'Starbucks', 'Shell Gas', 'Netflix', 'Spotify', 
-                'Uber', 'Restaurant', 'Supermarket', 'Pharmacy']
+    if source == 'real':
+        obp_source.authenticate()
+    run_settings = settings.replace(transactions_per_account=transactions_per_account)
+    state_store = account_state_store if incremental else None
+    suffix = f"_shard{shard_index:04d}"
+    if settings.overlap_stages:
+        transaction_objects, transaction_count, account_states, stages = stream_transactions_overlapped(
+            obp_source, lambda uploader: s3_sink(timestamp, output_format, compression, suffix, uploader),
+            run_settings, event['accounts'], seed, source, state_store, event.get('from_date'), event.get('to_date')
+        )
+        metrics.set('pipeline_stages', stages)
+    else:
+        account_states = []
+        batches = transaction_batches(
+            obp_source, event['accounts'], run_settings, source, seed, account_states, state_store,
+            event.get('from_date'), event.get('to_date')
+        )
+        transaction_objects, transaction_count = s3_sink(
+            timestamp, output_format, compression, suffix
+        ).write_batches('transactions', batches)
+    if incremental:
+        save_account_states(account_states)
     
-    for account in accounts:
-        account_id = account['account_id']
-        bank_id = account['bank_id']
-        
-        starting_balance = random.uniform(1000, 50000)
-        current_balance = starting_balance
-        
-        for i in range(transactions_per_account):
-            days_ago = random.randint(0, 90)
-            tx_date = datetime.now() - timedelta(days=days_ago)
-            
-            tx_type = random.choice(transaction_types)
-            
-            if tx_type in ['Salary Deposit', 'Refund', 'Cash Deposit']:
-                amount = round(random.uniform(500, 5000), 2)
-                is_debit = False
-            else:
-                amount = round(random.uniform(5, 500), 2)
-                is_debit = True
-            
-            if is_debit:
-                current_balance -= amount
-                amount_signed = -amount
-            else:
-                current_balance += amount
-                amount_signed = amount
-            
-            if tx_type == 'POS Purchase':
-                description = f"{tx_type} at {random.choice(merchants)}"
-            elif tx_type == 'Online Transfer':
-                description = f"{tx_type} to {fake.name()}"
-            elif tx_type == 'Salary Deposit':
-                description = f"{tx_type} from {fake.company()}"
-            else:
-                description = tx_type
-            
-            all_transactions.append({
-                'transaction_id': f"synth_{account_id}_{i:04d}",
-                'bank_id': bank_id,
-                'account_id': account_id,
-                'amount': amount_signed,
-                'currency': random.choice(['GBP', 'EUR', 'USD']),
-                'transaction_type': tx_type,
-                'description': description,
-                'merchant': random.choice(merchants) if tx_type == 'POS Purchase' else None,
-                'transaction_date': tx_date.isoformat(),
-                'transaction_hour': tx_date.hour,
-                'day_of_week': tx_date.strftime('%A'),
-                'is_weekend': tx_date.weekday() >= 5,
-                'balance_after': round(current_balance, 2),
-                'counterparty_name': fake.name() if tx_type == 'Online Transfer' else None,
-                'data_source': 'SYNTHETIC',
-                'generated_at': datetime.now().isoformat()
-            })
+    result = {
+        'shard_index': shard_index,
+        'accounts': len(event['accounts']),
+        'transactions': transaction_count,
+        'rejected_transactions': metrics.values.get('rejected_transactions', 0),
+        'objects': transaction_objects,
+        'completed_at': datetime.now().isoformat(),
+        'metrics': metrics.summary()
+    }
+    put_json_to_s3(result, build_manifest_key(timestamp, shard_index))
     
-    print(f"Generated {len(all_transactions)} transactions")
-    return all_transactions
+    return {
+        'message': 'Shard completed',
+        'timestamp': timestamp.isoformat(),
+        'shard': result
+    }
 
 
-def dict_list_to_csv(data_list):
-    """Convert list of dictionaries to CSV string"""
-    if not data_list:
-        return ""
-    
-    output = StringIO()
-    writer = csv.DictWriter(output, fieldnames=data_list[0].keys())
-    writer.writeheader()
-    writer.writerows(data_list)
-    return output.getvalue()
+def record_run_metrics(body):
+    """Copy the record counts of a run (or shard) into the invocation metrics"""
+    records = body.get('records') or body.get('shard') or {}
+    for name in ['banks', 'accounts', 'transactions', 'shards']:
+        if name in records:
+            metrics.set(name, records[name])
 
 
-def upload_to_s3(data_list, dataset_name, timestamp):
-    """Upload data list to S3 as CSV"""
-    csv_content = dict_list_to_csv(data_list)
-    
-    date_partition = timestamp.strftime('%Y/%m/%d')
-    file_key = f"raw/{dataset_name}/{date_partition}/{dataset_name}_{timestamp.strftime('%Y%m%d_%H%M%S')}.csv"
-    
-    s3_client.put_object(
-        Bucket=S3_BUCKET_NAME,
-        Key=file_key,
-        Body=csv_content,
-        ContentType='text/csv'
-    )
-    
-    print(f"Uploaded {len(data_list)} records to s3://{S3_BUCKET_NAME}/{file_key}")
-    return file_key
+def record_endpoint_metrics():
+    """Copy the OBP session's per-endpoint stats and retry totals into the invocation metrics"""
+    endpoints = http_session.endpoint_summary()
+    metrics.set('http_retries', sum(stats['retries'] for stats in endpoints.values()))
+    metrics.set('http_failures', sum(stats['failures'] for stats in endpoints.values()))
+    metrics.set('obp_endpoints', endpoints)
 
 
 def lambda_handler(event, context):
-    """Main Lambda handler"""
-    print("Starting Banking Transaction Pipeline...")
+    """Main Lambda handler
+
+    event['mode'] selects 'single' (default), 'coordinator' or 'worker'.
+    """
+    log("Starting Banking Transaction Pipeline...")
+    event = event or {}
+    mode = event.get('mode', 'single')
+    metrics.reset(mode)
+    http_session.reset_stats()
     
     try:
-        timestamp = datetime.now()
-        
-        # Step 1: Authenticate
-        token = authenticate()
-        
-        # Step 2: Fetch real banks
-        banks_data = fetch_real_banks(token)
-        
-        # Step 3: Fetch real accounts
-        bank_ids_to_try = [bank['bank_id'] for bank in banks_data[:3]]
-        accounts_data = fetch_real_accounts(token, bank_ids_to_try)
-        
-        if not accounts_data:
-            print("No accounts found in first 3 banks, trying more...")
-            bank_ids_to_try = [bank['bank_id'] for bank in banks_data[:10]]
-            accounts_data = fetch_real_accounts(token, bank_ids_to_try)
-        
-        if not accounts_data:
-            raise Exception("No accounts found in any banks")
-        
-        # Step 4: Generate synthetic transactions
-        transactions_data = generate_synthetic_transactions(accounts_data, transactions_per_account=100)
-        
-        # Step 5: Upload to S3
-        banks_key = upload_to_s3(banks_data, 'banks', timestamp)
-        accounts_key = upload_to_s3(accounts_data, 'accounts', timestamp)
-        transactions_key = upload_to_s3(transactions_data, 'transactions', timestamp)
+        if mode == 'worker':
+            body = run_worker(event)
+        else:
+            timestamp = datetime.now()
+            output_format = event.get('output_format', settings.output_format)
+            transactions_per_account = int(event.get('transactions_per_account', settings.transactions_per_account))
+            # Explicit seed reproduces a run; otherwise pick one and report it
+            seed = int(event['seed']) if event.get('seed') is not None else new_run_seed()
+            incremental = bool(event.get('incremental', settings.incremental))
+            # Parquet compresses internally, so CSV compression only applies to CSV
+            compression = event.get('compression', settings.csv_compression) if output_format == 'csv' else None
+            source = event.get('source', settings.transaction_source)
+            from_date = event.get('from_date', settings.transactions_from_date)
+            to_date = event.get('to_date', settings.transactions_to_date)
+            
+            if output_format not in OUTPUT_FORMATS:
+                raise ValueError(f"Unsupported output format: {output_format}")
+            if compression and compression not in COMPRESSIONS:
+                raise ValueError(f"Unsupported compression: {compression}")
+            if source not in TRANSACTION_SOURCES:
+                raise ValueError(f"Unsupported transaction source: {source}")
+            if source == 'real' and incremental:
+                raise ValueError("Incremental mode only applies to synthetic transactions (use from_date for real ones)")
+            for bound in [from_date, to_date]:
+                if bound:
+                    datetime.fromisoformat(bound)  # fail before any work on a malformed date
+            
+            if mode == 'coordinator':
+                body = run_coordinator(
+                    event, context, timestamp, output_format, transactions_per_account, seed, incremental,
+                    compression, source, from_date, to_date
+                )
+            elif mode == 'single':
+                body = run_pipeline(
+                    timestamp, output_format, transactions_per_account, seed, incremental, compression,
+                    source, from_date, to_date
+                )
+            else:
+                raise ValueError(f"Unsupported mode: {mode}")
         
-        # Success response
-        result = {
+        record_run_metrics(body)
+        record_endpoint_metrics()
+        body['metrics'] = metrics.summary()
+        metrics.emit()
+        return {
             'statusCode': 200,
-            'body': json.dumps({
-                'message': 'Pipeline completed successfully',
-                'timestamp': timestamp.isoformat(),
-                'records': {
-                    'banks': len(banks_data),
-                    'accounts': len(accounts_data),
-                    'transactions': len(transactions_data)
-                },
-                's3_files': {
-                    'banks': banks_key,
-                    'accounts': accounts_key,
-                    'transactions': transactions_key
-                }
-            })
+            'body': json.dumps(body)
         }
         
-        print(f"Pipeline completed: {len(banks_data)} banks, {len(accounts_data)} accounts, {len(transactions_data)} transactions")
-        return result
-        
     except Exception as e:
-        print(f"Pipeline failed: {str(e)}")
+        log(f"Pipeline failed: {str(e)}")
         import traceback
         traceback.print_exc()
         
+        metrics.set('failed', True)
+        record_endpoint_metrics()
+        metrics.emit()
         return {
             'statusCode': 500,
             'body': json.dumps({
                 'message': 'Pipeline failed',
-                'error': str(e)
+                'error': str(e),
+                'metrics': metrics.summary()
             })
         }
-
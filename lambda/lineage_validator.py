@@ -0,0 +1,396 @@
+"""
+Streaming data lineage validation
+Checks chunk by chunk that every transaction references a known bank and
+(bank_id, account_id) pair and that transaction_id is unique, and reports the
+offending ids. Memory stays bounded for tens of millions of rows:
+
+- banks and accounts are kept as sorted arrays of 64-bit key hashes (8 bytes per key)
+- transaction ids go into a blocked Bloom filter (2 bytes per row); the few ids it
+  flags as possibly seen before are confirmed by counting them exactly in a second pass
+
+Usage:
+    python lineage_validator.py --local-s3 . --run 20261017_021955
+    python lineage_validator.py --s3-bucket my-bucket --from 2026-10-01 --json lineage.json
+"""
+
+import argparse
+import json
+from collections import Counter
+
+import numpy as np
+
+# FNV-1a over code points, finished with the MurmurHash3 64-bit mixer
+FNV_OFFSET = np.uint64(0xcbf29ce484222325)
+FNV_PRIME = np.uint64(0x100000001b3)
+BLOOM_SALT = np.uint64(0x9e3779b97f4a7c15)
+
+DEFAULT_EXPECTED_IDS = 10_000_000
+BLOOM_BITS_PER_KEY = 16
+BLOOM_HASHES = 8
+MAX_EXAMPLES = 20
+CHUNK_ROWS = 250_000
+
+
+def _mix(h):
+    h = h ^ (h >> np.uint64(33))
+    h = h * np.uint64(0xff51afd7ed558ccd)
+    h = h ^ (h >> np.uint64(33))
+    h = h * np.uint64(0xc4ceb9fe1a85ec53)
+    return h ^ (h >> np.uint64(33))
+
+
+def hash_strings(values):
+    """64-bit hash of each string in an array (vectorized over the strings' characters)"""
+    values = np.asarray(values)
+    if values.dtype.kind != 'U':
+        values = values.astype(str)
+    values = np.ascontiguousarray(values)
+    h = np.full(len(values), FNV_OFFSET)
+    if not len(values):
+        return h
+    # Fixed-width strings are zero-padded, and padding must not change the hash
+    for codes in values.view(np.uint32).reshape(len(values), -1).T:
+        h = np.where(codes != 0, (h ^ codes.astype(np.uint64)) * FNV_PRIME, h)
+    return _mix(h)
+
+
+def combine_hashes(h, other):
+    """Hash of a composite key from the hashes of its parts"""
+    return _mix((h * FNV_PRIME) ^ other)
+
+
+def hash_keys(*columns):
+    """64-bit hash of composite keys, one column of strings per key part"""
+    h = hash_strings(columns[0])
+    for column in columns[1:]:
+        h = combine_hashes(h, hash_strings(column))
+    return h
+
+
+class KeyIndex:
+    """Distinct 64-bit key hashes kept as one sorted array, for vectorized membership tests"""
+
+    def __init__(self):
+        self._parts = []
+        self._keys = np.array([], dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def keys(self):
+        if self._parts:
+            self._keys = np.unique(np.concatenate([self._keys] + self._parts))
+            self._parts = []
+        return self._keys
+
+    @property
+    def nbytes(self):
+        return self.keys.nbytes
+
+    def add(self, hashes):
+        if len(hashes):
+            self._parts.append(np.unique(hashes))
+            if len(self._parts) >= 64:  # merge now and then, so repeated keys don't pile up
+                self.keys
+
+    def contains(self, hashes):
+        keys = self.keys
+        if not len(keys):
+            return np.zeros(len(hashes), dtype=bool)
+        positions = np.minimum(np.searchsorted(keys, hashes), len(keys) - 1)
+        return keys[positions] == hashes
+
+
+class BloomFilter:
+    """Blocked Bloom filter over 64-bit hashes
+
+    Each key sets `hashes` bits within a single 64-bit word, so adding or testing
+    a key costs one random memory access instead of one per bit.
+    """
+
+    def __init__(self, capacity, bits_per_key=BLOOM_BITS_PER_KEY, hashes=BLOOM_HASHES):
+        self.capacity = capacity
+        self.hashes = hashes
+        self.count = 0
+        self.words = np.zeros(max(capacity * bits_per_key // 64, 1), dtype=np.uint64)
+
+    @property
+    def nbytes(self):
+        return self.words.nbytes
+
+    def contains(self, hashes):
+        index, mask = self._locate(hashes)
+        return (self.words[index] & mask) == mask
+
+    def add(self, hashes):
+        """Add distinct hashes; returns which of them were (possibly) present already"""
+        index, mask = self._locate(hashes)
+        seen = (self.words[index] & mask) == mask
+        # A fancy-indexed |= keeps only one write per repeated word, so retry until every bit is set
+        while len(index):
+            self.words[index] |= mask
+            missing = (self.words[index] & mask) != mask
+            index, mask = index[missing], mask[missing]
+        self.count += len(hashes)
+        return seen
+
+    def _locate(self, hashes):
+        index = (hashes % np.uint64(len(self.words))).astype(np.intp)
+        bits = _mix(hashes ^ BLOOM_SALT)
+        mask = np.zeros(len(hashes), dtype=np.uint64)
+        for i in range(self.hashes):
+            mask |= np.uint64(1) << ((bits >> np.uint64(6 * i)) & np.uint64(63))
+        return index, mask
+
+
+class UniqueIdChecker:
+    """Find duplicate ids in a stream with a Bloom filter, then confirm them exactly
+
+    add() flags hashes that repeat within a chunk or that the filter has probably
+    seen before; confirm() counts only those ids in a second pass over the stream,
+    which removes Bloom false positives. Filters are added as `expected` fills up,
+    so the false positive rate holds if the estimate is too low.
+    """
+
+    def __init__(self, expected=DEFAULT_EXPECTED_IDS):
+        self.expected = max(expected, 1)
+        self.filters = [BloomFilter(self.expected)]
+        self.candidates = KeyIndex()
+        self.rows = 0
+
+    @property
+    def nbytes(self):
+        return sum(bloom.nbytes for bloom in self.filters) + self.candidates.nbytes
+
+    def add(self, hashes):
+        self.rows += len(hashes)
+        unique, counts = np.unique(hashes, return_counts=True)
+        self.candidates.add(unique[counts > 1])
+
+        if self.filters[-1].count + len(unique) > self.filters[-1].capacity:
+            self.filters.append(BloomFilter(self.expected))
+        seen = self.filters[-1].add(unique)
+        for bloom in self.filters[:-1]:
+            seen |= bloom.contains(unique)
+        self.candidates.add(unique[seen])
+
+    def confirm(self, id_chunks):
+        """Exact counts of the candidate ids that occur more than once"""
+        counts = Counter()
+        if len(self.candidates):
+            for ids in id_chunks:
+                ids = np.asarray(ids)
+                counts.update(ids[self.candidates.contains(hash_strings(ids))].tolist())
+        return {value: count for value, count in counts.items() if count > 1}
+
+
+class OrphanTracker:
+    """Rows whose parent key is missing: row count, distinct keys and a few examples"""
+
+    def __init__(self, max_examples=MAX_EXAMPLES):
+        self.max_examples = max_examples
+        self.rows = 0
+        self.keys = KeyIndex()
+        self.examples = {}
+
+    def add(self, hashes, *key_parts):
+        """Record orphan rows by key hash; examples are their key parts joined with /"""
+        if not len(hashes):
+            return
+        self.rows += len(hashes)
+        self.keys.add(hashes)
+        if len(self.examples) < self.max_examples:
+            # Labels only for the first rows of keys not yet shown
+            keys, first_rows = np.unique(hashes, return_index=True)
+            for key, row in zip(keys.tolist(), np.sort(first_rows).tolist()):
+                if len(self.examples) >= self.max_examples:
+                    break
+                self.examples.setdefault(key, '/'.join(str(part[row]) for part in key_parts))
+
+    def to_dict(self):
+        return {'rows': self.rows, 'distinct': len(self.keys), 'examples': list(self.examples.values())}
+
+
+class LineageValidator:
+    """Referential integrity and transaction_id uniqueness over chunks of rows
+
+    Chunks are mappings of column name to values (a DataFrame, or a
+    TransactionBatch's columns). Add every bank and account chunk first, then
+    check the transaction chunks, then call confirm_duplicates() with a second
+    pass over the transaction ids.
+    """
+
+    def __init__(self, expected_transactions=DEFAULT_EXPECTED_IDS, max_examples=MAX_EXAMPLES):
+        self.banks = KeyIndex()
+        self.accounts = KeyIndex()
+        self.transaction_ids = UniqueIdChecker(expected_transactions)
+        self.orphan_banks = OrphanTracker(max_examples)
+        self.orphan_accounts = OrphanTracker(max_examples)
+        self.data_sources = {'banks': Counter(), 'accounts': Counter(), 'transactions': Counter()}
+        self.max_examples = max_examples
+        self.duplicates = None
+
+    def add_banks(self, chunk):
+        self.banks.add(hash_strings(chunk['bank_id']))
+        self._count_sources('banks', chunk)
+
+    def add_accounts(self, chunk):
+        self.accounts.add(hash_keys(chunk['bank_id'], chunk['account_id']))
+        self._count_sources('accounts', chunk)
+
+    def check_transactions(self, chunk):
+        bank_ids = np.asarray(chunk['bank_id'])
+        account_ids = np.asarray(chunk['account_id'])
+        bank_hashes = hash_strings(bank_ids)
+        account_hashes = combine_hashes(bank_hashes, hash_strings(account_ids))
+
+        orphan = ~self.banks.contains(bank_hashes)
+        self.orphan_banks.add(bank_hashes[orphan], bank_ids[orphan])
+        orphan = ~self.accounts.contains(account_hashes)
+        self.orphan_accounts.add(account_hashes[orphan], bank_ids[orphan], account_ids[orphan])
+
+        self.transaction_ids.add(hash_strings(chunk['transaction_id']))
+        self._count_sources('transactions', chunk)
+
+    def confirm_duplicates(self, id_chunks):
+        """Second pass over transaction_id chunks: count the ids the Bloom filter flagged"""
+        self.duplicates = self.transaction_ids.confirm(id_chunks)
+        return self.duplicates
+
+    def report(self):
+        if self.duplicates is None:
+            duplicates = {'confirmed': False, 'suspected': len(self.transaction_ids.candidates)}
+        else:
+            duplicates = {
+                'confirmed': True,
+                'rows': sum(self.duplicates.values()),
+                'distinct': len(self.duplicates),
+                'examples': dict(Counter(self.duplicates).most_common(self.max_examples))
+            }
+        passed = (not self.orphan_banks.rows and not self.orphan_accounts.rows
+                  and (duplicates.get('distinct', duplicates.get('suspected')) == 0))
+        return {
+            'passed': passed,
+            'banks': len(self.banks),
+            'accounts': len(self.accounts),
+            'transactions': self.transaction_ids.rows,
+            'data_sources': {name: dict(counts) for name, counts in self.data_sources.items()},
+            'orphan_banks': self.orphan_banks.to_dict(),
+            'orphan_accounts': self.orphan_accounts.to_dict(),
+            'duplicate_transaction_ids': duplicates,
+            'index_bytes': self.banks.nbytes + self.accounts.nbytes + self.transaction_ids.nbytes
+        }
+
+    def _count_sources(self, dataset, chunk):
+        if 'data_source' in chunk:
+            values, counts = np.unique(np.asarray(chunk['data_source']).astype(str), return_counts=True)
+            self.data_sources[dataset].update(dict(zip(values.tolist(), counts.tolist())))
+
+
+def frame_chunks(frame, rows=CHUNK_ROWS):
+    """Consecutive row slices of an in-memory DataFrame"""
+    return (frame.iloc[start:start + rows] for start in range(0, len(frame), rows))
+
+
+def validate_lineage(bank_chunks, account_chunks, transaction_chunks, transaction_id_chunks=None,
+                     expected_transactions=DEFAULT_EXPECTED_IDS, max_examples=MAX_EXAMPLES):
+    """Run a LineageValidator over chunk iterables and return its report
+
+    `transaction_id_chunks` is called with no arguments for the confirming second
+    pass (it must return the transaction_id values again, chunk by chunk); without
+    it, duplicates are only reported as suspected.
+    """
+    validator = LineageValidator(expected_transactions, max_examples)
+    for chunk in bank_chunks:
+        validator.add_banks(chunk)
+    for chunk in account_chunks:
+        validator.add_accounts(chunk)
+    for chunk in transaction_chunks:
+        validator.check_transactions(chunk)
+    if transaction_id_chunks is not None:
+        validator.confirm_duplicates(transaction_id_chunks())
+    return validator.report()
+
+
+def print_lineage_report(report):
+    """Print a report in the [SUCCESS]/[WARNING] style of the pipeline scripts"""
+    sources = report['data_sources']
+    for dataset in ['banks', 'accounts']:
+        if sources[dataset]:
+            print(f"[SUCCESS] {dataset.title()}: {sources[dataset].get('REAL_API', 0)}/{sum(sources[dataset].values())} REAL_API")
+    # Transactions are SYNTHETIC or, for runs with source 'real', REAL_API
+    if sources['transactions']:
+        counts = ', '.join(f"{count} {source}" for source, count in sorted(sources['transactions'].items()))
+        print(f"[SUCCESS] Transactions: {counts} of {report['transactions']}")
+
+    for name, parent in [('orphan_accounts', 'REAL accounts'), ('orphan_banks', 'REAL banks')]:
+        orphans = report[name]
+        if orphans['rows']:
+            print(f"[WARNING] {orphans['rows']} transactions reference {orphans['distinct']} unknown "
+                  f"{'accounts' if name == 'orphan_accounts' else 'banks'}, e.g. {', '.join(orphans['examples'][:5])}")
+        else:
+            print(f"[SUCCESS] All {report['transactions']} transactions linked to {parent}")
+
+    duplicates = report['duplicate_transaction_ids']
+    if not duplicates['confirmed']:
+        print(f"[WARNING] {duplicates['suspected']} transaction_ids possibly repeated (not confirmed)")
+    elif duplicates['distinct']:
+        examples = ', '.join(f"{value} (x{count})" for value, count in list(duplicates['examples'].items())[:5])
+        print(f"[WARNING] {duplicates['distinct']} transaction_ids repeated in {duplicates['rows']} rows, e.g. {examples}")
+    else:
+        print(f"[SUCCESS] All transaction_ids unique")
+    print(f"   Index memory: {report['index_bytes'] / 1024 / 1024:.1f} MiB")
+
+
+def main():
+    from dataset_reader import LocalFileStore, RunReader, S3ObjectStore
+
+    parser = argparse.ArgumentParser(description="Validate the lineage of stored pipeline runs in bounded memory")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--dir', help="Local directory (hybrid_*.csv output or a synced copy of the bucket)")
+    source.add_argument('--local-s3', metavar='DIR', help="Directory of the local S3 stand-in (local_test_* files)")
+    source.add_argument('--s3-bucket', help="S3 bucket written by the Lambda")
+    parser.add_argument('--from', dest='runs_from', help="First run date to include (YYYY-MM-DD)")
+    parser.add_argument('--to', dest='runs_to', help="Last run date to include (YYYY-MM-DD)")
+    parser.add_argument('--run', action='append', dest='run_ids',
+                        help="Only this run id, e.g. 20261017_021955 (repeatable). Backfill runs repeat "
+                             "transaction ids, so validate them one at a time")
+    parser.add_argument('--max-examples', type=int, default=MAX_EXAMPLES)
+    parser.add_argument('--json', dest='json_path', help="Also write the report to this JSON file")
+    args = parser.parse_args()
+
+    if args.dir:
+        store = LocalFileStore(args.dir)
+    elif args.local_s3:
+        from local_s3 import LocalS3Client
+        store = S3ObjectStore(LocalS3Client(args.local_s3, verbose=False), 'local-test-bucket')
+    else:
+        import boto3
+        store = S3ObjectStore(boto3.client('s3'), args.s3_bucket)
+
+    reader = RunReader(store, args.runs_from, args.runs_to, args.run_ids)
+    # Manifests know the row counts, which size the Bloom filter
+    expected = sum(entry.get('rows', 0) for entry in reader.objects('transactions')) or DEFAULT_EXPECTED_IDS
+
+    print("\n" + "=" * 60)
+    print("DATA LINEAGE VALIDATION")
+    print("=" * 60)
+    report = validate_lineage(
+        reader.read('banks', ['bank_id', 'data_source'], chunk_rows=CHUNK_ROWS),
+        reader.read('accounts', ['bank_id', 'account_id', 'data_source'], chunk_rows=CHUNK_ROWS),
+        reader.read('transactions', ['transaction_id', 'bank_id', 'account_id', 'data_source'], chunk_rows=CHUNK_ROWS),
+        lambda: (chunk['transaction_id'] for chunk in reader.read('transactions', ['transaction_id'], chunk_rows=CHUNK_ROWS)),
+        expected, args.max_examples
+    )
+    print_lineage_report(report)
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.json_path}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""
+Local stand-in for the Open Bank Project API
+Serves DirectLogin, /banks, /banks/{bank_id}/accounts/public and
+/banks/{bank_id}/accounts/{account_id}/{view}/transactions with limit/offset
+paging (and from_date/to_date), a configurable number of banks and accounts,
+artificial per-request latency and injected faults (5xx, 429 with Retry-After,
+dropped connections, slow responses, malformed amounts), so the pipeline can be
+run, benchmarked and tested for resilience without the OBP sandbox
+
+Run standalone:
+    python local_obp_server.py --banks 50 --accounts-per-bank 20 --latency-ms 30
+    python local_obp_server.py --error-rate 0.1 --throttle-rate 0.05 --drop-rate 0.02
+    python local_obp_server.py --malformed-every 7
+then point OBP_BASE_URL / OBP_DIRECTLOGIN_ENDPOINT at the printed URLs
+"""
+
+import argparse
+import json
+import random
+import socket
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+LOCAL_TOKEN = 'local-directlogin-token'
+
+# Transactions of every account start here, one every TRANSACTION_INTERVAL
+FIRST_TRANSACTION_DATE = datetime(2026, 1, 1)
+TRANSACTION_INTERVAL = timedelta(hours=7)
+TRANSACTION_TYPES = ['SEPA', 'CARD', 'TRANSFER', 'DIRECT_DEBIT']
+# Amounts sent in turn by `malformed_every` (None leaves the amount out)
+MALFORMED_AMOUNTS = [None, '', 'n/a', 'NaN', 'inf', '12,50']
+
+
+class LocalOBPServer:
+    """Threaded HTTP server imitating the OBP endpoints the pipeline calls
+
+    Bank ids are bank-00000, bank-00001, ...; account ids are <bank_id>-acc-00000, ...
+    Each account has `transactions_per_account` deterministic transactions; every
+    fourth account (acc-00003, acc-00007, ...) has no public view, only 'owner'.
+    Use as a context manager, or call start() and stop().
+
+    Faults are drawn per request (seeded by `seed`): `error_rate` answers 503,
+    `throttle_rate` answers 429 with Retry-After: `retry_after` seconds,
+    `drop_rate` closes the connection without a response and `slow_rate` waits
+    `slow_seconds` before answering. The first `fail_first` requests to each
+    endpoint answer 503. Injected faults are counted in `faults`.
+
+    With `malformed_every`, every Nth transaction of an account carries one of
+    MALFORMED_AMOUNTS instead of its amount (the same ones on every request).
+    """
+
+    def __init__(self, banks=10, accounts_per_bank=5, latency=0.0, host='127.0.0.1', port=0,
+                 transactions_per_account=20, error_rate=0.0, throttle_rate=0.0, drop_rate=0.0, slow_rate=0.0, slow_seconds=5.0,
+                 retry_after=0, fail_first=0, malformed_every=0, seed=None):
+        self.banks = banks
+        self.accounts_per_bank = accounts_per_bank
+        self.latency = latency
+        self.transactions_per_account = transactions_per_account
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.drop_rate = drop_rate
+        self.slow_rate = slow_rate
+        self.slow_seconds = slow_seconds
+        self.retry_after = retry_after
+        self.fail_first = fail_first
+        self.malformed_every = malformed_every
+        self.requests = Counter()
+        self.faults = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
+        return False
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def directlogin_endpoint(self):
+        return f"{self.base_url}/my/logins/direct"
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def start(self):
+        """Serve from a background thread"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def count(self, endpoint):
+        """Count a request; returns how many requests the endpoint has had, this one included"""
+        with self._lock:
+            self.requests[endpoint] += 1
+            return self.requests[endpoint]
+
+    def draw_fault(self, endpoint, request_number):
+        """Fault to inject into this request: 'error', 'throttle', 'drop', 'slow' or None"""
+        with self._lock:
+            if request_number <= self.fail_first:
+                fault = 'error'
+            else:
+                draw = self._random.random()
+                fault = None
+                for name, rate in (('error', self.error_rate), ('throttle', self.throttle_rate),
+                                   ('drop', self.drop_rate), ('slow', self.slow_rate)):
+                    if draw < rate:
+                        fault = name
+                        break
+                    draw -= rate
+            if fault:
+                self.faults[fault] += 1
+            return fault
+
+    def bank_ids(self):
+        return [f"bank-{i:05d}" for i in range(self.banks)]
+
+    def account_ids(self, bank_id):
+        return [f"{bank_id}-acc-{j:05d}" for j in range(self.accounts_per_bank)]
+
+    def has_account(self, bank_id, account_id):
+        prefix = f"{bank_id}-acc-"
+        return (bank_id.startswith('bank-') and bank_id[5:].isdigit() and int(bank_id[5:]) < self.banks
+                and account_id.startswith(prefix) and account_id[len(prefix):].isdigit()
+                and int(account_id[len(prefix):]) < self.accounts_per_bank)
+
+    def transactions(self, bank_id, account_id):
+        """All transactions of an account in OBP's nested format, oldest first"""
+        number = int(account_id[-5:])
+        balance = 1000.0 + 37 * number
+        transactions = []
+        for i in range(self.transactions_per_account):
+            amount = round(((i * 7919 + number * 104729) % 20000 - 12000) / 100, 2)
+            balance = round(balance + amount, 2)
+            date = (FIRST_TRANSACTION_DATE + i * TRANSACTION_INTERVAL).strftime('%Y-%m-%dT%H:%M:%SZ')
+            value = {'currency': 'EUR', 'amount': f"{amount:.2f}"}
+            if self.malformed_every and (i + 1) % self.malformed_every == 0:
+                malformed = MALFORMED_AMOUNTS[(i // self.malformed_every + number) % len(MALFORMED_AMOUNTS)]
+                if malformed is None:
+                    del value['amount']
+                else:
+                    value['amount'] = malformed
+            transactions.append({
+                'id': f"{account_id}-tx-{i:06d}",
+                'this_account': {'id': account_id, 'bank_id': bank_id},
+                'other_account': {'id': f"other-{i % 50:03d}", 'holder': {'name': f"Counterparty {i % 50}"}},
+                'details': {
+                    'type': TRANSACTION_TYPES[i % len(TRANSACTION_TYPES)],
+                    'description': f"Local transaction {i}",
+                    'posted': date,
+                    'completed': date,
+                    'new_balance': {'currency': 'EUR', 'amount': f"{balance:.2f}"},
+                    'value': value
+                }
+            })
+        return transactions
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out in separate writes; without this, Nagle's
+            # algorithm and delayed ACKs add ~40-200 ms to every keep-alive request
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                request_number = server.count('directlogin')
+                time.sleep(server.latency)
+                self._discard_body()
+                if self._inject_fault('directlogin', request_number):
+                    return
+                if urlparse(self.path).path.endswith('/logins/direct') and 'username=' in self.headers.get('Authorization', ''):
+                    self._send(201, {'token': LOCAL_TOKEN})
+                else:
+                    self._send(401, {'message': 'OBP-20001: User not logged in. Authentication is required!'})
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                parts = url.path.strip('/').split('/')
+                time.sleep(server.latency)
+
+                if f'token="{LOCAL_TOKEN}"' not in self.headers.get('Authorization', ''):
+                    server.count('unauthorized')
+                    self._send(401, {'message': 'OBP-20001: User not logged in. Authentication is required!'})
+                elif len(parts) == 3 and parts[0] == 'obp' and parts[2] == 'banks':
+                    if self._inject_fault('banks', server.count('banks')):
+                        return
+                    banks = [{'id': bank_id, 'short_name': bank_id, 'full_name': f"Local Bank {bank_id[5:]}"}
+                             for bank_id in self._page(url, server.bank_ids())]
+                    self._send(200, {'banks': banks})
+                elif len(parts) == 6 and parts[0] == 'obp' and parts[2] == 'banks' and parts[4:] == ['accounts', 'public']:
+                    if self._inject_fault('accounts', server.count('accounts')):
+                        return
+                    bank_id = parts[3]
+                    accounts = [{'id': account_id, 'label': f"Account {account_id[-5:]}", 'bank_id': bank_id}
+                                for account_id in self._page(url, server.account_ids(bank_id))]
+                    self._send(200, {'accounts': accounts})
+                elif len(parts) == 8 and parts[0] == 'obp' and parts[2] == 'banks' and parts[4] == 'accounts' \
+                        and parts[7] == 'transactions':
+                    if self._inject_fault('transactions', server.count('transactions')):
+                        return
+                    bank_id, account_id, view = parts[3], parts[5], parts[6]
+                    if not server.has_account(bank_id, account_id):
+                        self._send(404, {'message': f"OBP-30018: Bank Account not found. {bank_id}/{account_id}"})
+                    elif view not in ('public', 'owner') or (view == 'public' and int(account_id[-5:]) % 4 == 3):
+                        self._send(403, {'message': f"OBP-20017: Current user does not have access to the view {view}"})
+                    else:
+                        self._send(200, {'transactions': self._page(url, self._in_range(
+                            url, server.transactions(bank_id, account_id)))})
+                else:
+                    server.count('not_found')
+                    self._send(404, {'message': f"OBP-10404: {url.path} not found"})
+
+            def _inject_fault(self, endpoint, request_number):
+                """Apply a drawn fault; True when the response has been sent (or the connection dropped)"""
+                fault = server.draw_fault(endpoint, request_number)
+                if fault == 'slow':
+                    time.sleep(server.slow_seconds)
+                elif fault == 'error':
+                    self._send(503, {'message': 'OBP-50000: Unknown Error.'})
+                elif fault == 'throttle':
+                    self._send(429, {'message': 'OBP-10018: Too Many Requests.'},
+                               {'Retry-After': str(server.retry_after)})
+                elif fault == 'drop':
+                    self.close_connection = True
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                return fault in ('error', 'throttle', 'drop')
+
+            def _in_range(self, url, transactions):
+                """Apply from_date/to_date and sort_direction (OBP's default order is newest first)"""
+                query = parse_qs(url.query)
+                start = query.get('from_date', [''])[0][:19]
+                end = query.get('to_date', [''])[0][:19]
+                selected = [t for t in transactions
+                            if (not start or t['details']['completed'][:19] >= start)
+                            and (not end or t['details']['completed'][:19] <= end)]
+                if query.get('sort_direction', ['DESC'])[0].upper() != 'ASC':
+                    selected.reverse()
+                return selected
+
+            def _page(self, url, items):
+                query = parse_qs(url.query)
+                offset = int(query.get('offset', [0])[0])
+                limit = int(query.get('limit', [len(items)])[0])
+                return items[offset:offset + limit]
+
+            def _discard_body(self):
+                length = int(self.headers.get('Content-Length', 0))
+                if length:
+                    self.rfile.read(length)
+
+            def _send(self, status, payload, headers=None):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                try:
+                    self.end_headers()
+                    self.wfile.write(body)
+                except ConnectionError:
+                    # The client gave up first (read timeout on a slow response)
+                    self.close_connection = True
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the OBP DirectLogin, banks, accounts and transactions endpoints")
+    parser.add_argument('--banks', type=int, default=10)
+    parser.add_argument('--accounts-per-bank', type=int, default=5)
+    parser.add_argument('--transactions-per-account', type=int, default=20)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="Delay added to every request")
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument('--retry-after', type=int, default=1, help="Retry-After seconds sent with 429 (default: 1)")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="Fraction of connections closed without a response")
+    parser.add_argument('--slow-rate', type=float, default=0.0, help="Fraction of requests delayed by --slow-seconds")
+    parser.add_argument('--slow-seconds', type=float, default=5.0)
+    parser.add_argument('--fail-first', type=int, default=0, help="Answer the first N requests per endpoint with 503")
+    parser.add_argument('--malformed-every', type=int, default=0,
+                        help="Send a missing or malformed amount for every Nth transaction of each account")
+    parser.add_argument('--seed', type=int, help="Seed for fault injection")
+    args = parser.parse_args()
+
+    server = LocalOBPServer(args.banks, args.accounts_per_bank, args.latency_ms / 1000, port=args.port,
+                            transactions_per_account=args.transactions_per_account,
+                            error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+                            drop_rate=args.drop_rate, slow_rate=args.slow_rate, slow_seconds=args.slow_seconds,
+                            retry_after=args.retry_after, fail_first=args.fail_first,
+                            malformed_every=args.malformed_every, seed=args.seed)
+    print(f"OBP_BASE_URL={server.base_url}")
+    print(f"OBP_DIRECTLOGIN_ENDPOINT={server.directlogin_endpoint}")
+    print("Serving until Ctrl+C...")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
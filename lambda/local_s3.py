@@ -0,0 +1,140 @@
+"""
+Local stand-in for the boto3 S3 client
+Implements the calls the pipeline makes (put/get/list objects and multipart uploads),
+saving objects as local files or, for benchmarks, only counting their bytes
+
+Used by test_lambda_locally.py, benchmark_pipeline.py and dataset_reader.py
+"""
+
+import os
+import time
+from io import BytesIO
+
+from metrics import log
+
+
+class NoSuchKey(Exception):
+    """Raised by get_object for keys that were never written"""
+
+
+class InvalidObjectState(Exception):
+    """Raised by S3 get_object for archived (GLACIER) objects; never raised locally"""
+
+
+class LocalS3Client:
+    """In-process S3 client that writes objects to `directory`
+
+    Objects are saved as files named local_test_<key with / replaced by _>.
+    With discard=True nothing is written to disk and only object sizes are kept,
+    so large benchmark runs are not limited by local disk or memory. `latency`
+    (seconds per request) and `bandwidth` (bytes per second) simulate upload cost.
+    """
+
+    class exceptions:
+        NoSuchKey = NoSuchKey
+        InvalidObjectState = InvalidObjectState
+
+    def __init__(self, directory='.', discard=False, latency=0.0, bandwidth=None, verbose=True):
+        self.directory = directory
+        self.discard = discard
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.verbose = verbose
+
+        self.object_sizes = {}
+        self.request_count = 0
+        self.request_seconds = 0.0
+
+        # In-progress multipart uploads: UploadId -> {PartNumber: bytes (or size when discarding)}
+        self.multipart_uploads = {}
+
+    def local_file_for(self, key):
+        return os.path.join(self.directory, f"local_test_{key.replace('/', '_')}")
+
+    def put_object(self, Bucket, Key, Body, ContentType=None, **kwargs):
+        """Save a whole object"""
+        if isinstance(Body, str):
+            Body = Body.encode('utf-8')
+        self._request(len(Body))
+        self._save(Key, [Body])
+        return {'ETag': 'mock-etag'}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        """Read back an object saved by put_object or a multipart upload"""
+        self._request(0)
+        local_file = self.local_file_for(Key)
+        if self.discard or not os.path.exists(local_file):
+            raise NoSuchKey(Key)
+        with open(local_file, 'rb') as f:
+            return {'Body': BytesIO(f.read())}
+
+    def list_objects_v2(self, Bucket, Prefix='', **kwargs):
+        """List the keys under Prefix (always a single page)
+
+        Keys written by this client are listed as written. Files left in `directory`
+        by earlier runs are listed as Prefix plus the rest of the file name, since
+        '/' and '_' look the same there; get_object maps that key to the same file.
+        """
+        self._request(0)
+        keys = {key for key in self.object_sizes if key.startswith(Prefix)}
+        if not self.discard and os.path.isdir(self.directory):
+            file_prefix = os.path.basename(self.local_file_for(Prefix))
+            known_files = {os.path.basename(self.local_file_for(key)) for key in keys}
+            for name in os.listdir(self.directory):
+                if name.startswith(file_prefix) and name not in known_files:
+                    keys.add(Prefix + name[len(file_prefix):])
+
+        contents = [
+            {'Key': key, 'Size': self.object_sizes.get(key, 0) if self.discard else os.path.getsize(self.local_file_for(key))}
+            for key in sorted(keys)
+        ]
+        return {'Contents': contents, 'KeyCount': len(contents), 'IsTruncated': False}
+
+    def create_multipart_upload(self, Bucket, Key, ContentType=None, **kwargs):
+        self._request(0)
+        upload_id = f"mock-upload-{len(self.multipart_uploads) + 1}-{time.monotonic_ns()}"
+        self.multipart_uploads[upload_id] = {}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        """Keep the part until completion (only its size when discarding)"""
+        self._request(len(Body))
+        self.multipart_uploads[UploadId][PartNumber] = len(Body) if self.discard else Body
+        return {'ETag': f'mock-etag-{PartNumber}'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        """Join the parts, in the order given, into one object"""
+        self._request(0)
+        parts = self.multipart_uploads.pop(UploadId)
+        self._save(Key, [parts[part['PartNumber']] for part in MultipartUpload['Parts']])
+        return {'ETag': 'mock-etag'}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        self._request(0)
+        self.multipart_uploads.pop(UploadId, None)
+        return {}
+
+    @property
+    def bytes_written(self):
+        return sum(self.object_sizes.values())
+
+    def _request(self, size):
+        """Count a request and sleep for its simulated latency and transfer time"""
+        delay = self.latency + (size / self.bandwidth if self.bandwidth else 0.0)
+        if delay:
+            time.sleep(delay)
+        self.request_count += 1
+        self.request_seconds += delay
+
+    def _save(self, key, chunks):
+        if self.discard:
+            self.object_sizes[key] = sum(chunk if isinstance(chunk, int) else len(chunk) for chunk in chunks)
+            return
+
+        local_file = self.local_file_for(key)
+        with open(local_file, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        self.object_sizes[key] = os.path.getsize(local_file)
+        if self.verbose:
+            log(f"[LOCAL TEST] Saved {len(chunks)} part(s) to: {local_file}")
@@ -0,0 +1,215 @@
+"""
+Lightweight run instrumentation for the pipeline
+Times each stage, counts HTTP and S3 requests and bytes, records peak memory,
+and emits the result as one CloudWatch Embedded Metric Format (EMF) log line
+"""
+
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows (local runs only)
+    resource = None
+
+DEFAULT_NAMESPACE = 'BankingTransactionPipeline'
+
+# S3 client calls whose Body counts towards bytes written
+S3_WRITE_OPERATIONS = {'put_object', 'upload_part'}
+
+
+def log(message):
+    """Print one whole line in a single write, so lines from concurrent stages never run together
+
+    print() writes the text and its newline separately, letting another thread's
+    output land in between.
+    """
+    sys.stdout.write(f"{message}\n")
+    sys.stdout.flush()
+
+
+def peak_memory_mb():
+    """Peak resident memory of this process in MiB (for a warm Lambda container, since it started)"""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class PipelineMetrics:
+    """Stage timings and request counters for one invocation
+
+    Stage times are exclusive: time spent in a stage nested inside another (for
+    example S3 uploads inside serialization, or account discovery pulled lazily
+    by generation) is counted only for the inner stage. Stages running in worker
+    threads are added to the totals as well, so the sum can exceed wall time.
+    """
+
+    def __init__(self, namespace=DEFAULT_NAMESPACE):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self, mode=None):
+        """Start a new invocation"""
+        with self._lock:
+            self.mode = mode
+            self.started = time.perf_counter()
+            self.stage_seconds = {}
+            self.values = {}
+            self.http_requests = 0
+            self.http_errors = 0
+            self.http_seconds = 0.0
+            self.http_max_seconds = 0.0
+            self.s3_requests = 0
+            self.s3_bytes_written = 0
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block as `name` (nested stages are subtracted from the enclosing one)"""
+        stack = self._stack()
+        frame = [name, 0.0]
+        stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            if stack:
+                stack[-1][1] += elapsed
+            with self._lock:
+                self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + elapsed - frame[1]
+
+    def timed_iter(self, name, iterable):
+        """Yield from `iterable`, timing the production of each item as stage `name`"""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                item = next(iterator, StopIteration)
+            if item is StopIteration:
+                return
+            yield item
+
+    def set(self, name, value):
+        """Record a run-level value such as a row count"""
+        with self._lock:
+            self.values[name] = value
+
+    def add(self, name, count):
+        """Add to a run-level count (from any thread)"""
+        with self._lock:
+            self.values[name] = self.values.get(name, 0) + count
+
+    def record_http(self, response, *args, **kwargs):
+        """requests response hook: count the request and its latency"""
+        seconds = response.elapsed.total_seconds()
+        with self._lock:
+            self.http_requests += 1
+            self.http_seconds += seconds
+            self.http_max_seconds = max(self.http_max_seconds, seconds)
+            if response.status_code >= 400:
+                self.http_errors += 1
+
+    def instrument_session(self, session):
+        """Record every request made through a requests Session"""
+        session.hooks['response'].append(self.record_http)
+        return session
+
+    def instrument_s3_client(self, s3_client, stage='upload'):
+        """Wrap an S3 client so each call is timed as `stage` and uploaded bytes are counted"""
+        return InstrumentedS3Client(s3_client, self, stage)
+
+    def summary(self):
+        """Metrics of the current invocation as a JSON-serializable dict"""
+        with self._lock:
+            return {
+                'mode': self.mode,
+                'duration_seconds': round(time.perf_counter() - self.started, 3),
+                'stages_seconds': {name: round(seconds, 3) for name, seconds in self.stage_seconds.items()},
+                'peak_memory_mb': round(peak_memory_mb(), 1) if resource else None,
+                'http': {
+                    'requests': self.http_requests,
+                    'errors': self.http_errors,
+                    'total_seconds': round(self.http_seconds, 3),
+                    'max_seconds': round(self.http_max_seconds, 3),
+                    'mean_ms': round(1000 * self.http_seconds / self.http_requests, 1) if self.http_requests else None
+                },
+                's3': {
+                    'requests': self.s3_requests,
+                    'bytes_written': self.s3_bytes_written
+                },
+                **self.values
+            }
+
+    def emf_record(self, dimensions=None):
+        """The summary as a CloudWatch Embedded Metric Format document"""
+        summary = self.summary()
+        dimensions = {'Mode': summary['mode'] or 'unknown', **(dimensions or {})}
+
+        metrics = {'DurationSeconds': (summary['duration_seconds'], 'Seconds')}
+        for name, seconds in summary['stages_seconds'].items():
+            metrics[f"{name.title().replace('_', '')}Seconds"] = (seconds, 'Seconds')
+        if summary['peak_memory_mb'] is not None:
+            metrics['PeakMemoryMB'] = (summary['peak_memory_mb'], 'Megabytes')
+        metrics['HttpRequests'] = (summary['http']['requests'], 'Count')
+        metrics['HttpErrors'] = (summary['http']['errors'], 'Count')
+        metrics['HttpMaxLatencySeconds'] = (summary['http']['max_seconds'], 'Seconds')
+        metrics['S3Requests'] = (summary['s3']['requests'], 'Count')
+        metrics['S3BytesWritten'] = (summary['s3']['bytes_written'], 'Bytes')
+        for name, value in self.values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                metrics[name.title().replace('_', '')] = (value, 'Count')
+
+        return {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': self.namespace,
+                    'Dimensions': [list(dimensions)],
+                    'Metrics': [{'Name': name, 'Unit': unit} for name, (_, unit) in metrics.items()]
+                }]
+            },
+            **dimensions,
+            **{name: value for name, (value, _) in metrics.items()},
+            'summary': summary
+        }
+
+    def emit(self, dimensions=None):
+        """Print the EMF document as a single log line (CloudWatch extracts the metrics)"""
+        log(json.dumps(self.emf_record(dimensions)))
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+
+class InstrumentedS3Client:
+    """Proxy around a boto3 S3 client that times calls and counts uploaded bytes"""
+
+    def __init__(self, s3_client, metrics, stage):
+        self._client = s3_client
+        self._metrics = metrics
+        self._stage = stage
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        # Only API calls are timed; attributes such as `exceptions` pass through
+        if not callable(attribute) or isinstance(attribute, type) or name.startswith('_'):
+            return attribute
+
+        metrics, stage = self._metrics, self._stage
+
+        def call(*args, **kwargs):
+            with metrics.stage(stage):
+                result = attribute(*args, **kwargs)
+            with metrics._lock:
+                metrics.s3_requests += 1
+                if name in S3_WRITE_OPERATIONS:
+                    metrics.s3_bytes_written += len(kwargs.get('Body') or b'')
+            return result
+        return call
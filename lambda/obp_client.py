@@ -0,0 +1,551 @@
+"""
+Shared HTTP helpers for the Open Bank Project API
+One keep-alive Session per process (with timeouts, retries and a concurrency
+limit), a cached DirectLogin token, and concurrent per-bank requests
+"""
+
+import email.utils
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from itertools import islice
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import log
+
+# Upper bound on concurrent requests (and pooled connections) per host
+DEFAULT_MAX_WORKERS = 8
+
+# Connect and read timeouts in seconds for every OBP request
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 30
+
+# Throttled and unavailable responses (and connection errors/timeouts) are retried
+# with jittered exponential backoff, or after the server's Retry-After
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_BACKOFF_BASE = 0.5
+DEFAULT_BACKOFF_MAX = 20.0
+# A longer Retry-After is treated as a failure rather than waited out
+DEFAULT_MAX_RETRY_AFTER = 60.0
+
+# How long a DirectLogin token is reused before logging in again (a 401 forces it sooner)
+DEFAULT_TOKEN_TTL = 24 * 3600
+TOKEN_EXPIRY_MARGIN = 60
+
+# Items requested per page from paginated OBP endpoints
+DEFAULT_PAGE_SIZE = 100
+
+# Account views tried, in order, when fetching transactions ('owner' needs account access)
+DEFAULT_TRANSACTION_VIEWS = ('public', 'owner')
+
+
+class OBPRequestError(Exception):
+    """Non-200 response from an OBP endpoint"""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delay in seconds or an HTTP date), or None"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class RetryPolicy:
+    """When to retry a request, and how long to wait first"""
+
+    def __init__(self, max_retries=DEFAULT_MAX_RETRIES, backoff_base=DEFAULT_BACKOFF_BASE,
+                 backoff_max=DEFAULT_BACKOFF_MAX, max_retry_after=DEFAULT_MAX_RETRY_AFTER,
+                 statuses=RETRY_STATUSES, seed=None):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retry_after = max_retry_after
+        self.statuses = statuses
+        self._random = random.Random(seed)
+
+    def delay(self, retry, response=None):
+        """Seconds to wait before retry number `retry` (1, 2, ...), or None to give up"""
+        if retry > self.max_retries:
+            return None
+        retry_after = parse_retry_after(response.headers.get('Retry-After')) if response is not None else None
+        if retry_after is not None:
+            return retry_after if retry_after <= self.max_retry_after else None
+        # Full jitter: concurrent workers that failed together retry at different times
+        return self._random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (retry - 1)))
+
+
+def endpoint_name(url):
+    """Endpoint template of an OBP URL for metrics, e.g. /banks/{bank_id}/accounts/public"""
+    path = re.sub(r'^/obp/v[^/]+', '', urlparse(url).path)
+    path = re.sub(r'/banks/[^/]+', '/banks/{bank_id}', path)
+    return re.sub(r'/accounts/(?!public$|private$)[^/]+', '/accounts/{account_id}', path) or '/'
+
+
+class EndpointStats:
+    """Attempts, retries, failures, status codes and latencies of one endpoint"""
+
+    def __init__(self):
+        self.attempts = 0
+        self.retries = 0
+        self.failures = 0
+        self.outcomes = Counter()
+        self.latencies = []
+
+    def to_dict(self):
+        latencies = sorted(self.latencies)
+
+        def percentile_ms(q):
+            return round(1000 * latencies[min(int(q * len(latencies)), len(latencies) - 1)], 1) if latencies else None
+
+        return {
+            'attempts': self.attempts,
+            'retries': self.retries,
+            'failures': self.failures,
+            'outcomes': {str(outcome): count for outcome, count in self.outcomes.items()},
+            'mean_ms': round(1000 * sum(latencies) / len(latencies), 1) if latencies else None,
+            'p50_ms': percentile_ms(0.5),
+            'p95_ms': percentile_ms(0.95),
+            'max_ms': round(1000 * latencies[-1], 1) if latencies else None
+        }
+
+
+class OBPSession(requests.Session):
+    """requests Session with timeouts, retries, a concurrency limit and per-endpoint stats
+
+    Every request gets `timeout` (connect, read) unless the caller passes one, and
+    waits for one of `max_concurrent` slots. Responses with a status in
+    `retry.statuses`, connection errors and timeouts are retried after the
+    server's Retry-After or a jittered exponential backoff; the slot is released
+    while waiting. The last response is returned (or the last error raised) once
+    the policy gives up, so callers still see the status code.
+    """
+
+    def __init__(self, max_concurrent=DEFAULT_MAX_WORKERS, timeout=(DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT),
+                 retry=None):
+        super().__init__()
+        self.timeout = timeout
+        self.retry = retry or RetryPolicy()
+        self.endpoint_stats = {}
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._stats_lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        endpoint = endpoint_name(url)
+        retry = 0
+
+        while True:
+            response, error = None, None
+            with self._slots:
+                start = time.perf_counter()
+                try:
+                    response = super().request(method, url, **kwargs)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    error = e
+                elapsed = time.perf_counter() - start
+
+            retryable = error is not None or response.status_code in self.retry.statuses
+            delay = self.retry.delay(retry + 1, response) if retryable else None
+            self._record(endpoint, type(error).__name__ if error else response.status_code, elapsed,
+                         retried=delay is not None, failed=retryable and delay is None)
+
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response
+            if response is not None:
+                response.close()
+            retry += 1
+            time.sleep(delay)
+
+    def endpoint_summary(self):
+        """Per-endpoint stats as a JSON-serializable dict"""
+        with self._stats_lock:
+            return {endpoint: stats.to_dict() for endpoint, stats in sorted(self.endpoint_stats.items())}
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.endpoint_stats = {}
+
+    def _record(self, endpoint, outcome, elapsed, retried, failed):
+        with self._stats_lock:
+            stats = self.endpoint_stats.setdefault(endpoint, EndpointStats())
+            stats.attempts += 1
+            stats.retries += retried
+            stats.failures += failed
+            stats.outcomes[outcome] += 1
+            stats.latencies.append(elapsed)
+
+
+def create_session(pool_size=DEFAULT_MAX_WORKERS, timeout=(DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT),
+                   retry=None):
+    """Create an OBPSession whose connection pool and concurrency limit fit concurrent fetching"""
+    session = OBPSession(pool_size, timeout, retry)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['Accept'] = 'application/json'
+    return session
+
+
+def token_headers(token):
+    """Headers for an authenticated DirectLogin request"""
+    return {
+        "Authorization": f'DirectLogin token="{token}"',
+        "Accept": "application/json"
+    }
+
+
+class FileTokenStore:
+    """Persist the token record as JSON in a local file
+
+    The file is readable by its owner only (0600), and is replaced in one step,
+    so a concurrent load() never sees a half-written record.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save(self, record):
+        # Unique per writer, in the same directory so os.replace stays a rename
+        temp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with os.fdopen(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
+                json.dump(record, f)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+
+class S3TokenStore:
+    """Persist the token record as a JSON object in S3"""
+
+    def __init__(self, s3_client, bucket, key):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+
+    def load(self):
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=self.key)
+            return json.loads(response['Body'].read())
+        except self.s3_client.exceptions.NoSuchKey:
+            return None
+
+    def save(self, record):
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=self.key,
+            Body=json.dumps(record).encode('utf-8'),
+            ContentType='application/json'
+        )
+
+
+def token_store_from_spec(spec, s3_client=None, bucket=None):
+    """Build a token store from 'file:<path>' or 's3:<key>'; empty spec means memory only"""
+    if not spec:
+        return None
+    kind, _, location = spec.partition(':')
+    if kind == 'file':
+        return FileTokenStore(location)
+    elif kind == 's3':
+        return S3TokenStore(s3_client, bucket, location)
+    raise ValueError(f"Unsupported token cache: {spec}")
+
+
+class TokenCache:
+    """In-memory token with an expiry time, optionally backed by a persistent store
+
+    Create it at module scope so warm Lambda containers reuse the token.
+    """
+
+    def __init__(self, ttl=DEFAULT_TOKEN_TTL, store=None):
+        self.ttl = ttl
+        self.store = store
+        self._record = None
+
+    def get(self):
+        """Return the cached token, or None if missing or about to expire"""
+        if not self._is_valid(self._record) and self.store is not None:
+            self._record = self.store.load()
+        if self._is_valid(self._record):
+            return self._record['token']
+        return None
+
+    def set(self, token):
+        self._record = {'token': token, 'expires_at': time.time() + self.ttl}
+        if self.store is not None:
+            self.store.save(self._record)
+
+    def invalidate(self):
+        self._record = None
+        if self.store is not None:
+            self.store.save({})
+
+    @staticmethod
+    def _is_valid(record):
+        return bool(record) and record.get('expires_at', 0) - TOKEN_EXPIRY_MARGIN > time.time()
+
+
+class DirectLoginAuth:
+    """DirectLogin credentials plus a TokenCache
+
+    Logs in only when the cache has no valid token, and logs in again
+    (once) when a request comes back 401.
+    """
+
+    def __init__(self, session, endpoint, username, password, consumer_key, cache=None):
+        self.session = session
+        self.endpoint = endpoint
+        self.username = username
+        self.password = password
+        self.consumer_key = consumer_key
+        self.cache = cache or TokenCache()
+        self.login_count = 0
+        self._lock = threading.Lock()
+
+    def login(self):
+        """POST to the DirectLogin endpoint and cache the new token"""
+        headers = {
+            "Authorization": f'DirectLogin username="{self.username}", password="{self.password}", consumer_key="{self.consumer_key}"',
+            "Accept": "application/json"
+        }
+
+        response = self.session.post(self.endpoint, headers=headers)
+
+        if response.status_code == 201:
+            token = response.json()["token"]
+            self.cache.set(token)
+            self.login_count += 1
+            return token
+        else:
+            raise Exception(f"Authentication failed: {response.status_code}")
+
+    def token(self):
+        """Return a valid token, logging in only if the cache is empty or expired"""
+        with self._lock:
+            return self.cache.get() or self.login()
+
+    def refresh(self, stale_token):
+        """Replace a token the server rejected (concurrent callers share one login)"""
+        with self._lock:
+            current = self.cache.get()
+            if current and current != stale_token:
+                return current
+            self.cache.invalidate()
+            return self.login()
+
+    def get(self, url, **kwargs):
+        """GET with the current token, re-authenticating once on 401"""
+        token = self.token()
+        response = self.session.get(url, headers=token_headers(token), **kwargs)
+
+        if response.status_code == 401:
+            token = self.refresh(token)
+            response = self.session.get(url, headers=token_headers(token), **kwargs)
+        return response
+
+
+def parse_accounts(data):
+    """Extract the account list from either response format OBP returns"""
+    if isinstance(data, list):
+        return data
+    elif isinstance(data, dict):
+        return data.get("accounts", [])
+    return []
+
+
+def parse_transactions(data):
+    """Extract the transaction list from either response format OBP returns"""
+    if isinstance(data, list):
+        return data
+    elif isinstance(data, dict):
+        return data.get("transactions", [])
+    return []
+
+
+def format_obp_date(value):
+    """Format a date or datetime as the from_date/to_date query parameter OBP expects"""
+    if not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    return value.strftime('%Y-%m-%dT%H:%M:%S.') + f"{value.microsecond // 1000:03d}Z"
+
+
+def iter_pages(auth, url, parse, page_size=DEFAULT_PAGE_SIZE, params=None):
+    """Yield items from a `limit`/`offset` paginated OBP endpoint, one page at a time
+
+    `params` (e.g. a date range) are sent with every page. Stops on a short page.
+    Servers that ignore the paging parameters (returning more than `page_size`
+    items, or the same page again) are read exactly once.
+    """
+    offset = 0
+    previous_first = None
+
+    while True:
+        response = auth.get(url, params={**(params or {}), 'limit': page_size, 'offset': offset})
+        if response.status_code != 200:
+            raise OBPRequestError(f"{url} returned {response.status_code}", response.status_code)
+
+        items = parse(response.json())
+        if not items:
+            return
+        first = items[0].get('id') if isinstance(items[0], dict) else items[0]
+        if offset and first == previous_first:
+            return
+
+        yield from items
+
+        if len(items) != page_size:
+            return
+        previous_first = first
+        offset += page_size
+
+
+def iter_banks(auth, base_url, api_version, page_size=DEFAULT_PAGE_SIZE):
+    """Yield raw bank objects from /banks, page by page"""
+    url = f"{base_url}/obp/{api_version}/banks"
+    try:
+        yield from iter_pages(auth, url, lambda data: data["banks"], page_size)
+    except OBPRequestError as e:
+        raise Exception(f"Failed to fetch banks: {e.status_code}") from e
+
+
+def fetch_public_accounts(auth, base_url, api_version, bank_id, page_size=DEFAULT_PAGE_SIZE):
+    """Fetch all raw public accounts of one bank
+
+    A bank that refuses the request (e.g. 403/404: no public view) has no accounts.
+    Throttling and server errors that outlast the session's retries are raised,
+    rather than silently dropping the bank from the run.
+    """
+    url = f"{base_url}/obp/{api_version}/banks/{bank_id}/accounts/public"
+    accounts = []
+    try:
+        for account in iter_pages(auth, url, parse_accounts, page_size):
+            accounts.append(account)
+    except OBPRequestError as e:
+        if e.status_code in RETRY_STATUSES:
+            raise Exception(f"Failed to fetch accounts of bank {bank_id}: {e.status_code}") from e
+        log(f"No public accounts for bank {bank_id} ({e.status_code})")
+    return accounts
+
+
+def fetch_account_transactions(auth, base_url, api_version, bank_id, account_id, views=DEFAULT_TRANSACTION_VIEWS,
+                               page_size=DEFAULT_PAGE_SIZE, from_date=None, to_date=None):
+    """Fetch all raw transactions of one account, oldest first, through the first view that allows it
+
+    `from_date`/`to_date` (dates or datetimes) limit the range. Views answering
+    403/404 are skipped (an account with no usable view has no transactions);
+    throttling and server errors that outlast the session's retries are raised.
+    A view that fails part way through is not retried, so no rows are duplicated.
+    """
+    params = {'sort_direction': 'ASC'}
+    if from_date is not None:
+        params['from_date'] = format_obp_date(from_date)
+    if to_date is not None:
+        params['to_date'] = format_obp_date(to_date)
+
+    for view in views:
+        url = f"{base_url}/obp/{api_version}/banks/{bank_id}/accounts/{account_id}/{view}/transactions"
+        transactions = []
+        try:
+            for transaction in iter_pages(auth, url, parse_transactions, page_size, params):
+                transactions.append(transaction)
+            return transactions
+        except OBPRequestError as e:
+            if e.status_code in RETRY_STATUSES or transactions:
+                raise Exception(f"Failed to fetch transactions of account {bank_id}/{account_id}: "
+                                f"{e.status_code}") from e
+    log(f"No transaction view of account {bank_id}/{account_id} is accessible (tried {', '.join(views)})")
+    return []
+
+
+def iter_concurrent(fetch, items, max_workers=DEFAULT_MAX_WORKERS):
+    """Yield (item, fetch(item)) in input order, running up to `max_workers` fetches at once
+
+    `items` may be any iterable (including a generator); it is consumed only as
+    fast as results are used, keeping at most `max_workers` fetches in flight.
+    """
+    items = iter(items)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def submit(item):
+        return item, executor.submit(fetch, item)
+
+    try:
+        pending = deque(submit(item) for item in islice(items, max_workers))
+        while pending:
+            item, future = pending.popleft()
+            next_item = next(items, None)
+            if next_item is not None:
+                pending.append(submit(next_item))
+            yield item, future.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_accounts_for_banks(auth, base_url, api_version, bank_ids, max_workers=DEFAULT_MAX_WORKERS,
+                            page_size=DEFAULT_PAGE_SIZE):
+    """Yield (bank_id, account) pairs, fetching up to `max_workers` banks concurrently
+
+    `bank_ids` may be any iterable (including a generator); it is consumed only as
+    fast as results are used. Accounts are yielded in bank order as each bank
+    finishes, so callers can start work before discovery is complete.
+    """
+    def fetch(bank_id):
+        return fetch_public_accounts(auth, base_url, api_version, bank_id, page_size)
+
+    for bank_id, accounts in iter_concurrent(fetch, bank_ids, max_workers):
+        for account in accounts:
+            yield bank_id, account
+
+
+def iter_transactions_for_accounts(auth, base_url, api_version, accounts, views=DEFAULT_TRANSACTION_VIEWS,
+                                   max_workers=DEFAULT_MAX_WORKERS, page_size=DEFAULT_PAGE_SIZE,
+                                   from_date=None, to_date=None):
+    """Yield (account, raw transactions) per account, fetching up to `max_workers` accounts concurrently
+
+    `accounts` (dicts with account_id/bank_id) may be a generator, e.g. account
+    discovery still in progress; accounts are yielded in input order.
+    """
+    def fetch(account):
+        return fetch_account_transactions(
+            auth, base_url, api_version, account['bank_id'], account['account_id'], views, page_size,
+            from_date, to_date
+        )
+
+    yield from iter_concurrent(fetch, accounts, max_workers)
@@ -0,0 +1,591 @@
+"""
+Staged ingestion pipeline shared by lambda_handler.py and the local scripts
+source (OBP banks, accounts and real transactions) -> generate (synthetic
+transactions) -> sink (S3, local CSV files or pandas DataFrames), configured
+by one PipelineSettings object read from environment variables
+
+Used by lambda_handler.py, hybrid_data_pipeline.py, test_fetch_data.py and benchmark_pipeline.py
+"""
+
+import csv
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from io import StringIO
+from itertools import chain, islice, repeat
+
+from account_state import STATE_PREFIX
+from metrics import DEFAULT_NAMESPACE, PipelineMetrics, log
+from obp_client import (
+    DEFAULT_CONNECT_TIMEOUT, DEFAULT_MAX_RETRIES, DEFAULT_MAX_WORKERS, DEFAULT_PAGE_SIZE, DEFAULT_READ_TIMEOUT,
+    DEFAULT_TOKEN_TTL, DEFAULT_TRANSACTION_VIEWS, DirectLoginAuth, RetryPolicy, TokenCache, create_session,
+    iter_accounts_for_banks, iter_banks, iter_transactions_for_accounts, token_store_from_spec
+)
+from real_transactions import DEFAULT_BATCH_ROWS, iter_real_transaction_batches
+from s3_writer import (
+    CONTENT_TYPES, DEFAULT_MAX_BUFFERED_BYTES, DEFAULT_MAX_OPEN_PARTITIONS, DEFAULT_PARQUET_COMPRESSION,
+    DEFAULT_PART_SIZE, DEFAULT_ROW_GROUP_SIZE, S3PartitionedWriter, S3StreamingCsvWriter, S3StreamingParquetWriter,
+    compress_bytes, file_extension, hive_partition, records_to_parquet
+)
+from synthetic_generator import DEFAULT_POOL_SIZE, generate_chunk, iter_account_chunks, iter_transaction_batches
+from transaction_schema import TRANSACTION_COLUMNS, TRANSACTION_COLUMN_TYPES, TransactionBatch
+
+# Transactions are generated ('synthetic') or fetched from each discovered account ('real')
+TRANSACTION_SOURCES = ['synthetic', 'real']
+
+# Hive partition column of raw/transactions, and the columns whose min/max each manifest entry records
+TRANSACTION_PARTITION_COLUMN = 'bank_id'
+MANIFEST_STATS_COLUMNS = ['transaction_date', 'amount']
+
+# S3 connection pool: never below botocore's default, and room beyond the part uploads for
+# the banks/accounts objects, account states and manifests
+S3_MIN_POOL_CONNECTIONS = 10
+S3_EXTRA_CONNECTIONS = 6
+
+
+def optional_int(value):
+    """0 or empty means 'no cap'"""
+    return int(value or 0) or None
+
+
+def optional_str(value):
+    return value or None
+
+
+def optional_lower(value):
+    return value.lower() or None
+
+
+def flag(value):
+    return value.lower() == 'true'
+
+
+def name_list(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+# (attribute, environment variable, parser, default); the default is used when the variable is unset
+SETTINGS = [
+    ('obp_base_url', 'OBP_BASE_URL', str, None),
+    ('obp_api_version', 'OBP_API_VERSION', str, None),
+    ('obp_username', 'OBP_USERNAME', str, None),
+    ('obp_password', 'OBP_PASSWORD', str, None),
+    ('obp_consumer_key', 'OBP_CONSUMER_KEY', str, None),
+    ('obp_directlogin_endpoint', 'OBP_DIRECTLOGIN_ENDPOINT', str, None),
+    ('obp_max_workers', 'OBP_MAX_WORKERS', int, DEFAULT_MAX_WORKERS),
+    ('obp_page_size', 'OBP_PAGE_SIZE', int, DEFAULT_PAGE_SIZE),
+    # Per-request timeouts (seconds) and retries of throttled/failed requests
+    ('obp_connect_timeout', 'OBP_CONNECT_TIMEOUT', float, DEFAULT_CONNECT_TIMEOUT),
+    ('obp_read_timeout', 'OBP_READ_TIMEOUT', float, DEFAULT_READ_TIMEOUT),
+    ('obp_max_retries', 'OBP_MAX_RETRIES', int, DEFAULT_MAX_RETRIES),
+    # Discovery caps (0 or unset = every bank/account the API exposes)
+    ('obp_max_banks', 'OBP_MAX_BANKS', optional_int, None),
+    ('obp_max_accounts', 'OBP_MAX_ACCOUNTS', optional_int, None),
+    ('obp_token_ttl', 'OBP_TOKEN_TTL', int, DEFAULT_TOKEN_TTL),
+    ('obp_token_cache', 'OBP_TOKEN_CACHE', str, ''),  # '', 'file:/tmp/obp_token.json' or 's3:<key>'
+    # Real transactions: views tried per account, optional ISO date range, and rows per batch
+    ('obp_transaction_views', 'OBP_TRANSACTION_VIEWS', name_list, list(DEFAULT_TRANSACTION_VIEWS)),
+    ('transaction_source', 'TRANSACTION_SOURCE', str.lower, 'synthetic'),
+    ('transactions_from_date', 'TRANSACTIONS_FROM_DATE', optional_str, None),
+    ('transactions_to_date', 'TRANSACTIONS_TO_DATE', optional_str, None),
+    ('real_batch_rows', 'REAL_BATCH_ROWS', int, DEFAULT_BATCH_ROWS),
+    ('transactions_per_account', 'TRANSACTIONS_PER_ACCOUNT', int, 100),
+    ('faker_pool_size', 'FAKER_POOL_SIZE', int, DEFAULT_POOL_SIZE),
+    # Incremental mode generates only the days since each account's saved state
+    ('incremental', 'INCREMENTAL', flag, False),
+    ('account_state_prefix', 'ACCOUNT_STATE_PREFIX', str, STATE_PREFIX),
+    # S3 output
+    ('s3_bucket_name', 'S3_BUCKET_NAME', str, None),
+    ('output_format', 'OUTPUT_FORMAT', str.lower, 'csv'),
+    # CSV compression: '' (plain text), 'gzip' or 'zstd'
+    ('csv_compression', 'CSV_COMPRESSION', optional_lower, None),
+    ('csv_compression_level', 'CSV_COMPRESSION_LEVEL', optional_int, None),
+    ('parquet_compression', 'PARQUET_COMPRESSION', str, DEFAULT_PARQUET_COMPRESSION),
+    ('parquet_row_group_size', 'PARQUET_ROW_GROUP_SIZE', int, DEFAULT_ROW_GROUP_SIZE),
+    ('s3_part_size', 'S3_PART_SIZE', int, DEFAULT_PART_SIZE),
+    # Transactions are written to one object per bank_id partition; this caps the writers open at once
+    ('max_open_partitions', 'MAX_OPEN_PARTITIONS', int, DEFAULT_MAX_OPEN_PARTITIONS),
+    # ...and the bytes they may buffer together (see s3_writer.py for the run's worst case)
+    ('max_buffered_bytes', 'MAX_BUFFERED_BYTES', int, DEFAULT_MAX_BUFFERED_BYTES),
+    # Overlap discovery, generation, encoding and uploads (async_pipeline.py); queue_size bounds how far
+    # each stage may run ahead of the next, upload_workers the parts uploaded at once
+    ('overlap_stages', 'OVERLAP_STAGES', flag, True),
+    ('stage_queue_size', 'STAGE_QUEUE_SIZE', int, 4),
+    ('upload_workers', 'UPLOAD_WORKERS', int, 4),
+    # Attempts per S3 request (botocore adaptive retries, which also slow down when S3 throttles)
+    ('s3_max_attempts', 'S3_MAX_ATTEMPTS', int, 5),
+    # Accounts per worker invocation in coordinator mode
+    ('shard_accounts', 'SHARD_ACCOUNTS', int, 1000),
+    ('metrics_namespace', 'METRICS_NAMESPACE', str, DEFAULT_NAMESPACE)
+]
+
+
+class PipelineSettings:
+    """Every pipeline setting, read once from environment variables (see SETTINGS)
+
+    The Lambda reads its configuration here; local scripts get the same object
+    from Config.pipeline_settings() once .env is loaded. Keyword arguments
+    override individual settings.
+    """
+
+    def __init__(self, **values):
+        for name, _, _, default in SETTINGS:
+            setattr(self, name, values.pop(name, default))
+        if values:
+            raise ValueError(f"Unknown settings: {', '.join(sorted(values))}")
+
+    @classmethod
+    def from_env(cls, environ=None, **overrides):
+        environ = os.environ if environ is None else environ
+        values = {name: parse(environ[variable]) for name, variable, parse, _ in SETTINGS if variable in environ}
+        values.update(overrides)
+        return cls(**values)
+
+    def replace(self, **overrides):
+        """Copy with some settings changed"""
+        return PipelineSettings(**{**vars(self), **overrides})
+
+
+def create_http_session(settings):
+    """Keep-alive OBP session with the configured pool size, timeouts and retries"""
+    return create_session(
+        settings.obp_max_workers, (settings.obp_connect_timeout, settings.obp_read_timeout),
+        RetryPolicy(settings.obp_max_retries)
+    )
+
+
+def s3_pool_connections(settings):
+    """Connections in the pool of create_s3_client"""
+    return max(S3_MIN_POOL_CONNECTIONS, settings.upload_workers + S3_EXTRA_CONNECTIONS)
+
+
+def s3_state_workers(settings):
+    """Account state requests at once: the pool's connections not kept for part uploads, which run alongside"""
+    return s3_pool_connections(settings) - settings.upload_workers
+
+
+def create_s3_client(settings):
+    """S3 client shared by every upload of a run, with a connection pool sized for them and adaptive retries"""
+    import boto3
+    from botocore.config import Config
+
+    return boto3.client('s3', config=Config(
+        max_pool_connections=s3_pool_connections(settings),
+        retries={'mode': 'adaptive', 'total_max_attempts': settings.s3_max_attempts},
+        tcp_keepalive=True
+    ))
+
+
+def create_auth(settings, session, s3_client=None):
+    """DirectLogin handle whose token is cached as configured by settings.obp_token_cache"""
+    token_cache = TokenCache(
+        settings.obp_token_ttl, token_store_from_spec(settings.obp_token_cache, s3_client, settings.s3_bucket_name)
+    )
+    return DirectLoginAuth(
+        session, settings.obp_directlogin_endpoint, settings.obp_username, settings.obp_password,
+        settings.obp_consumer_key, token_cache
+    )
+
+
+class OBPSource:
+    """Source stage: banks, accounts and real transactions from the OBP API
+
+    Stages are timed in `metrics` (a PipelineMetrics) when one is given.
+    """
+
+    def __init__(self, settings, auth, metrics=None):
+        self.settings = settings
+        self.auth = auth
+        self.metrics = metrics or PipelineMetrics()
+
+    def authenticate(self):
+        """Return the OBP auth handle, logging in only if no cached token is valid"""
+        log("Authenticating with OBP API...")
+
+        logins_before = self.auth.login_count
+        with self.metrics.stage('authenticate'):
+            self.auth.token()
+
+        if self.auth.login_count > logins_before:
+            log(f"Authentication successful")
+        else:
+            log(f"Using cached token")
+        return self.auth
+
+    def fetch_banks(self):
+        """Fetch real banks (every page, up to obp_max_banks) as records"""
+        log("Fetching banks...")
+        settings = self.settings
+
+        banks_data = []
+        banks = iter_banks(self.auth, settings.obp_base_url, settings.obp_api_version, page_size=settings.obp_page_size)
+
+        for bank in self.metrics.timed_iter('fetch_banks', islice(banks, settings.obp_max_banks)):
+            banks_data.append({
+                'bank_id': bank['id'],
+                'bank_name': bank.get('full_name', bank.get('short_name', 'N/A')),
+                'data_source': 'REAL_API',
+                'extracted_at': datetime.now().isoformat()
+            })
+
+        log(f"Fetched {len(banks_data)} banks")
+        return banks_data
+
+    def iter_accounts(self, bank_ids):
+        """Yield real public accounts as their pages arrive (banks are queried concurrently, up to obp_max_accounts)"""
+        settings = self.settings
+        accounts = iter_accounts_for_banks(
+            self.auth, settings.obp_base_url, settings.obp_api_version, bank_ids,
+            max_workers=settings.obp_max_workers, page_size=settings.obp_page_size
+        )
+
+        for bank_id, account in self.metrics.timed_iter('fetch_accounts', islice(accounts, settings.obp_max_accounts)):
+            yield {
+                'account_id': account.get('id', 'N/A'),
+                'bank_id': bank_id,
+                'account_label': account.get('label', account.get('account_label', 'N/A')),
+                'account_type': account.get('account_type', 'N/A'),
+                'data_source': 'REAL_API',
+                'extracted_at': datetime.now().isoformat()
+            }
+
+    def iter_transactions(self, accounts, from_date=None, to_date=None):
+        """Lazily fetch the real transactions of each account (concurrently, every page) as batches
+
+        from_date/to_date are ISO dates or datetimes bounding the transactions fetched.
+        Rows that cannot be written (no id or date, missing or malformed amount) are
+        dropped and counted as `rejected_transactions` in the metrics.
+        """
+        settings = self.settings
+        date_range = f" from {from_date or 'the start'} to {to_date or 'now'}"
+        log(f"Fetching real transactions{date_range} ({', '.join(settings.obp_transaction_views)} view)...")
+
+        account_transactions = iter_transactions_for_accounts(
+            self.auth, settings.obp_base_url, settings.obp_api_version, accounts, settings.obp_transaction_views,
+            max_workers=settings.obp_max_workers, page_size=settings.obp_page_size,
+            from_date=datetime.fromisoformat(from_date) if from_date else None,
+            to_date=datetime.fromisoformat(to_date) if to_date else None
+        )
+        rejected = Counter()
+        return self._count_rejected(iter_real_transaction_batches(
+            self.metrics.timed_iter('fetch_transactions', account_transactions), settings.real_batch_rows,
+            rejected=rejected
+        ), rejected)
+
+    def _count_rejected(self, batches, rejected):
+        self.metrics.add('rejected_transactions', 0)
+        yield from batches
+        self.metrics.add('rejected_transactions', sum(rejected.values()))
+
+
+def generate_transactions(accounts, settings, seed, state_store=None, workers=1, metrics=None):
+    """Generate stage: lazily yield synthetic transaction batches linked to `accounts`
+
+    With a `state_store`, accounts with saved state only get the days since their
+    last run. With workers > 1, account chunks are generated in a process pool;
+    every account draws from its own stream derived from (seed, account_id), so
+    output does not depend on `workers`.
+    """
+    transactions_per_account = settings.transactions_per_account
+    if state_store is not None:
+        log(f"Generating synthetic transactions since each account's last run "
+            f"({transactions_per_account} per account for new accounts)...")
+    else:
+        log(f"Generating {transactions_per_account} synthetic transactions per account...")
+
+    if workers > 1:
+        batches = generate_in_processes(accounts, settings, seed, state_store, workers)
+    else:
+        batches = iter_transaction_batches(
+            accounts, transactions_per_account, seed=seed, pool_size=settings.faker_pool_size, state_store=state_store
+        )
+    return (metrics or PipelineMetrics()).timed_iter('generate', batches)
+
+
+def generate_in_processes(accounts, settings, seed, state_store, workers):
+    """Yield the batches of each account chunk, in order, from a pool of `workers` processes"""
+    now = datetime.now()
+    chunks = list(iter_account_chunks(accounts))
+    states = [state_store.load(chunk) for chunk in chunks] if state_store is not None else repeat(None)
+
+    log(f"Generating {len(chunks)} account chunks in {workers} worker processes")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(
+            generate_chunk, chunks, repeat(settings.transactions_per_account), repeat(seed), repeat(now),
+            repeat(settings.faker_pool_size), states
+        )
+
+
+def collect_account_states(batches, states):
+    """Pass batches through unchanged, appending each account's new state to `states`"""
+    for batch in batches:
+        states.extend(batch.states)
+        yield batch
+
+
+def transaction_batches(source, accounts, settings, transaction_source, seed, account_states, state_store=None,
+                        from_date=None, to_date=None, workers=1):
+    """Batches of real or synthetic transactions for `accounts`; synthetic ones add their states to `account_states`"""
+    if transaction_source == 'real':
+        return source.iter_transactions(accounts, from_date, to_date)
+    return collect_account_states(
+        generate_transactions(accounts, settings, seed, state_store, workers, source.metrics), account_states
+    )
+
+
+class RunResult:
+    """What run_stages produced: the bank and account records, each sink's entries and the new account states
+
+    `stages` holds per-stage timings when the stages ran overlapped (see async_pipeline.StageStats).
+    """
+
+    def __init__(self, banks, accounts, banks_object, accounts_object, transaction_objects, transaction_count,
+                 account_states, stages=None):
+        self.banks = banks
+        self.accounts = accounts
+        self.banks_object = banks_object
+        self.accounts_object = accounts_object
+        self.transaction_objects = transaction_objects
+        self.transaction_count = transaction_count
+        self.account_states = account_states
+        self.stages = stages
+
+    @property
+    def objects(self):
+        """Every entry written, banks and accounts first"""
+        return [self.banks_object, self.accounts_object] + self.transaction_objects
+
+
+def discover_accounts(source, banks_data):
+    """Start account discovery; returns (first account, rest of stream) or raises if none exist"""
+    log("Fetching accounts...")
+    account_stream = source.iter_accounts([bank['bank_id'] for bank in banks_data])
+    first_account = next(account_stream, None)
+
+    if first_account is None:
+        raise Exception("No accounts found in any banks")
+    return first_account, account_stream
+
+
+def run_stages(source, sink, settings, seed, transaction_source='synthetic', state_store=None, from_date=None,
+               to_date=None, workers=1):
+    """Run source -> generate -> sink once: discover banks and accounts, then generate (or fetch) transactions
+
+    Banks are written as soon as they are fetched. Transactions start as soon as
+    the first accounts arrive and stream into the sink; accounts are written once
+    discovery is complete. Account states are returned, not saved, so callers
+    persist them only after the sink has succeeded.
+    """
+    source.authenticate()
+    banks_data = source.fetch_banks()
+    banks_object = sink.write_records('banks', banks_data)
+
+    accounts_data = []
+    first_account, account_stream = discover_accounts(source, banks_data)
+
+    def discovered_accounts():
+        for account in chain([first_account], account_stream):
+            accounts_data.append(account)
+            yield account
+
+    account_states = []
+    batches = transaction_batches(
+        source, discovered_accounts(), settings, transaction_source, seed, account_states, state_store,
+        from_date, to_date, workers
+    )
+    transaction_objects, transaction_count = sink.write_batches('transactions', batches)
+    log(f"Fetched {len(accounts_data)} accounts")
+
+    accounts_object = sink.write_records('accounts', accounts_data)
+    return RunResult(
+        banks_data, accounts_data, banks_object, accounts_object, transaction_objects, transaction_count,
+        account_states
+    )
+
+
+def dict_list_to_csv(data_list):
+    """Convert list of dictionaries to CSV string"""
+    if not data_list:
+        return ""
+
+    output = StringIO()
+    writer = csv.DictWriter(output, fieldnames=data_list[0].keys())
+    writer.writeheader()
+    writer.writerows(data_list)
+    return output.getvalue()
+
+
+def date_partition(timestamp):
+    """The dt= partition value of a run"""
+    return timestamp.strftime('%Y-%m-%d')
+
+
+def build_s3_key(dataset_name, timestamp, output_format='csv', suffix='', compression=None, bank_id=None):
+    """Build the Hive-style raw/ key for a dataset: raw/{dataset}/dt=YYYY-MM-DD/[bank_id=.../]file
+
+    suffix distinguishes shards (and further files of one partition) within a run.
+    """
+    partitions = [hive_partition('dt', date_partition(timestamp))]
+    if bank_id is not None:
+        partitions.append(hive_partition('bank_id', bank_id))
+    extension = file_extension(output_format, compression)
+    file_name = f"{dataset_name}_{timestamp.strftime('%Y%m%d_%H%M%S')}{suffix}.{extension}"
+    return '/'.join(['raw', dataset_name] + partitions + [file_name])
+
+
+def manifest_entry(dataset_name, timestamp, stats):
+    """Describe one written object for the run manifest (stats: key, bytes, rows, ...)"""
+    entry = {'dataset': dataset_name, 'key': stats['key']}
+    entry['partition'] = {'dt': date_partition(timestamp), **stats.get('partition', {})}
+    entry.update({name: value for name, value in stats.items() if name not in entry})
+    return entry
+
+
+class S3Sink:
+    """Sink stage writing one run to Hive-partitioned raw/ keys in settings.s3_bucket_name
+
+    Records become one object per dataset; transaction batches stream to one
+    multipart object per bank_id partition. Both return run manifest entries.
+    `suffix` distinguishes the objects of one shard of a run. With an `uploader`
+    (see S3MultipartStream), parts upload in the background while encoding continues.
+    """
+
+    def __init__(self, s3_client, settings, timestamp, output_format='csv', compression=None, suffix='', metrics=None,
+                 uploader=None):
+        self.s3_client = s3_client
+        self.settings = settings
+        self.bucket = settings.s3_bucket_name
+        self.timestamp = timestamp
+        self.output_format = output_format
+        self.compression = compression
+        self.suffix = suffix
+        self.metrics = metrics or PipelineMetrics()
+        self.uploader = uploader
+
+    def write_records(self, dataset_name, data_list):
+        """Upload records as CSV (optionally compressed) or Parquet; returns its manifest entry"""
+        headers = {'ContentType': CONTENT_TYPES[self.output_format]}
+        with self.metrics.stage('serialize'):
+            if self.output_format == 'parquet':
+                body = records_to_parquet(data_list, compression=self.settings.parquet_compression)
+            else:
+                body = dict_list_to_csv(data_list).encode('utf-8')
+                if self.compression:
+                    body = compress_bytes(body, self.compression, self.settings.csv_compression_level)
+                    headers['ContentEncoding'] = self.compression
+        file_key = build_s3_key(dataset_name, self.timestamp, self.output_format, self.suffix, self.compression)
+
+        try:
+            self.s3_client.put_object(
+                Bucket=self.bucket,
+                Key=file_key,
+                Body=body,
+                **headers
+            )
+        except Exception as e:
+            raise Exception(f"Failed to put s3://{self.bucket}/{file_key}: {e}") from e
+
+        log(f"Uploaded {len(data_list)} records to s3://{self.bucket}/{file_key}")
+        return manifest_entry(dataset_name, self.timestamp, {'key': file_key, 'bytes': len(body), 'rows': len(data_list)})
+
+    def open_batch_writer(self, file_key):
+        """Open the streaming S3 writer for transaction batches"""
+        settings = self.settings
+        if self.output_format == 'parquet':
+            return S3StreamingParquetWriter(
+                self.s3_client, self.bucket, file_key, TRANSACTION_COLUMN_TYPES,
+                part_size=settings.s3_part_size,
+                row_group_size=settings.parquet_row_group_size,
+                compression=settings.parquet_compression,
+                uploader=self.uploader,
+                on_finish=self.object_finished
+            )
+        return S3StreamingCsvWriter(
+            self.s3_client, self.bucket, file_key, TRANSACTION_COLUMNS, part_size=settings.s3_part_size,
+            compression=self.compression, compression_level=settings.csv_compression_level, uploader=self.uploader,
+            on_finish=self.object_finished
+        )
+
+    def object_finished(self, stream):
+        """Progress line for each streamed object, printed as soon as it exists in S3"""
+        log(f"Uploaded s3://{self.bucket}/{stream.key} ({stream.bytes_written:,} bytes)")
+
+    def write_batches(self, dataset_name, batches):
+        """Stream transaction batches to S3, one multipart object per bank_id partition
+
+        Returns (manifest entries of the objects written, total rows).
+        """
+        def partition_key(bank_id, file_index):
+            file_suffix = f"{self.suffix}_{file_index:03d}" if file_index else self.suffix
+            return build_s3_key(dataset_name, self.timestamp, self.output_format, file_suffix, self.compression, bank_id)
+
+        # Generation pulled by the loop is timed as 'generate', S3 calls as 'upload', the rest as 'serialize'
+        with self.metrics.stage('serialize'):
+            with S3PartitionedWriter(
+                self.open_batch_writer, TRANSACTION_PARTITION_COLUMN, partition_key, MANIFEST_STATS_COLUMNS,
+                self.settings.max_open_partitions, self.settings.max_buffered_bytes
+            ) as writer:
+                for batch in batches:
+                    writer.write_batch(batch)
+
+        objects = [manifest_entry(dataset_name, self.timestamp, stats) for stats in writer.objects]
+        prefix = '/'.join(['raw', dataset_name, hive_partition('dt', date_partition(self.timestamp))])
+        log(f"Uploaded {writer.rows_written} records in {len(objects)} objects to s3://{self.bucket}/{prefix}/")
+        return objects, writer.rows_written
+
+
+class LocalFileSink:
+    """Sink stage writing each dataset to one local CSV file, {prefix}{dataset}_{YYYYMMDD_HHMMSS}.csv
+
+    Transaction batches are streamed row by row, so memory stays bounded by one batch.
+    """
+
+    def __init__(self, directory='.', prefix='', timestamp=None):
+        self.directory = directory
+        self.prefix = prefix
+        self.timestamp = timestamp or datetime.now()
+
+    def path_for(self, dataset_name):
+        return os.path.join(self.directory, f"{self.prefix}{dataset_name}_{self.timestamp.strftime('%Y%m%d_%H%M%S')}.csv")
+
+    def write_records(self, dataset_name, data_list):
+        path = self.path_for(dataset_name)
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            f.write(dict_list_to_csv(data_list))
+        log(f"Saved {len(data_list)} records to: {path}")
+        return {'dataset': dataset_name, 'path': path, 'bytes': os.path.getsize(path), 'rows': len(data_list)}
+
+    def write_batches(self, dataset_name, batches):
+        path = self.path_for(dataset_name)
+        rows = 0
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(TRANSACTION_COLUMNS)
+            for batch in batches:
+                writer.writerows(batch.rows())
+                rows += len(batch)
+        log(f"Saved {rows} records to: {path}")
+        return [{'dataset': dataset_name, 'path': path, 'bytes': os.path.getsize(path), 'rows': rows}], rows
+
+
+class DataFrameSink:
+    """Sink stage keeping each dataset in memory as a pandas DataFrame, in `frames`
+
+    Transaction batches are joined column by column; dictionary-coded columns
+    become Categoricals over the batch codes (see TransactionBatch.to_frame).
+    """
+
+    def __init__(self):
+        self.frames = {}
+
+    def write_records(self, dataset_name, data_list):
+        import pandas as pd
+
+        self.frames[dataset_name] = pd.DataFrame(data_list)
+        return {'dataset': dataset_name, 'rows': len(data_list)}
+
+    def write_batches(self, dataset_name, batches):
+        frame = TransactionBatch.concat(batches).to_frame()
+        self.frames[dataset_name] = frame
+        return [{'dataset': dataset_name, 'rows': len(frame)}], len(frame)
@@ -0,0 +1,130 @@
+"""
+Real OBP transactions as columnar batches
+Flattens the nested OBP transaction JSON (details.value, details.new_balance,
+other_account.holder) into TransactionBatch objects with the same columns as
+synthetic batches, so real and generated data share one S3 writer path
+
+Used by pipeline.py
+"""
+
+import math
+from collections import Counter
+from datetime import datetime
+
+import numpy as np
+
+from metrics import log
+from synthetic_generator import DAY_NAMES
+from transaction_schema import TRANSACTION_COLUMNS, ConstantColumn, DictionaryColumn, TransactionBatch
+
+# Rows collected (across accounts) before a batch is handed to the writer
+DEFAULT_BATCH_ROWS = 50_000
+
+# Columns taken from the API; the rest are derived from transaction_date or are run constants
+FLAT_COLUMNS = ['transaction_id', 'bank_id', 'account_id', 'amount', 'currency', 'transaction_type',
+                'description', 'transaction_date', 'balance_after', 'counterparty_name']
+
+
+# Why a raw transaction was not written (see flatten_transaction)
+MISSING_ID_OR_DATE = 'missing id or date'
+INVALID_AMOUNT = 'missing or malformed amount or balance'
+
+
+def parse_amount(value):
+    """OBP sends amounts as strings; None when missing, malformed or not finite ('NaN', 'inf')"""
+    try:
+        amount = float(value)
+    except (TypeError, ValueError):
+        return None
+    return amount if math.isfinite(amount) else None
+
+
+def flatten_transaction(bank_id, account_id, transaction):
+    """One raw OBP transaction as (tuple in FLAT_COLUMNS order, None), or (None, reason) when it is rejected"""
+    details = transaction.get('details') or {}
+    value = details.get('value') or {}
+    new_balance = details.get('new_balance') or {}
+    holder = (transaction.get('other_account') or {}).get('holder') or {}
+    # ISO 8601 to the second; the zone suffix (always UTC on OBP) is dropped
+    date = (details.get('completed') or details.get('posted') or '')[:19]
+
+    if not transaction.get('id') or len(date) != 19:
+        return None, MISSING_ID_OR_DATE
+    amount = parse_amount(value.get('amount'))
+    balance_after = parse_amount(new_balance.get('amount'))
+    if amount is None or balance_after is None:
+        return None, INVALID_AMOUNT
+    return (
+        transaction['id'],
+        bank_id,
+        (transaction.get('this_account') or {}).get('id') or account_id,
+        amount,
+        value.get('currency'),
+        details.get('type'),
+        details.get('description'),
+        date,
+        balance_after,
+        holder.get('name')
+    ), None
+
+
+def build_real_batch(rows, extracted_at):
+    """TransactionBatch from flattened rows; hour and weekday are derived like synthetic ones"""
+    flat = dict(zip(FLAT_COLUMNS, zip(*rows))) if rows else {name: () for name in FLAT_COLUMNS}
+    size = len(rows)
+
+    tx_dates = np.array(flat['transaction_date'], dtype='datetime64[s]')
+    tx_days = tx_dates.astype('datetime64[D]')
+    weekdays = (tx_days.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+
+    columns = {
+        'transaction_id': np.array(flat['transaction_id'], dtype=str),
+        'bank_id': DictionaryColumn.encode(flat['bank_id']),
+        'account_id': DictionaryColumn.encode(flat['account_id']),
+        'amount': np.array(flat['amount'], dtype=np.float64),
+        'currency': DictionaryColumn.encode(flat['currency']),
+        'transaction_type': DictionaryColumn.encode(flat['transaction_type']),
+        'description': DictionaryColumn.encode(flat['description']),
+        'merchant': DictionaryColumn(np.full(size, -1, dtype=np.int8), np.array([], dtype=object)),
+        'transaction_date': np.datetime_as_string(tx_dates, unit='s'),
+        'transaction_hour': ((tx_dates - tx_days) // np.timedelta64(1, 'h')).astype(np.int64),
+        'day_of_week': DictionaryColumn(weekdays.astype(np.int8), DAY_NAMES),
+        'is_weekend': weekdays >= 5,
+        'balance_after': np.array(flat['balance_after'], dtype=np.float64),
+        'counterparty_name': DictionaryColumn.encode(flat['counterparty_name']),
+        'data_source': ConstantColumn('REAL_API', size),
+        'generated_at': ConstantColumn(extracted_at.isoformat(), size)
+    }
+    return TransactionBatch({name: columns[name] for name in TRANSACTION_COLUMNS})
+
+
+def iter_real_transaction_batches(account_transactions, batch_rows=DEFAULT_BATCH_ROWS, extracted_at=None,
+                                  rejected=None):
+    """Yield TransactionBatch objects from (account, raw transactions) pairs
+
+    Rows keep the order they arrive in (account by account), and a batch is
+    emitted once it holds at least `batch_rows` rows, so memory stays bounded
+    however many accounts are fetched. Transactions without an id or date, or
+    whose amount or balance is missing or not a finite number, are rejected
+    rather than written as NaN; they are counted per reason in `rejected` (a
+    Counter) when one is given.
+    """
+    extracted_at = extracted_at or datetime.now()
+    rows = []
+    rejected = Counter() if rejected is None else rejected
+
+    for account, transactions in account_transactions:
+        for transaction in transactions:
+            row, reason = flatten_transaction(account['bank_id'], account['account_id'], transaction)
+            if row is None:
+                rejected[reason] += 1
+            else:
+                rows.append(row)
+        if len(rows) >= batch_rows:
+            yield build_real_batch(rows, extracted_at)
+            rows = []
+
+    if rows:
+        yield build_real_batch(rows, extracted_at)
+    for reason, count in rejected.items():
+        log(f"[WARNING] Rejected {count} transactions: {reason}")
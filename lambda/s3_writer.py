@@ -0,0 +1,644 @@
+"""
+Streaming S3 writers for the pipeline's raw datasets
+Encodes row batches to bytes as they arrive and uploads them as multipart parts,
+so peak memory is bounded by the part size rather than the dataset size
+
+Worst case buffered by one S3PartitionedWriter with background uploads:
+max_buffered_bytes across its open writers (pending Parquet rows plus each
+object's unsent part; a single batch may overshoot it until the next write),
+plus (upload queue size + upload workers) parts of `part_size` held by the
+uploader. With the defaults: 64 MiB + (4 + 4) x 8 MiB = 128 MiB.
+
+Supported formats: CSV (default, optionally gzip/zstd compressed) and Parquet (requires pyarrow)
+"""
+
+import csv
+import zlib
+from collections import Counter, OrderedDict
+from io import BytesIO, StringIO
+from urllib.parse import quote
+
+import numpy as np
+
+from transaction_schema import DictionaryColumn
+
+# S3 rejects multipart parts smaller than 5 MiB (except the last one)
+MIN_PART_SIZE = 5 * 1024 * 1024
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+
+OUTPUT_FORMATS = ['csv', 'parquet']
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+# Streaming compression for CSV output (zstd requires the zstandard package)
+COMPRESSIONS = ['gzip', 'zstd']
+COMPRESSION_EXTENSIONS = {'gzip': 'gz', 'zstd': 'zst'}
+# gzip 3 compresses synthetic CSV about 6x at half the CPU of the usual level 6
+DEFAULT_COMPRESSION_LEVELS = {'gzip': 3, 'zstd': 3}
+
+# Partition writers kept open at once by S3PartitionedWriter (each buffers up to one part)
+DEFAULT_MAX_OPEN_PARTITIONS = 16
+# Bytes all open partition writers may buffer together before the least recently written are flushed or closed;
+# 16 open Parquet writers would otherwise hold up to 16 row groups (over 1 GiB) on a 512 MB Lambda
+DEFAULT_MAX_BUFFERED_BYTES = 64 * 1024 * 1024
+
+DEFAULT_ROW_GROUP_SIZE = 250_000
+DEFAULT_PARQUET_COMPRESSION = 'snappy'
+
+# Low-cardinality columns that are dictionary-encoded in Parquet
+DICTIONARY_COLUMNS = ['bank_id', 'account_id', 'currency', 'transaction_type', 'merchant',
+                      'day_of_week', 'data_source', 'generated_at']
+
+
+class S3MultipartStream:
+    """Write-only file-like object that uploads its bytes as S3 multipart parts
+
+    Objects smaller than one part are sent with a single put_object call; larger
+    ones are cut into parts of exactly `part_size` bytes (the last may be smaller). With an
+    `uploader` (anything with submit(function, *args) returning a Future, such as
+    async_pipeline.PartUploader), parts are uploaded in the background while the
+    caller keeps writing, and close() hands the final put or complete call to the
+    uploader too; wait() blocks until the object exists. `on_finish(stream)` is
+    called once the object exists, and failures name the object they belong to.
+    """
+
+    def __init__(self, s3_client, bucket, key, content_type, part_size=DEFAULT_PART_SIZE, content_encoding=None,
+                 uploader=None, on_finish=None):
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f"part_size must be at least {MIN_PART_SIZE} bytes")
+
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.content_type = content_type
+        self.content_encoding = content_encoding
+        self.part_size = part_size
+        self.uploader = uploader
+        self.on_finish = on_finish
+
+        self.upload_id = None
+        self.parts = []
+        self.bytes_written = 0
+        self.closed = False
+
+        self._buffer = bytearray()
+        self._pending = []  # (part number, Future) of background part uploads
+        self._finishing = None  # Future of a background close
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self.bytes_written + len(self._buffer)
+
+    @property
+    def buffered_bytes(self):
+        """Bytes written but not yet handed to S3 (or the uploader)"""
+        return len(self._buffer)
+
+    def flush(self):
+        pass
+
+    def write(self, data):
+        self._buffer += data
+        while len(self._buffer) >= self.part_size:
+            self._upload_part(self.part_size)
+        return len(data)
+
+    def close(self):
+        """Upload any buffered bytes and finish the object (in the background with an uploader; see wait())"""
+        if self.closed:
+            return
+        body = None
+        if self.upload_id is None:
+            body = bytes(self._buffer)
+            self.bytes_written += len(body)
+        elif self._buffer:
+            self._upload_part()
+
+        if self.uploader is None:
+            self._finish(body)
+        else:
+            self._finishing = self.uploader.submit(self._finish, body)
+        self._buffer.clear()
+        self.closed = True
+
+    def wait(self):
+        """Block until a background close has finished the object, re-raising its failure"""
+        if self._finishing is None:
+            return
+        try:
+            self._finishing.result()
+        except BaseException:
+            self._abort_upload()
+            raise
+        finally:
+            self._finishing = None
+
+    def abort(self):
+        """Discard a partially uploaded object"""
+        # Parts still uploading would otherwise outlive the abort
+        futures = [future for _, future in self._pending]
+        if self._finishing is not None:
+            futures.append(self._finishing)
+        for future in futures:
+            if not future.cancel():
+                future.exception()  # wait for it, whatever its outcome
+        self._pending = []
+        self._finishing = None
+        self._abort_upload()
+        self._buffer.clear()
+        self.closed = True
+
+    def _abort_upload(self):
+        if self.upload_id is not None:
+            self.s3_client.abort_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self.upload_id
+            )
+            self.upload_id = None
+
+    def _finish(self, body):
+        """put_object `body` for an object smaller than one part, or complete the multipart upload"""
+        if self.upload_id is None:
+            try:
+                self.s3_client.put_object(
+                    Bucket=self.bucket,
+                    Key=self.key,
+                    Body=body,
+                    **self._object_headers()
+                )
+            except Exception as e:
+                raise self._upload_error('put', e) from e
+        else:
+            self._wait_for_parts()
+            try:
+                self.s3_client.complete_multipart_upload(
+                    Bucket=self.bucket,
+                    Key=self.key,
+                    UploadId=self.upload_id,
+                    MultipartUpload={'Parts': self.parts}
+                )
+            except Exception as e:
+                raise self._upload_error('complete', e) from e
+        if self.on_finish is not None:
+            self.on_finish(self)
+
+    def _upload_error(self, action, error):
+        return Exception(f"Failed to {action} s3://{self.bucket}/{self.key}: {error}")
+
+    def _upload_part(self, size=None):
+        """Upload the first `size` buffered bytes (all of them by default) as the next part"""
+        if self.upload_id is None:
+            response = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                **self._object_headers()
+            )
+            self.upload_id = response['UploadId']
+
+        part_number = len(self.parts) + len(self._pending) + 1
+        body = bytes(self._buffer[:size])
+        del self._buffer[:len(body)]
+        if self.uploader is None:
+            self.parts.append({'ETag': self._send_part(part_number, body), 'PartNumber': part_number})
+        else:
+            self._pending.append((part_number, self.uploader.submit(self._send_part, part_number, body)))
+        self.bytes_written += len(body)
+
+    def _send_part(self, part_number, body):
+        """Upload one part and return its ETag"""
+        try:
+            response = self.s3_client.upload_part(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self.upload_id,
+                PartNumber=part_number,
+                Body=body
+            )
+        except Exception as e:
+            raise self._upload_error(f"upload part {part_number} of", e) from e
+        return response['ETag']
+
+    def _wait_for_parts(self):
+        """Collect background uploads in part order (re-raising the first failure)"""
+        for part_number, future in self._pending:
+            self.parts.append({'ETag': future.result(), 'PartNumber': part_number})
+        self._pending = []
+
+    def _object_headers(self):
+        headers = {'ContentType': self.content_type}
+        if self.content_encoding:
+            headers['ContentEncoding'] = self.content_encoding
+        return headers
+
+
+def _import_zstandard():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError("zstd compression requires zstandard (pip install zstandard)") from e
+    return zstandard
+
+
+def create_compressor(compression, level=None):
+    """Incremental compressor for `compression` (an object with compress(bytes) and flush())"""
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unsupported compression: {compression}")
+    level = level or DEFAULT_COMPRESSION_LEVELS[compression]
+    if compression == 'gzip':
+        return zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    return _import_zstandard().ZstdCompressor(level=level).compressobj()
+
+
+def compress_bytes(data, compression, level=None):
+    """Compress a small in-memory object in one call"""
+    compressor = create_compressor(compression, level)
+    return compressor.compress(data) + compressor.flush()
+
+
+def file_extension(output_format, compression=None):
+    """File extension for a format, e.g. csv, csv.gz, csv.zst or parquet"""
+    if compression and output_format == 'csv':
+        return f"{output_format}.{COMPRESSION_EXTENSIONS[compression]}"
+    return output_format
+
+
+class S3StreamingCsvWriter:
+    """Write CSV rows to one S3 object through an S3MultipartStream
+
+    With `compression` ('gzip' or 'zstd'), each encoded chunk goes through an
+    incremental compressor before upload, so memory stays bounded by the part
+    size, and the object gets the matching ContentEncoding.
+    Use as a context manager: the upload is completed on success and aborted on error.
+    """
+
+    def __init__(self, s3_client, bucket, key, fieldnames, part_size=DEFAULT_PART_SIZE, compression=None,
+                 compression_level=None, uploader=None, on_finish=None):
+        self.key = key
+        self.compression = compression
+        self.stream = S3MultipartStream(s3_client, bucket, key, CONTENT_TYPES['csv'], part_size,
+                                        content_encoding=compression, uploader=uploader, on_finish=on_finish)
+        self.rows_written = 0
+        self.uncompressed_bytes = 0
+
+        self._compressor = create_compressor(compression, compression_level) if compression else None
+        self._text = StringIO()
+        self._csv = csv.writer(self._text)
+
+        self._csv.writerow(fieldnames)
+        self._encode_pending()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+    @property
+    def parts(self):
+        return self.stream.parts
+
+    @property
+    def bytes_written(self):
+        return self.stream.bytes_written
+
+    @property
+    def buffered_bytes(self):
+        return self.stream.buffered_bytes
+
+    def write_rows(self, rows):
+        """Append a sequence of row tuples"""
+        self._csv.writerows(rows)
+        self.rows_written += len(rows)
+        self._encode_pending()
+
+    def write_batch(self, batch):
+        """Append a TransactionBatch (or any object with rows() and len())"""
+        self._csv.writerows(batch.rows())
+        self.rows_written += len(batch)
+        self._encode_pending()
+
+    def spill(self):
+        """Nothing to do: rows are encoded as they arrive, and an unsent part cannot be sent early"""
+
+    def close(self):
+        if self._compressor is not None:
+            self.stream.write(self._compressor.flush())
+        self.stream.close()
+        return self.key
+
+    def wait(self):
+        """Block until the object exists (see S3MultipartStream.wait)"""
+        self.stream.wait()
+
+    def abort(self):
+        self.stream.abort()
+
+    def _encode_pending(self):
+        """Move encoded (and compressed) CSV text into the upload stream"""
+        data = self._text.getvalue().encode('utf-8')
+        self._text.seek(0)
+        self._text.truncate(0)
+        self.uncompressed_bytes += len(data)
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        self.stream.write(data)
+
+
+def hive_partition(name, value):
+    """One Hive-style key segment, e.g. bank_id=gh.29.uk (the value is URL-escaped)"""
+    return f"{name}={quote(str(value), safe='')}"
+
+
+class ObjectStats:
+    """Row count and min/max of selected columns over the batches written to one object
+
+    NaNs are ignored; a column with no other values gets no min/max.
+    """
+
+    def __init__(self, columns=()):
+        self.columns = list(columns)
+        self.rows = 0
+        self.min = {}
+        self.max = {}
+
+    def update(self, batch):
+        if not len(batch):
+            return
+        self.rows += len(batch)
+        for name in self.columns:
+            values = batch.column(name)
+            if values.dtype.kind == 'f':
+                # NaN (a missing amount) is not a bound, and would not survive strict JSON
+                if np.isnan(values).all():
+                    continue
+                low, high = np.nanmin(values).item(), np.nanmax(values).item()
+            elif values.dtype.kind in 'iu':
+                low, high = values.min().item(), values.max().item()
+            else:  # strings such as ISO timestamps, which sort in time order
+                values = values.tolist()
+                low, high = min(values), max(values)
+            self.min[name] = min(self.min.get(name, low), low)
+            self.max[name] = max(self.max.get(name, high), high)
+
+    def to_dict(self):
+        stats = {'rows': self.rows}
+        if self.columns:
+            stats['min'] = dict(self.min)
+            stats['max'] = dict(self.max)
+        return stats
+
+
+class S3PartitionedWriter:
+    """Split batches on a partition column and stream each partition to its own object
+
+    `open_writer(key)` opens a streaming writer and `key_for(value, file_index)`
+    names a partition's file. At most `max_open` writers stay open, since each
+    buffers up to one part: when another partition arrives, the least recently
+    written one is completed and any later rows for it start a new file
+    (file_index 1, 2, ...). The open writers also share `max_buffered_bytes`: over
+    it, the least recently written ones spill what they can (pending Parquet rows
+    become a row group) and are then completed in the same order. Each completed
+    object is listed in `objects` with its key, partition, size, row count and
+    min/max of `stats_columns`.
+    Use as a context manager: open uploads are completed on success and aborted on error.
+    """
+
+    def __init__(self, open_writer, partition_column, key_for, stats_columns=(),
+                 max_open=DEFAULT_MAX_OPEN_PARTITIONS, max_buffered_bytes=DEFAULT_MAX_BUFFERED_BYTES):
+        self.open_writer = open_writer
+        self.partition_column = partition_column
+        self.key_for = key_for
+        self.stats_columns = list(stats_columns)
+        self.max_open = max_open
+        self.max_buffered_bytes = max_buffered_bytes
+        self.objects = []
+        self.rows_written = 0
+
+        self._open = OrderedDict()  # partition value -> (writer, ObjectStats), least recently written first
+        self._closed = []  # closed writers whose objects may still be finishing
+        self._file_counts = Counter()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+    def write_batch(self, batch):
+        """Append a TransactionBatch (anything with `columns` and select())"""
+        column = batch.columns[self.partition_column]
+        if not len(column):
+            return
+        # Dictionary-coded columns are split on their codes, without decoding
+        if isinstance(column, DictionaryColumn):
+            values, categories = column.codes, column.categories
+        else:
+            values, categories = np.asarray(column), None
+        # Accounts arrive bank by bank, so each partition is usually one contiguous run of rows
+        boundaries = (np.flatnonzero(values[1:] != values[:-1]) + 1).tolist()
+        for start, end in zip([0] + boundaries, boundaries + [len(values)]):
+            value = values[start] if categories is None else categories[values[start]]
+            self._write(value, batch.select(slice(start, end)))
+        self.rows_written += len(values)
+        self._limit_buffered()
+
+    @property
+    def buffered_bytes(self):
+        return sum(writer.buffered_bytes for writer, _ in self._open.values())
+
+    def close(self):
+        while self._open:
+            self._close(*self._open.popitem(last=False))
+        # Writers with an uploader finish their objects in the background
+        for writer in self._closed:
+            writer.wait()
+        self._closed = []
+        return self.objects
+
+    def abort(self):
+        """Abort the open uploads (objects already completed stay in `objects`)"""
+        while self._open:
+            _, (writer, _) = self._open.popitem(last=False)
+            writer.abort()
+        # Objects still finishing in the background are waited for, so no upload outlives the writer;
+        # their own failures are secondary to the error being handled
+        for writer in self._closed:
+            try:
+                writer.wait()
+            except Exception:
+                pass
+        self._closed = []
+
+    def _write(self, value, batch):
+        entry = self._open.get(value)
+        if entry is None:
+            if len(self._open) >= self.max_open:
+                self._close(*self._open.popitem(last=False))
+            entry = (self.open_writer(self.key_for(value, self._file_counts[value])), ObjectStats(self.stats_columns))
+            self._file_counts[value] += 1
+            self._open[value] = entry
+        else:
+            self._open.move_to_end(value)
+
+        writer, stats = entry
+        writer.write_batch(batch)
+        stats.update(batch)
+
+    def _limit_buffered(self):
+        """Spill, then close, the least recently written writers until the open ones fit max_buffered_bytes"""
+        if self.buffered_bytes <= self.max_buffered_bytes:
+            return
+        for writer, _ in list(self._open.values()):
+            writer.spill()
+            if self.buffered_bytes <= self.max_buffered_bytes:
+                return
+        # Each writer still holds its unsent part; the most recently written one stays open
+        while len(self._open) > 1 and self.buffered_bytes > self.max_buffered_bytes:
+            self._close(*self._open.popitem(last=False))
+
+    def _close(self, value, entry):
+        writer, stats = entry
+        writer.close()
+        self._closed.append(writer)
+        self.objects.append({
+            'key': writer.key,
+            'partition': {self.partition_column: str(value)},
+            'bytes': writer.bytes_written,
+            **stats.to_dict()
+        })
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Parquet output requires pyarrow (pip install pyarrow)") from e
+    return pyarrow, pyarrow.parquet
+
+
+def arrow_schema(column_types):
+    """Build a pyarrow schema from (name, type) pairs such as TRANSACTION_COLUMN_TYPES"""
+    pa, _ = _import_pyarrow()
+    arrow_types = {
+        'string': pa.string(),
+        'float64': pa.float64(),
+        'int64': pa.int64(),
+        'bool': pa.bool_(),
+        'timestamp': pa.timestamp('us')
+    }
+    return pa.schema([(name, arrow_types[type_name]) for name, type_name in column_types])
+
+
+class S3StreamingParquetWriter:
+    """Write typed, compressed Parquet row groups to one S3 object
+
+    Batches are buffered until `row_group_size` rows are pending, then written as a
+    row group (or earlier on spill()); the encoded bytes go straight to an S3MultipartStream.
+    """
+
+    def __init__(self, s3_client, bucket, key, column_types, part_size=DEFAULT_PART_SIZE,
+                 row_group_size=DEFAULT_ROW_GROUP_SIZE, compression=DEFAULT_PARQUET_COMPRESSION, uploader=None,
+                 on_finish=None):
+        pa, pq = _import_pyarrow()
+        self._pa = pa
+
+        self.key = key
+        self.schema = arrow_schema(column_types)
+        self.row_group_size = row_group_size
+        self.stream = S3MultipartStream(s3_client, bucket, key, CONTENT_TYPES['parquet'], part_size, uploader=uploader,
+                                        on_finish=on_finish)
+        self.rows_written = 0
+
+        self._pending = []
+        self._pending_rows = 0
+        self._pending_bytes = 0
+        self._writer = pq.ParquetWriter(
+            self.stream,
+            self.schema,
+            compression=compression,
+            use_dictionary=[name for name in self.schema.names if name in DICTIONARY_COLUMNS]
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+    @property
+    def parts(self):
+        return self.stream.parts
+
+    @property
+    def bytes_written(self):
+        return self.stream.bytes_written
+
+    @property
+    def buffered_bytes(self):
+        return self._pending_bytes + self.stream.buffered_bytes
+
+    def write_batch(self, batch):
+        """Append a TransactionBatch (anything with to_arrow(schema))"""
+        table = batch.to_arrow(self.schema)
+        self._pending.append(table)
+        self._pending_rows += len(batch)
+        self._pending_bytes += table.nbytes
+        self.rows_written += len(batch)
+
+        if self._pending_rows >= self.row_group_size:
+            self._write_pending()
+
+    def spill(self):
+        """Write the pending rows now, as a smaller row group"""
+        self._write_pending()
+
+    def close(self):
+        self._write_pending()
+        self._writer.close()
+        self.stream.close()
+        return self.key
+
+    def wait(self):
+        """Block until the object exists (see S3MultipartStream.wait)"""
+        self.stream.wait()
+
+    def abort(self):
+        self._pending = []
+        self._pending_bytes = 0
+        self.stream.abort()
+
+    def _write_pending(self):
+        if not self._pending:
+            return
+        table = self._pa.concat_tables(self._pending)
+        self._writer.write_table(table, row_group_size=self.row_group_size)
+        self._pending = []
+        self._pending_rows = 0
+        self._pending_bytes = 0
+
+
+def records_to_parquet(records, compression=DEFAULT_PARQUET_COMPRESSION):
+    """Encode a small list of dicts (banks, accounts) as Parquet bytes"""
+    pa, pq = _import_pyarrow()
+    output = BytesIO()
+    pq.write_table(pa.Table.from_pylist(records), output, compression=compression)
+    return output.getvalue()
@@ -0,0 +1,385 @@
+"""
+Vectorized synthetic transaction generator
+Draws whole columns with NumPy instead of building one dict per row;
+categorical columns are drawn directly as dictionary codes
+
+Shared by pipeline.py (the generate stage), lambda_handler.py and hybrid_data_pipeline.py
+"""
+
+import hashlib
+import json
+import os
+import secrets
+from datetime import datetime
+from itertools import islice
+
+import numpy as np
+
+from transaction_schema import ConstantColumn, DictionaryColumn, TransactionBatch, code_dtype
+
+TRANSACTION_TYPES = np.array(['ATM Withdrawal', 'POS Purchase', 'Online Transfer', 'Direct Debit',
+                              'Salary Deposit', 'Refund', 'Bill Payment', 'Cash Deposit'])
+
+CREDIT_TYPES = ['Salary Deposit', 'Refund', 'Cash Deposit']
+
+# Transaction types are drawn as codes into TRANSACTION_TYPES
+CREDIT_TYPE_CODES = np.flatnonzero(np.isin(TRANSACTION_TYPES, CREDIT_TYPES))
+POS_CODE, TRANSFER_CODE, SALARY_CODE = (
+    int(np.flatnonzero(TRANSACTION_TYPES == name)[0]) for name in ['POS Purchase', 'Online Transfer', 'Salary Deposit']
+)
+
+MERCHANTS = np.array(['Amazon', 'Walmart', 'Starbucks', 'Shell Gas', 'Netflix', 'Spotify',
+                      'Uber', 'Restaurant', 'Supermarket', 'Pharmacy'])
+
+CURRENCIES = np.array(['GBP', 'EUR', 'USD'])
+
+DAY_NAMES = np.array(['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'])
+
+# Accounts generated per batch (bounds peak memory; also the unit of parallel work)
+DEFAULT_ACCOUNTS_PER_BATCH = 250
+
+# Uniforms drawn per row: time, type, amount, currency, merchant, counterparty
+N_DRAWS = 6
+
+# Days covered by a full backfill
+HISTORY_DAYS = 90
+
+# Independent per-account streams: row uniforms, and incremental row counts
+ROW_STREAM = 0
+COUNT_STREAM = 1
+
+# Faker names/companies are pre-generated once per process and sampled by index
+DEFAULT_POOL_SIZE = 2000
+POOL_SEED = 0
+
+# Names/companies for POOL_SEED shipped with the code, so Lambda never imports Faker
+# (regenerate with: python synthetic_generator.py --write-pool)
+PRECOMPUTED_POOL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'faker_pool.json')
+
+_faker_pools = {}
+
+
+class FakerPool:
+    """Fixed arrays of Faker person and company names
+
+    Also holds the categories that dictionary-coded columns index into: the
+    unique names (with each pool name's code among them) and every possible
+    description, in blocks starting at transfer_offset and salary_offset.
+    """
+
+    def __init__(self, names, companies):
+        self.names = names
+        self.companies = companies
+
+        # Faker repeats some names, and categories must be unique
+        self.name_categories, self.name_codes = np.unique(names, return_inverse=True)
+        company_categories, self.company_codes = np.unique(companies, return_inverse=True)
+        self.transfer_offset = len(TRANSACTION_TYPES) + len(MERCHANTS)
+        self.salary_offset = self.transfer_offset + len(self.name_categories)
+        self.description_categories = np.array(
+            TRANSACTION_TYPES.tolist()
+            + [f"POS Purchase at {merchant}" for merchant in MERCHANTS.tolist()]
+            + [f"Online Transfer to {name}" for name in self.name_categories.tolist()]
+            + [f"Salary Deposit from {company}" for company in company_categories.tolist()],
+            dtype=object
+        )
+
+
+def build_faker_pool(size, seed):
+    """Generate a pool with Faker (imported here, since loading its providers is slow)"""
+    try:
+        from faker import Faker
+    except ImportError as e:
+        raise ImportError(f"A Faker pool larger than {os.path.basename(PRECOMPUTED_POOL_FILE)} "
+                          f"requires Faker (pip install Faker)") from e
+
+    fake = Faker()
+    fake.seed_instance(seed)
+    return FakerPool(
+        np.array([fake.name() for _ in range(size)], dtype=object),
+        np.array([fake.company() for _ in range(size)], dtype=object)
+    )
+
+
+def load_precomputed_pool(size, seed):
+    """Read the first `size` names/companies from PRECOMPUTED_POOL_FILE, or None if it cannot serve them"""
+    if seed != POOL_SEED:
+        return None
+    try:
+        with open(PRECOMPUTED_POOL_FILE) as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    if len(data['names']) < size or len(data['companies']) < size:
+        return None
+    return FakerPool(
+        np.array(data['names'][:size], dtype=object),
+        np.array(data['companies'][:size], dtype=object)
+    )
+
+
+def get_faker_pool(size=DEFAULT_POOL_SIZE, seed=POOL_SEED):
+    """Return the name/company pool for (size, seed), loading or building it on first use
+
+    Pools live at module scope, so warm Lambda invocations reuse them.
+    """
+    key = (size, seed)
+    if key not in _faker_pools:
+        _faker_pools[key] = load_precomputed_pool(size, seed) or build_faker_pool(size, seed)
+    return _faker_pools[key]
+
+
+def write_precomputed_pool(size=DEFAULT_POOL_SIZE, path=PRECOMPUTED_POOL_FILE):
+    """Write the POOL_SEED pool to `path` with Faker"""
+    pool = build_faker_pool(size, POOL_SEED)
+    with open(path, 'w') as f:
+        json.dump({'seed': POOL_SEED, 'names': pool.names.tolist(), 'companies': pool.companies.tolist()}, f, indent=0)
+    return path
+
+
+def new_run_seed():
+    """Pick a fresh seed for a run that did not request one (record it to reproduce the run)"""
+    return secrets.randbits(32)
+
+
+def account_seed(seed, account_id, stream=ROW_STREAM, state=None):
+    """SeedSequence for one account: derived from the run seed and a hash of account_id
+
+    Any process can regenerate one account's transactions from (seed, account_id)
+    alone, regardless of batching, sharding or worker count. For an account with
+    saved `state`, its last_seq and last_date are mixed in as well, so each
+    incremental window draws new transactions instead of replaying the previous
+    window's with the same seed.
+    """
+    digest = hashlib.blake2b(str(account_id).encode('utf-8'), digest_size=16).digest()
+    entropy = [seed] + np.frombuffer(digest, dtype=np.uint32).tolist()
+    if state:
+        last_date = np.datetime64(datetime.fromisoformat(state['last_date']), 's').astype(np.int64)
+        entropy += [int(state['last_seq']) + 1, int(last_date)]
+    return np.random.SeedSequence(entropy, spawn_key=(stream,) if stream else ())
+
+
+def draw_account_uniforms(account_ids, counts, seed, states=None):
+    """Draw each account's uniforms from its own stream (continuing from its state, if any)
+
+    Returns (draws, starts): draws has shape (N_DRAWS, sum(counts)) with each
+    account's rows contiguous, and starts holds one uniform per account for the
+    starting balance.
+    """
+    draws = np.empty((N_DRAWS, int(counts.sum())))
+    starts = np.empty(len(account_ids))
+
+    states = states or [None] * len(account_ids)
+    offset = 0
+    for i, (account_id, count, state) in enumerate(zip(account_ids, counts, states)):
+        rng = np.random.default_rng(account_seed(seed, account_id, state=state))
+        draws[:, offset:offset + count] = rng.random((N_DRAWS, count))
+        starts[i] = rng.random()
+        offset += count
+    return draws, starts
+
+
+def plan_account_windows(account_ids, states, transactions_per_account, seed, now):
+    """Decide each account's row count, time window, starting balance and first sequence number
+
+    Accounts without state get a full backfill: `transactions_per_account` rows over
+    the HISTORY_DAYS before `now`. Accounts with state get the time since their
+    last_date, with a Poisson row count at the same average rate, and continue
+    their balance and sequence numbers. Returns (counts, window_starts,
+    window_lengths, start_balances, first_seqs); start_balances is NaN where a
+    fresh random balance should be drawn.
+    """
+    n_accounts = len(account_ids)
+    now = np.datetime64(now, 'us')
+    history = np.timedelta64(HISTORY_DAYS, 'D').astype('timedelta64[us]')
+
+    counts = np.full(n_accounts, transactions_per_account, dtype=np.int64)
+    window_starts = np.full(n_accounts, now - history)
+    start_balances = np.full(n_accounts, np.nan)
+    first_seqs = np.zeros(n_accounts, dtype=np.int64)
+
+    for i, state in enumerate(states or []):
+        if not state:
+            continue
+        start = min(np.datetime64(datetime.fromisoformat(state['last_date']), 'us'), now)
+        rng = np.random.default_rng(account_seed(seed, account_ids[i], COUNT_STREAM, state))
+        counts[i] = rng.poisson(transactions_per_account * ((now - start) / history))
+        window_starts[i] = start
+        start_balances[i] = state['last_balance']
+        first_seqs[i] = state['last_seq'] + 1
+    return counts, window_starts, now - window_starts, start_balances, first_seqs
+
+
+def generate_transaction_batch(account_ids, bank_ids, transactions_per_account, seed, now=None, pool=None,
+                               states=None):
+    """Generate transactions for a group of accounts as one columnar batch
+
+    Random numbers come from per-account streams (see account_seed); everything
+    after the draws is vectorized across the whole batch. Each account's rows are
+    in time order, so balance_after is its running balance. `states` (one dict or
+    None per account) switches accounts to incremental generation, see
+    plan_account_windows; the returned batch carries every account's new state.
+    """
+    now = now or datetime.now()
+    pool = pool or get_faker_pool()
+    account_ids = np.asarray(account_ids, dtype=str)
+    bank_ids = np.asarray(bank_ids, dtype=str)
+
+    counts, window_starts, window_lengths, start_balances, first_seqs = plan_account_windows(
+        account_ids, states, transactions_per_account, seed, now
+    )
+    size = int(counts.sum())
+    offsets = np.cumsum(counts) - counts  # index of each account's first row
+
+    draws, starts = draw_account_uniforms(account_ids, counts, seed, states)
+    u_time, u_type, u_amount, u_currency, u_merchant, u_counterparty = draws
+
+    # Sort each account's time draws, so its rows (and the cumsum below) run in time order
+    account_index = np.repeat(np.arange(len(account_ids)), counts)
+    u_time = u_time[np.lexsort((u_time, account_index))]
+
+    # Timestamp anywhere in the account's window, to the second
+    elapsed = (u_time * np.repeat(window_lengths, counts).astype(np.float64)).astype('timedelta64[us]')
+    tx_dates = (np.repeat(window_starts, counts) + elapsed).astype('datetime64[s]')
+    tx_days = tx_dates.astype('datetime64[D]')
+    hours = ((tx_dates - tx_days) // np.timedelta64(1, 'h')).astype(np.int64)
+    weekdays = (tx_days.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+
+    type_codes = (u_type * len(TRANSACTION_TYPES)).astype(np.int8)
+    is_credit = np.isin(type_codes, CREDIT_TYPE_CODES)
+
+    # Credits draw from 500-5000, debits from 5-500
+    amounts = np.round(np.where(is_credit, 500 + u_amount * 4500, 5 + u_amount * 495), 2)
+    amounts_signed = np.where(is_credit, amounts, -amounts)
+
+    # Running balance per account: starting balance plus the cumulative sum of its own rows
+    # (one cumsum over the batch, minus the total of the accounts before it)
+    starting_balances = np.where(np.isnan(start_balances), 1000 + starts * 49000, start_balances)
+    running = np.cumsum(amounts_signed)
+    preceding = np.concatenate([[0.0], running])[offsets]
+    balances = np.round(np.repeat(starting_balances - preceding, counts) + running, 2)
+
+    currency_codes = (u_currency * len(CURRENCIES)).astype(np.int8)
+
+    is_pos = type_codes == POS_CODE
+    is_transfer = type_codes == TRANSFER_CODE
+    is_salary = type_codes == SALARY_CODE
+
+    # Categorical columns are codes into fixed category arrays (-1 = no value)
+    merchant_codes = np.full(size, -1, dtype=np.int8)
+    merchant_codes[is_pos] = (u_merchant[is_pos] * len(MERCHANTS)).astype(np.int8)
+
+    # The transfer counterparty is the same person named in the description
+    counterparty_codes = np.full(size, -1, dtype=code_dtype(len(pool.name_categories)))
+    counterparty_codes[is_transfer] = pool.name_codes[(u_counterparty[is_transfer] * len(pool.names)).astype(np.int64)]
+    company_codes = pool.company_codes[(u_counterparty[is_salary] * len(pool.companies)).astype(np.int64)]
+    description_codes = type_codes.astype(code_dtype(len(pool.description_categories)))
+    description_codes[is_pos] = len(TRANSACTION_TYPES) + merchant_codes[is_pos]
+    description_codes[is_transfer] = pool.transfer_offset + counterparty_codes[is_transfer]
+    description_codes[is_salary] = pool.salary_offset + company_codes
+
+    bank_categories, bank_codes = np.unique(bank_ids, return_inverse=True)
+    account_categories, account_codes = np.unique(account_ids, return_inverse=True)
+
+    # Sequence numbers continue from the account's last transaction
+    row_accounts = np.repeat(account_ids, counts)
+    sequence = np.arange(size) - np.repeat(offsets - first_seqs, counts)
+    sequence_labels = np.char.zfill(sequence.astype(str), 4) if size else sequence.astype(str)
+    transaction_ids = np.char.add(np.char.add(np.char.add('synth_', row_accounts), '_'), sequence_labels)
+
+    return TransactionBatch({
+        'transaction_id': transaction_ids,
+        'bank_id': DictionaryColumn(np.repeat(bank_codes.astype(code_dtype(len(bank_categories))), counts),
+                                    bank_categories),
+        'account_id': DictionaryColumn(np.repeat(account_codes.astype(code_dtype(len(account_categories))), counts),
+                                       account_categories),
+        'amount': amounts_signed,
+        'currency': DictionaryColumn(currency_codes, CURRENCIES),
+        'transaction_type': DictionaryColumn(type_codes, TRANSACTION_TYPES),
+        'description': DictionaryColumn(description_codes, pool.description_categories),
+        'merchant': DictionaryColumn(merchant_codes, MERCHANTS),
+        'transaction_date': np.datetime_as_string(tx_dates, unit='s'),
+        'transaction_hour': hours,
+        'day_of_week': DictionaryColumn(weekdays.astype(np.int8), DAY_NAMES),
+        'is_weekend': weekdays >= 5,
+        'balance_after': balances,
+        'counterparty_name': DictionaryColumn(counterparty_codes, pool.name_categories),
+        'data_source': ConstantColumn('SYNTHETIC', size),
+        'generated_at': ConstantColumn(now.isoformat(), size)
+    }, next_account_states(account_ids, bank_ids, counts, offsets, balances, first_seqs, starting_balances, now))
+
+
+def next_account_states(account_ids, bank_ids, counts, offsets, balances, first_seqs, starting_balances, now):
+    """State of each account after a batch: generated up to `now`, with its last balance and sequence"""
+    has_rows = counts > 0
+    last_balances = starting_balances.copy()
+    last_balances[has_rows] = balances[(offsets + counts - 1)[has_rows]]
+    return [
+        {
+            'account_id': account_id,
+            'bank_id': bank_id,
+            'last_balance': round(last_balance, 2),
+            'last_date': now.isoformat(),
+            'last_seq': last_seq
+        }
+        for account_id, bank_id, last_balance, last_seq in zip(
+            account_ids.tolist(), bank_ids.tolist(), last_balances.tolist(),
+            (first_seqs + counts - 1).tolist()
+        )
+    ]
+
+
+def iter_account_chunks(accounts, accounts_per_batch=DEFAULT_ACCOUNTS_PER_BATCH):
+    """Yield lists of at most `accounts_per_batch` accounts from any iterable"""
+    accounts = iter(accounts)
+    while True:
+        chunk = list(islice(accounts, accounts_per_batch))
+        if not chunk:
+            return
+        yield chunk
+
+
+def generate_chunk(accounts, transactions_per_account, seed, now, pool_size=DEFAULT_POOL_SIZE, states=None):
+    """Generate one chunk of accounts; picklable entry point for process pools"""
+    return generate_transaction_batch(
+        [account['account_id'] for account in accounts],
+        [account['bank_id'] for account in accounts],
+        transactions_per_account,
+        seed,
+        now,
+        get_faker_pool(pool_size),
+        states
+    )
+
+
+def iter_transaction_batches(accounts, transactions_per_account=100, seed=None,
+                             accounts_per_batch=DEFAULT_ACCOUNTS_PER_BATCH, pool_size=DEFAULT_POOL_SIZE,
+                             state_store=None):
+    """Yield TransactionBatch objects covering `accounts` (dicts with account_id/bank_id)
+
+    `accounts` may be a generator; it is consumed one batch of accounts at a time.
+    A None seed picks a fresh one; pass an explicit seed to reproduce a run.
+    With a `state_store` (anything with load(accounts) returning one state or None
+    per account), accounts that already have state are generated incrementally.
+    """
+    if seed is None:
+        seed = new_run_seed()
+    now = datetime.now()
+
+    for chunk in iter_account_chunks(accounts, accounts_per_batch):
+        states = state_store.load(chunk) if state_store is not None else None
+        yield generate_chunk(chunk, transactions_per_account, seed, now, pool_size, states)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Synthetic transaction generator utilities")
+    parser.add_argument('--write-pool', action='store_true', help=f"Regenerate {os.path.basename(PRECOMPUTED_POOL_FILE)}")
+    parser.add_argument('--pool-size', type=int, default=DEFAULT_POOL_SIZE)
+    args = parser.parse_args()
+
+    if args.write_pool:
+        print(f"Wrote {write_precomputed_pool(args.pool_size)}")
+    else:
+        parser.print_help()
@@ -10,152 +10,84 @@ Usage:
     python test_fetch_data.py
 """
 
-import requests
-import pandas as pd
-from datetime import datetime
 from config import Config
+from pipeline import LocalFileSink, OBPSource, create_auth, create_http_session
+from transaction_schema import TransactionBatch
+
+# Same settings, session (timeouts and retries) and token cache as hybrid_data_pipeline.py
+settings = Config.pipeline_settings()
+obp_source = OBPSource(settings, create_auth(settings, create_http_session(settings)))
 
 
 def authenticate():
-    """Test DirectLogin authentication and return token"""
+    """Test DirectLogin authentication (reusing a cached token when valid)"""
     print("\n" + "=" * 60)
     print("STEP 1: Testing Authentication")
     print("=" * 60)
     
-    url = Config.OBP_DIRECTLOGIN_ENDPOINT
-    headers = {
-        "Authorization": f'DirectLogin username="{Config.OBP_USERNAME}", password="{Config.OBP_PASSWORD}", consumer_key="{Config.OBP_CONSUMER_KEY}"',
-        "Accept": "application/json"
-    }
-    
-    print(f"Endpoint: {url}")
-    print(f"Username: {Config.OBP_USERNAME}")
-    
-    response = requests.post(url, headers=headers)
+    print(f"Endpoint: {settings.obp_directlogin_endpoint}")
+    print(f"Username: {settings.obp_username}")
     
-    if response.status_code == 201:
-        token = response.json()["token"]
-        print(f"[SUCCESS] Authentication successful! Token: {token[:20]}...")
-        return token
-    else:
-        print(f"[ERROR] Authentication failed: {response.status_code}")
-        print(f"Response: {response.text}")
-        raise Exception("Authentication failed")
+    auth = obp_source.authenticate()
+    print(f"[SUCCESS] Token: {auth.token()[:20]}...")
+    return auth
 
-def fetch_banks(token):
+def fetch_banks():
     """Fetch list of banks"""
     print("\n" + "=" * 60)
     print("STEP 2: Fetching Banks")
     print("=" * 60)
     
-    url = f"{Config.OBP_BASE_URL}/obp/{Config.OBP_API_VERSION}/banks"
-    headers = {
-        "Authorization": f'DirectLogin token="{token}"',
-        "Accept": "application/json"
-    }
-    
-    response = requests.get(url, headers=headers)
-    
-    if response.status_code == 200:
-        banks = response.json()["banks"]
-        print(f"[SUCCESS] Found {len(banks)} banks")
-        print(f"\nFirst 3 banks:")
-        for bank in banks[:3]:
-            print(f"  - {bank['id']}: {bank.get('full_name', 'N/A')}")
-        return banks
-    else:
-        print(f"[ERROR] Failed: {response.status_code} - {response.text}")
-        raise Exception("Failed to fetch banks")
+    banks = obp_source.fetch_banks()
+    print(f"[SUCCESS] Found {len(banks)} banks")
+    print(f"\nFirst 3 banks:")
+    for bank in banks[:3]:
+        print(f"  - {bank['bank_id']}: {bank['bank_name']}")
+    return banks
 
-def fetch_accounts(token, bank_id):
+def fetch_accounts(bank_id):
     """Fetch PUBLIC accounts for a specific bank (no user linking required)"""
     print("\n" + "=" * 60)
     print(f"STEP 3: Fetching PUBLIC Accounts for Bank: {bank_id}")
     print("=" * 60)
     
-    # Try public accounts endpoint first (most likely to have test data)
-    url = f"{Config.OBP_BASE_URL}/obp/{Config.OBP_API_VERSION}/banks/{bank_id}/accounts/public"
-    headers = {
-        "Authorization": f'DirectLogin token="{token}"',
-        "Accept": "application/json"
-    }
+    accounts = list(obp_source.iter_accounts([bank_id]))
     
-    response = requests.get(url, headers=headers)
+    if accounts:
+        print(f"[SUCCESS] Found {len(accounts)} public accounts")
+        print(f"\nFirst 3 accounts:")
+        for account in accounts[:3]:
+            print(f"  - {account['account_id']}: {account['account_label']}")
+        return accounts
     
-    if response.status_code == 200:
-        data = response.json()
-        
-        # Handle different response formats
-        if isinstance(data, list):
-            accounts = data
-        elif isinstance(data, dict):
-            accounts = data.get("accounts", [])
-        else:
-            accounts = []
-        
-        if accounts:
-            print(f"[SUCCESS] Found {len(accounts)} public accounts")
-            print(f"\nFirst 3 accounts:")
-            for account in accounts[:3]:
-                account_id = account.get('id', 'N/A')
-                account_label = account.get('label', account.get('account_label', 'N/A'))
-                print(f"  - {account_id}: {account_label}")
-            return accounts
-    
-    print(f"[WARNING] No public accounts found (status: {response.status_code})")
+    print(f"[WARNING] No public accounts found")
     return []
 
-def fetch_transactions(token, bank_id, account_id):
-    """Fetch transactions for a public account"""
+def fetch_transactions(account):
+    """Fetch every transaction of a public account (public view first, then owner) as one batch"""
     print("\n" + "=" * 60)
     print(f"STEP 4: Fetching Transactions")
-    print(f"Bank: {bank_id}, Account: {account_id}")
+    print(f"Bank: {account['bank_id']}, Account: {account['account_id']}")
     print("=" * 60)
     
-    # Try public view first, then owner view
-    endpoints = [
-        f"{Config.OBP_BASE_URL}/obp/{Config.OBP_API_VERSION}/banks/{bank_id}/accounts/{account_id}/public/transactions",
-        f"{Config.OBP_BASE_URL}/obp/{Config.OBP_API_VERSION}/banks/{bank_id}/accounts/{account_id}/owner/transactions"
-    ]
-    
-    headers = {
-        "Authorization": f'DirectLogin token="{token}"',
-        "Accept": "application/json"
-    }
+    transactions = TransactionBatch.concat(obp_source.iter_transactions([account]))
     
-    for url in endpoints:
-        response = requests.get(url, headers=headers)
+    if transactions:
+        print(f"[SUCCESS] Found {len(transactions)} transactions")
         
-        if response.status_code == 200:
-            data = response.json()
-            
-            # Handle different response formats
-            if isinstance(data, list):
-                transactions = data
-            elif isinstance(data, dict):
-                transactions = data.get("transactions", [])
-            else:
-                transactions = []
-            
-            if transactions:
-                print(f"[SUCCESS] Found {len(transactions)} transactions")
-                
-                print(f"\nFirst transaction sample:")
-                tx = transactions[0]
-                details = tx.get('details', {})
-                value = details.get('value', {})
-                print(f"  ID: {tx.get('id', 'N/A')}")
-                print(f"  Amount: {value.get('amount', 'N/A')} {value.get('currency', 'N/A')}")
-                print(f"  Description: {details.get('description', 'N/A')}")
-                print(f"  Date: {details.get('completed', details.get('posted', 'N/A'))}")
-                
-                return transactions
+        print(f"\nFirst transaction sample:")
+        tx = transactions.select(slice(0, 1)).to_records()[0]
+        print(f"  ID: {tx['transaction_id']}")
+        print(f"  Amount: {tx['amount']} {tx['currency']}")
+        print(f"  Description: {tx['description']}")
+        print(f"  Date: {tx['transaction_date']}")
+        return transactions
     
     print(f"[WARNING] No transactions found")
-    return []
+    return transactions
 
-def save_to_csv(transactions, bank_id):
-    """Save transactions to local CSV"""
+def save_to_csv(transactions):
+    """Save transactions to a local CSV file, with the same columns as the pipeline's transactions"""
     print("\n" + "=" * 60)
     print("STEP 5: Saving to CSV")
     print("=" * 60)
@@ -164,38 +96,9 @@ def save_to_csv(transactions, bank_id):
         print("[WARNING] No transactions to save")
         return None
     
-    data = []
-    for tx in transactions:
-        try:
-            this_account = tx.get('this_account', tx.get('account', {}))
-            details = tx.get('details', {})
-            value = details.get('value', {})
-            new_balance = details.get('new_balance', {})
-            
-            data.append({
-                'transaction_id': tx.get('id', 'N/A'),
-                'bank_id': bank_id,
-                'account_id': this_account.get('id', 'N/A'),
-                'amount': value.get('amount', 0),
-                'currency': value.get('currency', 'N/A'),
-                'description': details.get('description', 'N/A'),
-                'transaction_date': details.get('completed', details.get('posted', 'N/A')),
-                'balance_after': new_balance.get('amount', 0),
-                'extracted_at': datetime.now().isoformat()
-            })
-        except Exception as e:
-            print(f"[WARNING] Skipping transaction due to parsing error: {e}")
-            continue
-    
-    if not data:
-        print("[ERROR] No valid transactions to save")
-        return None
-    
-    df = pd.DataFrame(data)
-    filename = f"sample_transactions_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-    df.to_csv(filename, index=False)
+    LocalFileSink(prefix='sample_').write_batches('transactions', [transactions])
     
-    print(f"[SUCCESS] Saved {len(df)} transactions to: {filename}")
+    df = transactions.to_frame()
     print(f"\nData shape: {df.shape}")
     print(f"\nFirst 3 rows:")
     print(df.head(3).to_string())
@@ -223,26 +126,26 @@ def main():
         return
     
     try:
-        token = authenticate()
-        banks = fetch_banks(token)
+        authenticate()
+        banks = fetch_banks()
         
         if not banks:
             print("\n[ERROR] No banks available")
             return
         
-        bank_id = banks[0].get('id', '')
+        bank_id = banks[0].get('bank_id', '')
         if not bank_id:
             print("\n[ERROR] Invalid bank data structure")
             return
         
-        accounts = fetch_accounts(token, bank_id)
+        accounts = fetch_accounts(bank_id)
         
         if not accounts:
             print("\n[WARNING] No accounts found, trying next bank...")
             for bank in banks[1:4]:
-                bank_id = bank.get('id', '')
+                bank_id = bank.get('bank_id', '')
                 if bank_id:
-                    accounts = fetch_accounts(token, bank_id)
+                    accounts = fetch_accounts(bank_id)
                     if accounts:
                         break
         
@@ -250,15 +153,15 @@ def main():
             print("\n[ERROR] No accounts found in any bank")
             return
         
-        account_id = accounts[0].get('id', '')
+        account_id = accounts[0].get('account_id', '')
         if not account_id:
             print("\n[ERROR] Invalid account data structure")
             return
         
-        transactions = fetch_transactions(token, bank_id, account_id)
+        transactions = fetch_transactions(accounts[0])
         
         if transactions:
-            save_to_csv(transactions, bank_id)
+            save_to_csv(transactions)
             print("\n" + "=" * 60)
             print("[SUCCESS] TEST COMPLETE - API WORKS!")
             print("=" * 60)
@@ -272,11 +175,11 @@ def main():
             
             # Try up to 10 accounts to find transactions
             for account in accounts[1:10]:
-                account_id = account.get('id', '')
+                account_id = account.get('account_id', '')
                 if account_id:
-                    transactions = fetch_transactions(token, bank_id, account_id)
+                    transactions = fetch_transactions(account)
                     if transactions:
-                        save_to_csv(transactions, bank_id)
+                        save_to_csv(transactions)
                         print("\n" + "=" * 60)
                         print("[SUCCESS] TEST COMPLETE - FOUND TRANSACTIONS!")
                         print("=" * 60)
@@ -285,16 +188,16 @@ def main():
                 # If still no transactions, try another bank
                 print("\n[WARNING] No transactions in this bank, trying another bank...")
                 for bank in banks[1:5]:
-                    bank_id = bank.get('id', '')
+                    bank_id = bank.get('bank_id', '')
                     if bank_id:
-                        accounts = fetch_accounts(token, bank_id)
+                        accounts = fetch_accounts(bank_id)
                         if accounts:
                             for account in accounts[:5]:
-                                account_id = account.get('id', '')
+                                account_id = account.get('account_id', '')
                                 if account_id:
-                                    transactions = fetch_transactions(token, bank_id, account_id)
+                                    transactions = fetch_transactions(account)
                                     if transactions:
-                                        save_to_csv(transactions, bank_id)
+                                        save_to_csv(transactions)
                                         print("\n" + "=" * 60)
                                         print("[SUCCESS] TEST COMPLETE - FOUND TRANSACTIONS!")
                                         print("=" * 60)
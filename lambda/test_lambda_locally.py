@@ -5,6 +5,8 @@ Simulates AWS Lambda environment locally before deployment
 
 import sys
 import os
+import json
+from concurrent.futures import ProcessPoolExecutor
 from unittest.mock import MagicMock, patch
 
 # Add current directory to path for imports
@@ -12,6 +14,7 @@ sys.path.insert(0, os.path.dirname(__file__))
 
 # Mock AWS environment variables from .env
 from config import Config
+from local_s3 import LocalS3Client
 
 os.environ['OBP_BASE_URL'] = Config.OBP_BASE_URL
 os.environ['OBP_API_VERSION'] = Config.OBP_API_VERSION
@@ -21,18 +24,8 @@ os.environ['OBP_CONSUMER_KEY'] = Config.OBP_CONSUMER_KEY
 os.environ['OBP_DIRECTLOGIN_ENDPOINT'] = Config.OBP_DIRECTLOGIN_ENDPOINT
 os.environ['S3_BUCKET_NAME'] = 'local-test-bucket'
 
-# Mock S3 client BEFORE importing lambda_handler
-def mock_put_object(Bucket, Key, Body, ContentType):
-    """Mock S3 put_object - saves to local file instead"""
-    local_file = f"local_test_{Key.replace('/', '_')}"
-    with open(local_file, 'w') as f:
-        f.write(Body)
-    print(f"[LOCAL TEST] Saved to: {local_file}")
-    return {'ETag': 'mock-etag'}
-
-# Create mock S3 client
-mock_s3_client = MagicMock()
-mock_s3_client.put_object = mock_put_object
+# Mock S3 client BEFORE importing lambda_handler: objects are saved as local_test_* files
+mock_s3_client = LocalS3Client()
 
 # Patch boto3.client to return our mock
 import boto3
@@ -40,18 +33,49 @@ original_boto3_client = boto3.client
 boto3.client = lambda service_name, **kwargs: mock_s3_client if service_name == 's3' else original_boto3_client(service_name, **kwargs)
 
 # NOW import lambda handler (after patching boto3)
+import lambda_handler as handler_module
 from lambda_handler import lambda_handler
 
+# Worker processes for --sharded runs
+LOCAL_WORKERS = 4
+
+def run_local_worker(shard_event):
+    """Run one worker shard in a child process (the S3 mock above is installed on import)"""
+    result = lambda_handler(shard_event, None)
+    return json.loads(result['body'])
+
+def dispatch_shards_locally(shard_events, context):
+    """Stand-in for Lambda fan-out: run each worker event in a process pool"""
+    print(f"[LOCAL TEST] Running {len(shard_events)} shards in {LOCAL_WORKERS} worker processes")
+    with ProcessPoolExecutor(max_workers=LOCAL_WORKERS) as executor:
+        return list(executor.map(run_local_worker, shard_events))
+
 def main():
-    """Run Lambda handler locally"""
+    """Run Lambda handler locally
+
+    Pass --sharded to run coordinator mode with workers in a local process pool,
+    --incremental to continue from the account state saved by earlier runs, and
+    --real to fetch each account's real transactions instead of generating them.
+    """
+    sharded = '--sharded' in sys.argv
+    incremental = '--incremental' in sys.argv
+    real = '--real' in sys.argv
+    
     print("=" * 70)
-    print("LOCAL LAMBDA TEST")
+    print("LOCAL LAMBDA TEST" + (" (SHARDED)" if sharded else ""))
     print("=" * 70)
     print("\nThis simulates AWS Lambda execution locally")
     print("S3 uploads will be saved as local files instead\n")
     
     # Mock Lambda event and context
     event = {}
+    if sharded:
+        event = {'mode': 'coordinator'}
+        handler_module.dispatch_shards = dispatch_shards_locally
+    if incremental:
+        event['incremental'] = True
+    if real:
+        event['source'] = 'real'
     context = MagicMock()
     context.function_name = 'local-test'
     context.request_id = 'local-request-id'
@@ -70,9 +94,12 @@ def main():
         if result['statusCode'] == 200:
             print("\n[SUCCESS] Lambda handler executed successfully!")
             print("\nLocal test files created:")
-            print("  - local_test_raw_banks_*.csv")
-            print("  - local_test_raw_accounts_*.csv")
-            print("  - local_test_raw_transactions_*.csv")
+            print("  - local_test_raw_banks_dt=*.csv")
+            print("  - local_test_raw_accounts_dt=*.csv")
+            print("  - local_test_raw_transactions_dt=*_bank_id=*.csv (one per bank" + (" and shard)" if sharded else ")"))
+            print("  - local_test_raw__manifests_*.json" + (" (run manifest and shard results)" if sharded else " (run manifest)"))
+            if incremental:
+                print("  - local_test_state_accounts_*.json (one per account)")
         else:
             print("\n[ERROR] Lambda handler failed")
             
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The Lambda modules are flat files in lambda/, imported the way the handler imports them
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,24 @@
+from account_state import S3AccountStateStore
+from local_s3 import InvalidObjectState, LocalS3Client
+
+ACCOUNTS = [{'account_id': f"acc-{i}", 'bank_id': 'bank-a'} for i in range(3)]
+
+
+def test_archived_state_is_backfilled_instead_of_failing_the_run(tmp_path):
+    s3 = LocalS3Client(str(tmp_path), verbose=False)
+    store = S3AccountStateStore(s3, 'bucket')
+    store.save([{**account, 'last_seq': 9} for account in ACCOUNTS[:2]])
+
+    get_object = s3.get_object
+
+    def get_archived(Bucket, Key, **kwargs):
+        if ACCOUNTS[1]['account_id'] in Key:
+            raise InvalidObjectState('The operation is not valid for the object\'s storage class')
+        return get_object(Bucket=Bucket, Key=Key, **kwargs)
+
+    s3.get_object = get_archived
+    states = store.load(ACCOUNTS)
+
+    assert states[0]['last_seq'] == 9
+    assert states[1] is None  # archived
+    assert states[2] is None  # never generated
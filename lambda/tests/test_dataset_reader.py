@@ -0,0 +1,39 @@
+from datetime import datetime
+
+from dataset_reader import LocalFileStore, RunReader
+from local_s3 import LocalS3Client
+from s3_writer import S3StreamingCsvWriter, S3StreamingParquetWriter
+from synthetic_generator import generate_transaction_batch
+from transaction_schema import TRANSACTION_COLUMN_TYPES, TRANSACTION_COLUMNS
+
+NOW = datetime(2026, 10, 17, 1, 0, 0)
+
+
+def write_run(s3, key, batch, output_format):
+    if output_format == 'parquet':
+        writer = S3StreamingParquetWriter(s3, 'bucket', key, TRANSACTION_COLUMN_TYPES)
+    else:
+        writer = S3StreamingCsvWriter(s3, 'bucket', key, TRANSACTION_COLUMNS)
+    with writer:
+        writer.write_batch(batch)
+
+
+def test_summarize_mixed_csv_and_parquet_runs(tmp_path):
+    s3 = LocalS3Client(str(tmp_path), verbose=False)
+    csv_batch = generate_transaction_batch(['acc-1', 'acc-2'], ['bank-a', 'bank-a'], 50, 1, now=NOW)
+    parquet_batch = generate_transaction_batch(['acc-3'], ['bank-b'], 50, 2, now=NOW)
+    write_run(s3, 'raw/transactions/dt=2026-10-17/transactions_20261017_010000.csv', csv_batch, 'csv')
+    write_run(s3, 'raw/transactions/dt=2026-10-17/transactions_20261017_020000.parquet', parquet_batch, 'parquet')
+
+    reader = RunReader(LocalFileStore(str(tmp_path)))
+    summary = reader.summarize().to_dict()
+
+    dates = sorted(csv_batch.column('transaction_date').tolist() + parquet_batch.column('transaction_date').tolist())
+    assert summary['transactions'] == 150
+    assert summary['accounts_with_transactions'] == 3
+    assert summary['date_range'] == [dates[0], dates[-1]]
+
+    # Date filters compare the same way for both formats
+    middle = dates[75]
+    filtered = sum(len(chunk) for chunk in reader.read('transactions', ['transaction_date'], start=middle))
+    assert filtered == sum(date >= middle for date in dates)
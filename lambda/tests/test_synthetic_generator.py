@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from synthetic_generator import generate_transaction_batch
+
+ACCOUNTS = [f"acc-{i:03d}" for i in range(20)]
+BANKS = ['bank-a'] * len(ACCOUNTS)
+SEED = 42
+
+
+def incremental_window(states, now):
+    return generate_transaction_batch(ACCOUNTS, BANKS, 100, SEED, now=now, states=states)
+
+
+def test_consecutive_incremental_windows_draw_new_transactions():
+    start = datetime(2026, 1, 1)
+    backfill = generate_transaction_batch(ACCOUNTS, BANKS, 100, SEED, now=start)
+    first = incremental_window(backfill.states, start + timedelta(days=9))
+    second = incremental_window(first.states, start + timedelta(days=18))
+
+    assert len(first) and len(second)
+    counts = [np.unique(batch.column('account_id'), return_counts=True)[1].tolist() for batch in (first, second)]
+    assert counts[0] != counts[1]
+    size = min(len(first), len(second))
+    assert not np.array_equal(first.column('amount')[:size], second.column('amount')[:size])
+    # Sequence numbers still continue across windows
+    assert first.states[0]['last_seq'] < second.states[0]['last_seq']
+
+
+def test_incremental_window_is_reproducible_from_its_state():
+    start = datetime(2026, 1, 1)
+    backfill = generate_transaction_batch(ACCOUNTS, BANKS, 100, SEED, now=start)
+    now = start + timedelta(days=9)
+    once = incremental_window(backfill.states, now)
+    again = incremental_window(backfill.states, now)
+
+    assert np.array_equal(once.column('amount'), again.column('amount'))
+    assert once.column('transaction_id').tolist() == again.column('transaction_id').tolist()
@@ -0,0 +1,241 @@
+"""
+Typed transaction schema and compact columnar batches
+Low-cardinality columns are dictionary-coded (small integer codes into an
+array of categories) and run-level constants are stored once, so they cost
+a byte or two per row instead of a string per row
+
+Shared by synthetic_generator.py, real_transactions.py, s3_writer.py,
+pipeline.py and test_fetch_data.py
+"""
+
+from itertools import repeat
+
+import numpy as np
+
+# How a column is held in a TransactionBatch
+PLAIN = 'plain'            # one NumPy array
+DICTIONARY = 'dictionary'  # DictionaryColumn: codes into categories
+CONSTANT = 'constant'      # ConstantColumn: one value for every row
+
+
+class ColumnSpec:
+    """Name, logical type (as used by typed writers such as Parquet) and in-memory encoding of a column"""
+
+    __slots__ = ('name', 'type', 'encoding')
+
+    def __init__(self, name, type, encoding=PLAIN):
+        self.name = name
+        self.type = type
+        self.encoding = encoding
+
+
+TRANSACTION_SCHEMA = [
+    ColumnSpec('transaction_id', 'string'),
+    ColumnSpec('bank_id', 'string', DICTIONARY),
+    ColumnSpec('account_id', 'string', DICTIONARY),
+    ColumnSpec('amount', 'float64'),
+    ColumnSpec('currency', 'string', DICTIONARY),
+    ColumnSpec('transaction_type', 'string', DICTIONARY),
+    ColumnSpec('description', 'string', DICTIONARY),
+    ColumnSpec('merchant', 'string', DICTIONARY),
+    ColumnSpec('transaction_date', 'timestamp'),
+    ColumnSpec('transaction_hour', 'int64'),
+    ColumnSpec('day_of_week', 'string', DICTIONARY),
+    ColumnSpec('is_weekend', 'bool'),
+    ColumnSpec('balance_after', 'float64'),
+    ColumnSpec('counterparty_name', 'string', DICTIONARY),
+    ColumnSpec('data_source', 'string', CONSTANT),
+    ColumnSpec('generated_at', 'timestamp', CONSTANT)
+]
+
+# Column name and logical type, used by typed writers such as Parquet
+TRANSACTION_COLUMN_TYPES = [(column.name, column.type) for column in TRANSACTION_SCHEMA]
+
+TRANSACTION_COLUMNS = [column.name for column in TRANSACTION_SCHEMA]
+
+
+def code_dtype(n_categories):
+    """Smallest signed integer type for codes into `n_categories` (signed, so -1 can mean missing)"""
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_categories <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+class DictionaryColumn:
+    """Integer codes into an array of unique categories; code -1 is a missing value (None)
+
+    Behaves as an array of the decoded values for np.asarray() and len(), and
+    selecting rows only slices the codes.
+    """
+
+    __slots__ = ('codes', 'categories', '_lookup')
+
+    def __init__(self, codes, categories):
+        self.codes = codes
+        self.categories = categories
+        self._lookup = None
+
+    @classmethod
+    def encode(cls, values):
+        """Dictionary-code any sequence of hashable values (None becomes -1), in order of first appearance"""
+        index = {}
+        codes = [-1 if value is None else index.setdefault(value, len(index)) for value in values]
+        return cls(np.array(codes, dtype=code_dtype(len(index))), np.array(list(index), dtype=object))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        return DictionaryColumn(self.codes[index], self.categories)
+
+    def __array__(self, dtype=None, copy=None):
+        values = self.decode()
+        return values if dtype is None else values.astype(dtype)
+
+    def decode(self):
+        """The values as an object array (categories are shared, not copied per row)"""
+        if self._lookup is None:
+            # Trailing None, so code -1 picks it
+            self._lookup = np.append(self.categories.astype(object), None)
+        return self._lookup[self.codes]
+
+    def tolist(self):
+        return self.decode().tolist()
+
+    @classmethod
+    def concat(cls, columns):
+        """Join columns; codes are remapped onto the union of their categories when those differ"""
+        first = columns[0]
+        if all(column.categories is first.categories or np.array_equal(column.categories, first.categories)
+               for column in columns):
+            return cls(np.concatenate([column.codes for column in columns]), first.categories)
+
+        categories = np.unique(np.concatenate([column.categories.astype(object) for column in columns]))
+        dtype = code_dtype(len(categories))
+        codes = []
+        for column in columns:
+            mapping = np.append(np.searchsorted(categories, column.categories.astype(object)), -1).astype(dtype)
+            codes.append(mapping[column.codes])
+        return cls(np.concatenate(codes), categories)
+
+
+class ConstantColumn:
+    """One value repeated `length` times, stored once"""
+
+    __slots__ = ('value', 'length')
+
+    def __init__(self, value, length):
+        self.value = value
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return ConstantColumn(self.value, len(range(self.length)[index]))
+        index = np.asarray(index)
+        return ConstantColumn(self.value, int(np.count_nonzero(index)) if index.dtype == bool else len(index))
+
+    def __array__(self, dtype=None, copy=None):
+        return np.full(self.length, self.value, dtype=dtype or object)
+
+    def decode(self):
+        return np.full(self.length, self.value, dtype=object)
+
+    def tolist(self):
+        return [self.value] * self.length
+
+    @classmethod
+    def concat(cls, columns):
+        if all(column.value == columns[0].value for column in columns):
+            return cls(columns[0].value, sum(column.length for column in columns))
+        return np.concatenate([column.decode() for column in columns])
+
+
+class TransactionBatch:
+    """Columnar batch of transactions, one column per TRANSACTION_SCHEMA entry
+
+    Columns are NumPy arrays, DictionaryColumns or ConstantColumns (see each
+    ColumnSpec's encoding); column(name) always gives a NumPy array. `states`
+    optionally holds each account's generation state after this batch (see
+    synthetic_generator.generate_transaction_batch), for incremental runs.
+    """
+
+    def __init__(self, columns, states=None):
+        self.columns = columns
+        self.states = states
+
+    def __len__(self):
+        return len(self.columns['transaction_id'])
+
+    def column(self, name):
+        """Values of one column as a NumPy array (decoded if dictionary-coded or constant)"""
+        return np.asarray(self.columns[name])
+
+    def rows(self):
+        """Iterate rows as tuples of plain Python values in TRANSACTION_COLUMNS order"""
+        values = []
+        for name in TRANSACTION_COLUMNS:
+            column = self.columns[name]
+            values.append(repeat(column.value, len(column)) if isinstance(column, ConstantColumn) else column.tolist())
+        return zip(*values)
+
+    def select(self, index):
+        """Rows `index` (a slice or index array) as a new batch, without states"""
+        return TransactionBatch({name: column[index] for name, column in self.columns.items()})
+
+    def to_records(self):
+        """Convert to a list of dicts (the legacy row-oriented format)"""
+        return [dict(zip(TRANSACTION_COLUMNS, row)) for row in self.rows()]
+
+    def to_frame(self):
+        """pandas DataFrame of the batch; dictionary-coded and constant columns become Categoricals over their codes"""
+        import pandas as pd
+
+        data = {}
+        for name in TRANSACTION_COLUMNS:
+            column = self.columns[name]
+            if isinstance(column, DictionaryColumn):
+                data[name] = pd.Categorical.from_codes(column.codes, column.categories)
+            elif isinstance(column, ConstantColumn):
+                data[name] = pd.Categorical.from_codes(np.zeros(len(column), dtype=np.int8), [column.value])
+            else:
+                data[name] = column
+        return pd.DataFrame(data, columns=TRANSACTION_COLUMNS, copy=False)
+
+    def to_arrow(self, schema):
+        """pyarrow Table with `schema`; dictionary-coded columns are decoded by Arrow, not per row in Python"""
+        import pyarrow as pa
+
+        arrays = []
+        for field in schema:
+            column = self.columns[field.name]
+            if isinstance(column, DictionaryColumn):
+                indices = pa.array(column.codes, mask=column.codes < 0)
+                array = pa.DictionaryArray.from_arrays(indices, pa.array(column.categories, type=pa.string()))
+            elif isinstance(column, ConstantColumn):
+                array = pa.repeat(pa.scalar(column.value), len(column))
+            else:
+                array = pa.array(column, from_pandas=True)
+            arrays.append(array.cast(field.type))
+        return pa.Table.from_arrays(arrays, schema=schema)
+
+    @classmethod
+    def concat(cls, batches):
+        """Concatenate batches column by column"""
+        batches = list(batches)
+        if not batches:
+            return cls({name: np.array([], dtype=object) for name in TRANSACTION_COLUMNS})
+
+        columns = {}
+        for name in TRANSACTION_COLUMNS:
+            parts = [batch.columns[name] for batch in batches]
+            if all(isinstance(part, DictionaryColumn) for part in parts):
+                columns[name] = DictionaryColumn.concat(parts)
+            elif all(isinstance(part, ConstantColumn) for part in parts):
+                columns[name] = ConstantColumn.concat(parts)
+            else:
+                columns[name] = np.concatenate([np.asarray(part) for part in parts])
+        return cls(columns)
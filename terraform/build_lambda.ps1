@@ -11,12 +11,25 @@ if (Test-Path $tempDir) {
 New-Item -ItemType Directory -Path $tempDir | Out-Null
 
 # Install only required dependencies (no pandas to avoid platform issues)
+# Faker is left out: the handler samples names from the precomputed faker_pool.json
 Write-Host "Installing Python dependencies..." -ForegroundColor Yellow
-pip install requests==2.31.0 Faker==22.0.0 -t $tempDir --quiet
+pip install requests==2.31.0 -t $tempDir --quiet
+# NumPy and PyArrow ship compiled code, so fetch the Linux wheels that match the Lambda runtime
+pip install numpy==1.26.4 pyarrow==15.0.2 zstandard==0.22.0 -t $tempDir --quiet --platform manylinux2014_x86_64 --python-version 3.10 --only-binary=:all:
 
-# Copy Lambda function files (using simplified version without pandas)
+# Copy Lambda function files (handler does not import pandas)
 Write-Host "Copying Lambda function files..." -ForegroundColor Yellow
-Copy-Item ../lambda/lambda_handler_simple.py $tempDir/lambda_handler.py
+Copy-Item ../lambda/lambda_handler.py $tempDir/lambda_handler.py
+Copy-Item ../lambda/pipeline.py $tempDir/pipeline.py
+Copy-Item ../lambda/async_pipeline.py $tempDir/async_pipeline.py
+Copy-Item ../lambda/synthetic_generator.py $tempDir/synthetic_generator.py
+Copy-Item ../lambda/real_transactions.py $tempDir/real_transactions.py
+Copy-Item ../lambda/transaction_schema.py $tempDir/transaction_schema.py
+Copy-Item ../lambda/faker_pool.json $tempDir/faker_pool.json
+Copy-Item ../lambda/s3_writer.py $tempDir/s3_writer.py
+Copy-Item ../lambda/obp_client.py $tempDir/obp_client.py
+Copy-Item ../lambda/account_state.py $tempDir/account_state.py
+Copy-Item ../lambda/metrics.py $tempDir/metrics.py
 
 # Create zip file
 Write-Host "Creating deployment package..." -ForegroundColor Yellow
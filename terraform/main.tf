@@ -50,6 +50,14 @@ module "lambda_function" {
     OBP_CONSUMER_KEY          = var.obp_consumer_key
     OBP_DIRECTLOGIN_ENDPOINT  = var.obp_directlogin_endpoint
     S3_BUCKET_NAME            = module.s3_bucket.bucket_name
+    OUTPUT_FORMAT             = var.output_format
+    OBP_TOKEN_CACHE           = var.obp_token_cache
+    INCREMENTAL               = var.incremental ? "true" : "false"
+    CSV_COMPRESSION           = var.csv_compression
+    TRANSACTION_SOURCE        = var.transaction_source
+    # Keep glibc from moving 128 KiB+ arrays (and 8 MiB upload parts) onto its heap after the first
+    # large free; the fragmentation otherwise grows peak memory with run length
+    MALLOC_MMAP_THRESHOLD_    = "131072"
   }
   
   s3_bucket_arn = module.s3_bucket.bucket_arn
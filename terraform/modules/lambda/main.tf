@@ -29,10 +29,13 @@ resource "aws_iam_role_policy" "lambda_s3_policy" {
     Statement = [
       {
         Effect = "Allow"
+        # Transactions are streamed as multipart uploads, which are aborted when a run fails
         Action = [
           "s3:PutObject",
           "s3:GetObject",
-          "s3:ListBucket"
+          "s3:ListBucket",
+          "s3:AbortMultipartUpload",
+          "s3:ListMultipartUploadParts"
         ]
         Resource = [
           var.s3_bucket_arn,
@@ -43,6 +46,27 @@ resource "aws_iam_role_policy" "lambda_s3_policy" {
   })
 }
 
+# Coordinator mode fans shards out by invoking this same function asynchronously
+resource "aws_iam_role_policy" "lambda_invoke_self_policy" {
+  name = "${var.function_name}-invoke-self-policy"
+  role = aws_iam_role.lambda_role.id
+  
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "lambda:InvokeFunction"
+        ]
+        Resource = [
+          "arn:aws:lambda:*:*:function:${var.function_name}"
+        ]
+      }
+    ]
+  })
+}
+
 resource "aws_iam_role_policy_attachment" "lambda_basic_execution" {
   role       = aws_iam_role.lambda_role.name
   policy_arn = "arn:aws:iam::aws:policy/service-role/AWSLambdaBasicExecutionRole"
@@ -30,11 +30,14 @@ resource "aws_s3_bucket_server_side_encryption_configuration" "raw_data" {
 resource "aws_s3_bucket_lifecycle_configuration" "raw_data" {
   bucket = aws_s3_bucket.raw_data.id
   
+  # Only the raw datasets; state/ (read by every incremental run) and the token cache stay in STANDARD
   rule {
     id     = "transition-to-glacier"
     status = "Enabled"
     
-    filter {}
+    filter {
+      prefix = "raw/"
+    }
     
     transition {
       days          = 90
@@ -45,6 +48,18 @@ resource "aws_s3_bucket_lifecycle_configuration" "raw_data" {
       days = 365
     }
   }
+  
+  # Uploads cut short by the Lambda timeout never reach their abort; drop their billed parts
+  rule {
+    id     = "abort-incomplete-multipart-uploads"
+    status = "Enabled"
+    
+    filter {}
+    
+    abort_incomplete_multipart_upload {
+      days_after_initiation = 1
+    }
+  }
 }
 
 resource "aws_s3_bucket_public_access_block" "raw_data" {
@@ -63,3 +63,32 @@ variable "schedule_expression" {
   default     = "rate(1 day)"
 }
 
+variable "output_format" {
+  description = "File format for raw/ datasets (csv or parquet)"
+  type        = string
+  default     = "csv"
+}
+
+variable "incremental" {
+  description = "Generate only the days since each account's last run (state kept under state/accounts/ in the bucket)"
+  type        = bool
+  default     = false
+}
+
+variable "csv_compression" {
+  description = "Compression for CSV output: empty (none), gzip (.csv.gz) or zstd (.csv.zst)"
+  type        = string
+  default     = ""
+}
+
+variable "transaction_source" {
+  description = "Transactions to write: synthetic (generated per account) or real (fetched from each account's OBP transactions)"
+  type        = string
+  default     = "synthetic"
+}
+
+variable "obp_token_cache" {
+  description = "Where the Lambda persists its DirectLogin token between cold starts (empty = memory only, or s3:<key>)"
+  type        = string
+  default     = ""
+}